@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_bundles.py
+#
+"""Benchmark OSC message throughput with and without OSC bundles to a local UDP sink.
+
+Each flush tick sends a batch of messages, e.g. the parameter changes of a scene recall, either
+as one packet per message or packed into as few bundles as fit the MTU.
+
+"""
+
+import argparse
+import socket
+import struct
+import sys
+import threading
+import time
+
+from xair.osc import BUNDLE_HEADER, BundleSender
+
+
+def count_messages(data):
+    if not data.startswith(BUNDLE_HEADER):
+        return 1
+
+    count = 0
+    pos = len(BUNDLE_HEADER) + 8
+
+    while pos < len(data):
+        size = struct.unpack_from('>i', data, pos)[0]
+        count += count_messages(data[pos + 4:pos + 4 + size])
+        pos += 4 + size
+
+    return count
+
+
+class UDPSink(threading.Thread):
+    """Count received packets and the OSC messages contained in them."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.packets = self.messages = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+
+            self.packets += 1
+            self.messages += count_messages(data)
+
+    def wait(self, num_messages, timeout=2.0):
+        deadline = time.perf_counter() + timeout
+        while self.messages < num_messages and time.perf_counter() < deadline:
+            time.sleep(0.005)
+
+    def reset(self):
+        self.packets = self.messages = 0
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sock.close()
+
+
+def run(name, sink, use_bundles, ticks, batch_size):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(('127.0.0.1', sink.port))
+    sender = BundleSender(sock.send, use_bundles=use_bundles)
+    sink.reset()
+    start = time.perf_counter()
+
+    for tick in range(ticks):
+        for i in range(batch_size):
+            sender.send('/ch/%02i/mix/fader' % (i % 16 + 1), ('f', tick / ticks))
+        sender.flush()
+
+    elapsed = time.perf_counter() - start
+    sink.wait(ticks * batch_size)
+    sock.close()
+    print("%-10s %8i msgs  %10.0f msgs/s  %8i packets sent  %8i msgs received  %7.3f s" %
+          (name, sender.messages_sent, sender.messages_sent / elapsed, sender.packets_sent,
+           sink.messages, elapsed))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-t', '--ticks', type=int, default=2000,
+                    help="Number of flush ticks (default: %(default)s)")
+    ap.add_argument('-b', '--batch-size', type=int, default=40,
+                    help="Number of messages per tick (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    sink = UDPSink()
+    sink.start()
+    run('single', sink, False, args.ticks, args.batch_size)
+    run('bundled', sink, True, args.ticks, args.batch_size)
+    sink.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
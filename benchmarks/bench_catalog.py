@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_catalog.py
+#
+"""Benchmark loading the command catalog from CSV versus from the binary cache."""
+
+import argparse
+import subprocess
+import sys
+import time
+import timeit
+
+from xair.catalog import CommandTrie, load_catalog
+
+
+STARTUP_SNIPPET = "from xair.catalog import load_catalog; load_catalog(use_cache=%s)"
+
+
+def startup_time(use_cache, repeat):
+    cmd = [sys.executable, '-c', STARTUP_SNIPPET % use_cache]
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call(cmd)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=20,
+                    help="Number of in-process loads per measurement (default: %(default)s)")
+    ap.add_argument('-r', '--repeat', type=int, default=5,
+                    help="Number of process startups per measurement (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    # make sure the cache is up to date
+    trie = load_catalog()
+    print("Catalog: %i addresses" % len(trie))
+
+    for name, func in (('csv', CommandTrie.from_catalog), ('cache', load_catalog)):
+        best = min(timeit.repeat(func, number=args.number, repeat=3)) / args.number
+        print("%-6s load:    %8.2f ms" % (name, best * 1000))
+
+    for name, use_cache in (('csv', False), ('cache', True)):
+        print("%-6s startup: %8.2f ms" % (name, startup_time(use_cache, args.repeat) * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_dump.py
+#
+"""Benchmark dumping and restoring the full mixer state against a fake mixer on loopback."""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from xair.catalog import expand_commands, parse_commands
+from xair.client import XAirClient
+from xair.fakemixer import catalog_state, start_fake_mixer
+from xair.snapshot import diff_state, is_state_address, read_snapshot, write_snapshot
+
+
+async def restore(client, filename):
+    saved = read_snapshot(filename)
+    live = await client.query_many([msg.path for msg in saved])
+    changed = diff_state(saved, live)
+
+    for msg in changed:
+        client.bundler.send(msg.path, *zip(msg.types, msg.args))
+
+    return len(changed), client.bundler.flush()
+
+
+async def bench(args):
+    transport, mixer = await start_fake_mixer('127.0.0.1', 0, state=catalog_state())
+    port = transport.get_extra_info('sockname')[1]
+    addresses = [address for address in sorted(expand_commands(parse_commands()))
+                 if is_state_address(address) and address in mixer.state]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'state.snp')
+
+        async with XAirClient('127.0.0.1', port) as client:
+            start = time.perf_counter()
+            replies = await client.query_many(addresses, window=args.window)
+            elapsed = time.perf_counter() - start
+            write_snapshot(filename, [msg for msg in replies.values() if msg is not None])
+            print("dump:      %5i parameters  %8.1f ms  %7i bytes" %
+                  (len(replies), elapsed * 1000, os.path.getsize(filename)))
+
+            start = time.perf_counter()
+            changed, packets = await restore(client, filename)
+            print("unchanged: %5i changed     %8.1f ms  %7i packets" %
+                  (changed, (time.perf_counter() - start) * 1000, packets))
+
+            for address in addresses[::10]:
+                mixer.state[address] = [('s', 'changed')]
+
+            start = time.perf_counter()
+            changed, packets = await restore(client, filename)
+            print("modified:  %5i changed     %8.1f ms  %7i packets" %
+                  (changed, (time.perf_counter() - start) * 1000, packets))
+
+    transport.close()
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-w', '--window', type=int, default=32,
+                    help="Max. number of queries in flight (default: %(default)s)")
+    asyncio.run(bench(ap.parse_args(args)))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_event_alloc.py
+#
+"""Measure memory allocation and GC pressure of creating and dispatching events.
+
+Compares dict-based events (`xair.events.Event`) with slotted events (`xair.events.SlotEvent`),
+with and without an `EventPool`. For each kind, reports the memory held by one live event
+instance and the number of instances allocated per dispatched event. With a pool, instances are
+re-used, so, after the first, dispatching allocates no new events.
+
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from xair import events
+
+
+class BunchFaderEvent(events.Event):
+    type = 'fader_bunch'
+    created = 0
+
+    def __new__(cls, *args, **kwargs):
+        cls.created += 1
+        return super().__new__(cls, *args, **kwargs)
+
+
+class SlotFaderEvent(events.SlotEvent):
+    type = 'fader_slot'
+    __slots__ = ('channel', 'value')
+    created = 0
+
+    def __new__(cls, *args, **kwargs):
+        cls.created += 1
+        return super().__new__(cls)
+
+
+def make_bunch(channel, value):
+    return BunchFaderEvent(channel=channel, value=value)
+
+
+def make_slot(channel, value):
+    return SlotFaderEvent(channel, value)
+
+
+def run(name, cls, make, number, release=None):
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers(**{make(0, 0.0).type: lambda event: None})
+
+    def loop():
+        for i in range(number):
+            event = make(i % 16, i / number)
+            dispatcher.dispatch(event)
+
+            if release is not None:
+                release(event)
+
+    # average memory held by a live event, as seen by tracemalloc
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    keep = [make(i % 16, 0.5) for i in range(1000)]
+    size = (tracemalloc.get_traced_memory()[0] - base - sys.getsizeof(keep)) // len(keep)
+    tracemalloc.stop()
+    del keep
+
+    gc.collect()
+    before = [s['collections'] for s in gc.get_stats()]
+    created = cls.created
+    start = time.perf_counter()
+    loop()
+    elapsed = time.perf_counter() - start
+    created = cls.created - created
+    collections = [s['collections'] - b for s, b in zip(gc.get_stats(), before)]
+    garbage = gc.collect()
+
+    print("%-8s %6i bytes/instance  %8.6f new instances/event  %7.3f us/event  "
+          "gc runs (gen0/1/2): %5i %4i %3i  left for gc: %6i" %
+          (name, size, created / number, elapsed / number * 1e6, *collections, garbage))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=200000,
+                    help="Number of events (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    pool = events.EventPool(SlotFaderEvent)
+    run('bunch', BunchFaderEvent, make_bunch, args.number)
+    run('slots', SlotFaderEvent, make_slot, args.number)
+    run('pooled', SlotFaderEvent, pool.acquire, args.number, release=pool.release)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
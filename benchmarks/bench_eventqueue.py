@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_eventqueue.py
+#
+"""Measure how long an input callback is blocked by dispatching events to a slow handler.
+
+Compares inline dispatch (`EventDispatcher`) with queued dispatch (`QueuedEventDispatcher`)
+drained by worker threads and by an asyncio loop, and checks that events of each type are
+handled in order.
+
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from xair.eventqueue import COALESCE, DROP_OLDEST, QueuedEventDispatcher
+from xair.events import EventDispatcher, SlotEvent
+
+
+class FaderEvent(SlotEvent):
+    type = 'fader'
+    __slots__ = ('channel', 'value')
+
+
+class MeterEvent(SlotEvent):
+    type = 'meter'
+    __slots__ = ('value',)
+
+
+class Handler:
+    def __init__(self, delay):
+        self.delay = delay
+        self.seen = {}
+        self.out_of_order = 0
+
+    def __call__(self, event):
+        key = (event.type, getattr(event, 'channel', None))
+        if event.value < self.seen.get(key, -1):
+            self.out_of_order += 1
+
+        self.seen[key] = event.value
+
+        if self.delay:
+            time.sleep(self.delay)
+
+
+def produce(dispatcher, number, interval):
+    """Dispatch events like an input callback thread and return the max. time blocked."""
+    worst = 0.0
+
+    for i in range(number):
+        start = time.perf_counter()
+        dispatcher.dispatch(FaderEvent(i % 8, i), MeterEvent(i))
+        worst = max(worst, time.perf_counter() - start)
+
+        if interval:
+            time.sleep(interval)
+
+    return worst
+
+
+def report(name, dispatcher, handler, worst, elapsed):
+    stats = dispatcher.stats() if hasattr(dispatcher, 'stats') else {}
+    print("%-20s max. blocked: %8.3f ms  total: %6.3f s  out of order: %i  %s" %
+          (name, worst * 1e3, elapsed, handler.out_of_order,
+           " ".join("%s=%s" % item for item in stats.items() if item[0] != 'lanes')))
+
+
+def run_inline(args):
+    handler = Handler(args.delay)
+    dispatcher = EventDispatcher()
+    dispatcher.push_handlers(fader=handler, meter=handler)
+    start = time.perf_counter()
+    worst = produce(dispatcher, args.number, args.interval)
+    report('inline', dispatcher, handler, worst, time.perf_counter() - start)
+
+
+def run_threads(args, policy):
+    handler = Handler(args.delay)
+    dispatcher = QueuedEventDispatcher(maxsize=args.maxsize, policy=policy,
+                                       key=lambda e: (e.type, getattr(e, 'channel', None)))
+    dispatcher.push_handlers(fader=handler, meter=handler)
+    dispatcher.start(workers=args.workers)
+    start = time.perf_counter()
+    worst = produce(dispatcher, args.number, args.interval)
+    dispatcher.stop()
+    report('threads/' + policy, dispatcher, handler, worst, time.perf_counter() - start)
+
+
+def run_asyncio(args, policy):
+    handler = Handler(args.delay)
+    dispatcher = QueuedEventDispatcher(maxsize=args.maxsize, policy=policy,
+                                       key=lambda e: (e.type, getattr(e, 'channel', None)))
+    dispatcher.push_handlers(fader=handler, meter=handler)
+
+    async def slow(event):
+        await asyncio.sleep(args.delay)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        runner = asyncio.ensure_future(dispatcher.run())
+        start = time.perf_counter()
+        # the producer runs in another thread, like the rtmidi callback
+        worst = await loop.run_in_executor(None, produce, dispatcher, args.number,
+                                           args.interval)
+
+        while dispatcher.stats()['depth']:
+            await asyncio.sleep(0.01)
+
+        runner.cancel()
+        report('asyncio/' + policy, dispatcher, handler, worst, time.perf_counter() - start)
+
+    handler.delay = 0
+    dispatcher.push_handlers(fader=slow, meter=slow)
+    dispatcher.push_handlers(fader=handler, meter=handler)
+    asyncio.run(main())
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=500,
+                    help="Number of input callbacks (default: %(default)s)")
+    ap.add_argument('-d', '--delay', type=float, default=0.002,
+                    help="Time spent in handler per event (default: %(default)s s)")
+    ap.add_argument('-i', '--interval', type=float, default=0.001,
+                    help="Time between input callbacks (default: %(default)s s)")
+    ap.add_argument('-m', '--maxsize', type=int, default=64,
+                    help="Max. size of event queue (default: %(default)s)")
+    ap.add_argument('-w', '--workers', type=int, default=2,
+                    help="Number of worker threads (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    run_inline(args)
+
+    for policy in (DROP_OLDEST, COALESCE):
+        run_threads(args, policy)
+        run_asyncio(args, policy)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
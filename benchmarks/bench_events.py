@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_events.py
+#
+"""Micro-benchmark event dispatch with cached handler chains against the previous version."""
+
+import argparse
+import inspect
+import sys
+import timeit
+
+from xair.events import Event, EventDispatcher, on_event
+
+
+class LegacyEventDispatcher:
+    """The event dispatcher implementation before handler chains were cached."""
+
+    def push_handlers(self, *args, **kwargs):
+        if not hasattr(self, '_handler_stack'):
+            self._handler_stack = []
+
+        self._handler_stack.append({})
+
+        for obj in args:
+            if hasattr(obj, '_handler_for'):
+                members = (('', obj),)
+            else:
+                members = inspect.getmembers(obj, predicate=inspect.ismethod)
+
+            for name, method in members:
+                if name.startswith('__'):
+                    continue
+
+                event = getattr(method, '_handler_for', None)
+                if event:
+                    self._handler_stack[-1][event] = method
+
+        for event, handler in kwargs.items():
+            self._handler_stack[-1][event] = handler
+
+    def dispatch(self, *events):
+        if not hasattr(self, '_handler_stack'):
+            self._handler_stack = []
+
+        for event in events:
+            assert isinstance(event, Event)
+            for handlers in reversed(self._handler_stack):
+                handler = handlers.get(event.type, None)
+                if handler:
+                    try:
+                        if handler(event):
+                            break
+                    except:  # noqa:E722
+                        pass
+
+
+class MeterEvent(Event):
+    type = 'meter'
+
+
+class Handler:
+    def __init__(self):
+        self.count = 0
+
+    @property
+    def expensive(self):
+        return sum(range(1000))
+
+    @on_event('meter')
+    def on_meter(self, event):
+        self.count += 1
+
+    @on_event('param')
+    def on_param(self, event):
+        self.count += 1
+
+
+def setup(cls, layers):
+    dispatcher = cls()
+
+    for i in range(layers):
+        dispatcher.push_handlers(Handler(), **{'other%i' % i: lambda e: None})
+
+    return dispatcher
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=10000,
+                    help="Number of events per measurement (default: %(default)s)")
+    ap.add_argument('-l', '--layers', type=int, default=8,
+                    help="Number of handler stack layers (default: %(default)s)")
+    args = ap.parse_args(args)
+    events = [MeterEvent(value=i) for i in range(args.number)]
+
+    for name, cls in (('legacy', LegacyEventDispatcher), ('cached', EventDispatcher)):
+        t = min(timeit.repeat(lambda: setup(cls, args.layers), number=100, repeat=3)) / 100
+        print("%-8s push_handlers: %8.2f us/layer" % (name, t / args.layers * 1e6))
+
+        dispatcher = setup(cls, args.layers)
+        t = min(timeit.repeat(lambda: [dispatcher.dispatch(e) for e in events],
+                              number=1, repeat=5))
+        print("%-8s dispatch:      %8.3f us/event" % (name, t / args.number * 1e6))
+
+        if hasattr(dispatcher, 'dispatch_many'):
+            t = min(timeit.repeat(lambda: dispatcher.dispatch_many(events), number=1, repeat=5))
+            print("%-8s dispatch_many: %8.3f us/event" % (name, t / args.number * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_events_compat.py
+#
+"""Benchmark the event dispatcher on CPython and with MicroPython-like constraints.
+
+Each mode runs in a separate interpreter. In the 'restricted' mode, the `inspect` and `weakref`
+modules can not be imported and one handler does not support setting attributes on it, like
+functions on MicroPython, so the fallback code paths of `xair.events` are used. The behaviour in
+both modes is checked by ``tests/test_events.py``.
+
+"""
+
+import argparse
+import logging  # noqa:F401 - imported before weakref is blocked, it needs it
+import subprocess
+import sys
+import timeit
+
+
+MODES = ('cpython', 'restricted')
+
+
+def restrict():
+    for name in ('inspect', 'weakref'):
+        sys.modules[name] = None
+
+
+def setup(events):
+    """Return a dispatcher with handlers pushed and a batch of events for the benchmark."""
+
+    class FaderEvent(events.SlotEvent):
+        type = 'fader'
+        __slots__ = ('channel', 'value')
+
+    class Handler:
+        @events.on_event('fader')
+        def on_fader(self, event):
+            pass
+
+    class NoAttrHandler:
+        """A callable, on which no attributes can be set."""
+        __slots__ = ('__weakref__',)
+
+        def __call__(self, event):
+            pass
+
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers(events.on_event('fader')(NoAttrHandler()))
+    dispatcher.push_handlers(Handler())
+    return dispatcher, [FaderEvent(i % 16, 0.5) for i in range(1000)]
+
+
+def run_mode(mode, number):
+    if mode == 'restricted':
+        restrict()
+
+    from xair import events
+
+    dispatcher, batch = setup(events)
+    push = min(timeit.repeat(lambda: dispatcher.push_handlers(dispatcher) or
+                             dispatcher.pop_handlers(), number=1000, repeat=3)) / 1000
+    rounds = max(1, number // len(batch))
+    t = min(timeit.repeat(lambda: dispatcher.dispatch_many(batch), number=rounds, repeat=5))
+    print("%-10s push/pop: %6.2f us  dispatch: %6.3f us/event" %
+          (mode, push * 1e6, t / (rounds * len(batch)) * 1e6))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=100000,
+                    help="Number of events per measurement (default: %(default)s)")
+    ap.add_argument('--mode', choices=MODES,
+                    help="Run only given mode in this process")
+    args = ap.parse_args(args)
+
+    if args.mode:
+        return run_mode(args.mode, args.number)
+
+    failed = 0
+
+    for mode in MODES:
+        failed += subprocess.call([sys.executable, __file__, '--mode', mode,
+                                   '--number', str(args.number)]) != 0
+
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
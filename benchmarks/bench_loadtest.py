@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_loadtest.py
+#
+"""Measure midi2xairosc throughput, latency and loss for all load patterns at several rates.
+
+Runs each MIDI event pattern of `xair.loadtest` at each rate through a configuration with
+sixteen faders and sixteen mute buttons, plus a replay of mixer parameter changes to a
+subscribed client, and prints one line per run. All traffic goes over loopback to a fake mixer.
+
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+
+from os.path import join
+
+from xair.loadtest import PATTERNS, LoadTest, generate_events
+from xair.osc import OSCMessage
+
+
+CONFIG = """\
+- name: Channel {ch} fader
+  status: controllerchange
+  channel: 1
+  data: {ch}
+  osc: /ch/{ch:02}/mix/fader
+  args: ['f:value']
+  transform: {{curve: db}}
+- name: Channel {ch} mute
+  status: noteon
+  channel: 1
+  data: {ch}
+  osc: /ch/{ch:02}/mix/on
+  args: ['i:data2']
+"""
+
+
+def run(test, midi_events=(), messages=()):
+    async def main():
+        async with test:
+            await test.run(midi_events, messages)
+
+    asyncio.run(main())
+    return test.stats()
+
+
+def print_result(label, result):
+    latency = result['latency']
+    print("%-16s %7i %7i %7i %5i %8.0f %8.3f %8.3f %8.3f" %
+          (label, result.get('events', result['sent']), result['sent'], result['received'],
+           result['lost'], result['throughput'], latency.percentile(50), latency.percentile(99),
+           latency.max))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-r', '--rates', type=float, nargs='+', default=[100.0, 500.0, 2000.0],
+                    help="MIDI events per second (default: %(default)s)")
+    ap.add_argument('-d', '--duration', type=float, default=3.0,
+                    help="Duration of each run in seconds (default: %(default)s)")
+    args = ap.parse_args(args)
+    state = None
+
+    print("%-16s %7s %7s %7s %5s %8s %8s %8s %8s" %
+          ("run", "input", "sent", "recv", "lost", "recv/s", "p50 ms", "p99 ms", "max ms"))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = join(tmpdir, 'config.yaml')
+
+        with open(config, 'w') as fp:
+            fp.write("".join(CONFIG.format(ch=ch) for ch in range(1, 17)))
+
+        for pattern in PATTERNS:
+            for rate in args.rates:
+                test = LoadTest(config, state=state)
+                # load the state from the command catalog only once
+                state = test.state
+                events = generate_events(pattern, test.controllers(), rate, args.duration)
+                print_result("%s %g/s" % (pattern, rate), run(test, events)['midi'])
+
+        for rate in args.rates:
+            messages = [(n / rate, OSCMessage('/ch/%02i/mix/fader' % (n % 16 + 1), 'f',
+                                              [n % 1000 / 1000]))
+                        for n in range(int(rate * args.duration))]
+            print_result("replay %g/s" % rate, run(LoadTest(state=state), (), messages)['osc'])
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_meters.py
+#
+"""Benchmark decoding of /meters packets with the generic OSC decoder and the meters decoder.
+
+Meter packets are read from a fixture file with one packet per record, each preceded by its size
+as a big-endian 32-bit integer. Fixtures are captured over UDP from a mixer with ``--capture``
+(by default from a fake mixer started in-process, or from a real mixer given with ``--server``)
+and captured fresh from the fake mixer, if no fixture file is given.
+
+"""
+
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import time
+
+from xair.meters import Meters, decode_meters, numpy, to_db
+from xair.osc import decode_packet, encode_message
+
+
+_size = struct.Struct('>i')
+
+
+def capture(server, port, banks, seconds):
+    """Subscribe to given meter banks and return list of all packets received."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((server, port))
+    sock.settimeout(0.2)
+
+    for bank in banks:
+        sock.send(encode_message('/meters', '/meters/%i' % bank))
+
+    packets = []
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        try:
+            data = sock.recv(65536)
+        except socket.timeout:
+            continue
+
+        if data.startswith(b'/meters/'):
+            packets.append(data)
+
+    sock.close()
+    return packets
+
+
+def capture_fake(banks, seconds):
+    async def run():
+        from xair.fakemixer import start_fake_mixer
+
+        transport, _ = await start_fake_mixer('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+        loop = asyncio.get_running_loop()
+
+        try:
+            return await loop.run_in_executor(None, capture, '127.0.0.1', port, banks, seconds)
+        finally:
+            transport.close()
+
+    return asyncio.run(run())
+
+
+def write_fixture(filename, packets):
+    with open(filename, 'wb') as fp:
+        for data in packets:
+            fp.write(_size.pack(len(data)))
+            fp.write(data)
+
+
+def read_fixture(filename):
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+
+    packets = []
+    pos = 0
+
+    while pos < len(data):
+        size = _size.unpack_from(data, pos)[0]
+        packets.append(data[pos + 4:pos + 4 + size])
+        pos += 4 + size
+
+    return packets
+
+
+def generic(data):
+    """Decode with the generic OSC decoder and unpack the blob with struct."""
+    msg = decode_packet(data)[0]
+    blob = msg.args[0]
+    count = struct.unpack_from('<I', blob)[0]
+    values = struct.unpack_from('<%ih' % count, blob, 4)
+    return int(msg.path[8:]), [value / 256 for value in values]
+
+
+def zerocopy_raw(data):
+    return decode_meters(data)
+
+
+def zerocopy_db(data):
+    bank, values = decode_meters(data)
+    return bank, to_db(values)
+
+
+def dispatched(meters):
+    def decode(data):
+        meters._received(data, ('127.0.0.1', 10024))
+
+    return decode
+
+
+def run(name, decode, packets, repeat):
+    values = sum(len(decode_meters(data)[1]) for data in packets)
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for data in packets:
+            decode(data)
+
+    elapsed = time.perf_counter() - start
+    total = len(packets) * repeat
+    print("%-22s %10.0f packets/s  %12.0f values/s  %7.3f us/packet" %
+          (name, total / elapsed, values * repeat / elapsed, elapsed / total * 1e6))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-f', '--fixture',
+                    help="Read meter packets from given fixture file")
+    ap.add_argument('--capture', metavar="FILE",
+                    help="Capture meter packets to given fixture file and exit")
+    ap.add_argument('-s', '--server',
+                    help="Capture from mixer at given address instead of a fake mixer")
+    ap.add_argument('-p', '--port', type=int, default=10024,
+                    help="UDP port of the mixer (default: %(default)s)")
+    ap.add_argument('-b', '--banks', default='0,1,2,3,4,5',
+                    help="Comma-separated meter banks to capture (default: %(default)s)")
+    ap.add_argument('-t', '--seconds', type=float, default=1.0,
+                    help="Capture duration (default: %(default)s)")
+    ap.add_argument('-r', '--repeat', type=int, default=200,
+                    help="Number of passes over the packets (default: %(default)s)")
+    args = ap.parse_args(args)
+    banks = [int(bank) for bank in args.banks.split(',')]
+
+    if args.fixture:
+        packets = read_fixture(args.fixture)
+    elif args.server:
+        packets = capture(args.server, args.port, banks, args.seconds)
+    else:
+        packets = capture_fake(banks, args.seconds)
+
+    if args.capture:
+        write_fixture(args.capture, packets)
+        print("Captured %i packets to '%s'." % (len(packets), args.capture))
+        return
+
+    if not packets:
+        return "No meter packets captured."
+
+    print("%i packets, %i values per packet on average, NumPy: %s" %
+          (len(packets), sum(len(decode_meters(p)[1]) for p in packets) / len(packets),
+           'yes' if numpy is not None else 'no'))
+
+    meters = Meters(client=None)
+    meters.push_handlers(meters=lambda event: event.db())
+    run('generic + dB', generic, packets, args.repeat)
+    run('zero-copy raw', zerocopy_raw, packets, args.repeat)
+    run('zero-copy + dB', zerocopy_db, packets, args.repeat)
+    run('event + handler dB', dispatched(meters), packets, args.repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_midi2xairosc.py
+#
+"""Benchmark MIDI event to UDP packet latency of the midi2xairosc command types.
+
+Feeds synthetic controller change events into ``MidiInputHandler`` and measures the time until
+the corresponding OSC packet arrives at a local UDP sink, once with an external command per
+event (``command``) and once with the in-process OSC sender and output queue (``osc``).
+
+"""
+
+import argparse
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from os.path import join
+
+from xair.midi2xairosc import MidiInputHandler
+from xair.osc import BundleSender
+from xair.oscqueue import OSCOutputQueue
+
+
+SENDER_SCRIPT = """\
+import socket, struct, sys
+port, data1, data2 = (int(arg) for arg in sys.argv[1:4])
+msg = b'/bench\\0\\0,ii\\0' + struct.pack('>ii', data1, data2)
+socket.socket(socket.AF_INET, socket.SOCK_DGRAM).sendto(msg, ('127.0.0.1', port))
+"""
+CONFIG_COMMAND = """\
+- name: bench
+  status: controllerchange
+  channel: 1
+  command: "{python} {script} {port} %(data1)s %(data2)s"
+"""
+CONFIG_OSC = """\
+- name: bench
+  status: controllerchange
+  channel: 1
+  osc: /bench
+  args: ['i:data1', 'i:data2']
+"""
+
+
+class UDPSink(threading.Thread):
+    """Receive benchmark packets and record their arrival time by sequence number."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.1)
+        self.port = self.sock.getsockname()[1]
+        self.received = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                data = self.sock.recv(1024)
+            except socket.timeout:
+                continue
+
+            data1, data2 = struct.unpack('>ii', data[-8:])
+            self.received[data1 << 7 | data2] = time.perf_counter()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.sock.close()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(name, config, num_events, rate, sink, osc=None):
+    handler = MidiInputHandler('bench', config, osc)
+    sent = {}
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+
+    for seq in range(num_events):
+        if interval:
+            delay = start + seq * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        sent[seq] = time.perf_counter()
+        handler(([0xB0, seq >> 7, seq & 0x7F], interval))
+
+    deadline = time.perf_counter() + 10
+    while len(sink.received) < num_events and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    received = dict(sink.received)
+    sink.received.clear()
+    latencies = [(received[seq] - sent[seq]) * 1000 for seq in received if seq in sent]
+
+    if not latencies:
+        print("%-8s no packets received" % name)
+        return
+
+    elapsed = max(received.values()) - start
+    print("%-8s %6i events  %8.1f events/s  lost: %4i  latency ms: p50 %7.3f  p99 %7.3f  "
+          "max %7.3f" % (name, num_events, len(latencies) / elapsed, num_events - len(latencies),
+                         percentile(latencies, 50), percentile(latencies, 99), max(latencies)))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--num-events', type=int, default=1000,
+                    help="Number of MIDI events per run (max. 16384, default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=200,
+                    help="MIDI events per second, 0 = as fast as possible "
+                         "(default: %(default)s)")
+    ap.add_argument('--skip-command', action='store_true',
+                    help="Do not benchmark the external command path")
+    args = ap.parse_args(args)
+    num_events = min(args.num_events, 1 << 14)
+
+    sink = UDPSink()
+    sink.start()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        script = join(tmpdir, 'send.py')
+        with open(script, 'w') as fp:
+            fp.write(SENDER_SCRIPT)
+
+        if not args.skip_command:
+            config = join(tmpdir, 'command.yaml')
+            with open(config, 'w') as fp:
+                fp.write(CONFIG_COMMAND.format(python=sys.executable, script=script,
+                                               port=sink.port))
+            run('command', config, num_events, args.rate, sink)
+
+        config = join(tmpdir, 'osc.yaml')
+        with open(config, 'w') as fp:
+            fp.write(CONFIG_OSC)
+        # Messages with int arguments are never coalesced, so no events are lost in the queue
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(('127.0.0.1', sink.port))
+        osc = OSCOutputQueue(BundleSender(sock.send, use_bundles=False), rate=1e6,
+                             address_rate=0)
+        osc.start()
+        run('osc', config, num_events, args.rate, sink, osc)
+        osc.stop()
+        sock.close()
+
+    sink.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
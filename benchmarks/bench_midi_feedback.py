@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_midi_feedback.py
+#
+"""Measure MIDI output bandwidth and echo suppression of the midi2xairosc feedback path.
+
+Feeds fader updates for a number of channels at the rate of a mixer app's update stream to
+``MidiFeedback`` and records the MIDI messages passed to a fake MIDI output in real time. The
+first fader is moved from the MIDI controller at the same time and the mixer echoes each value
+back shortly after, like when it reports a change made by this program.
+
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import tempfile
+import time
+
+from os.path import join
+
+from xair.midi2xairosc import MidiFeedback, MidiInputHandler, MidiSender
+from xair.osc import OSCMessage
+from xair.oscqueue import OSCOutputQueue
+
+
+# 31250 baud with one start and one stop bit per byte
+DIN_BYTES_PER_SECOND = 3125
+CONFIG = """\
+- name: Channel {ch} fader
+  status: controllerchange
+  channel: 1
+  data: {cc}
+  osc: /ch/{ch:02}/mix/fader
+  args: ['f:data2']
+"""
+
+
+class NullSender:
+    def send(self, path, *args):
+        pass
+
+
+class FakeMidiOut:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message):
+        self.messages.append((time.monotonic(), message))
+
+
+async def simulate(handler, feedback, output, duration, rate, faders):
+    """Send fader updates from the mixer and move the first fader from the controller."""
+    loop = asyncio.get_running_loop()
+    runner = asyncio.ensure_future(output.run())
+    interval = 1.0 / rate
+    start = loop.time()
+    tick = 0
+
+    while loop.time() - start < duration:
+        phase = tick * interval
+
+        for ch in range(2, faders + 1):
+            value = 0.5 + 0.5 * math.sin(phase * 3 + ch)
+            feedback.osc_received(OSCMessage('/ch/%02i/mix/fader' % ch, 'f', [value]))
+
+        # user moves fader 1 on the controller, the mixer echoes the value 10 ms later
+        data2 = int(63.5 + 63.5 * math.sin(phase * 2))
+        handler(([0xB0, 1, data2], 0.0))
+        loop.call_later(0.01, feedback.osc_received,
+                        OSCMessage('/ch/01/mix/fader', 'f', [round(data2 / 127 * 1023) / 1023]))
+        tick += 1
+        await asyncio.sleep(max(0.0, start + tick * interval - loop.time()))
+
+    # a change from another app after the controller was released
+    await asyncio.sleep(feedback.hold)
+    feedback.osc_received(OSCMessage('/ch/01/mix/fader', 'f', [1.0]))
+    await asyncio.sleep(0.1)
+    runner.cancel()
+    return tick
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-d', '--duration', type=float, default=5.0,
+                    help="Duration of the simulation in seconds (default: %(default)s)")
+    ap.add_argument('-f', '--faders', type=int, default=32,
+                    help="Number of faders updated by the mixer (default: %(default)s)")
+    ap.add_argument('-u', '--update-rate', type=float, default=20.0,
+                    help="Updates per second of each fader (default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=500.0,
+                    help="Max. MIDI feedback messages per second (default: %(default)s)")
+    ap.add_argument('-c', '--controller-rate', type=float, default=25.0,
+                    help="Max. MIDI feedback messages per second and controller "
+                         "(default: %(default)s)")
+    args = ap.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = join(tmpdir, 'config.yaml')
+
+        with open(config, 'w') as fp:
+            fp.write("".join(CONFIG.format(ch=ch, cc=ch) for ch in range(1, args.faders + 1)))
+
+        midiout = FakeMidiOut()
+        output = OSCOutputQueue(MidiSender(midiout), rate=args.rate,
+                                address_rate=args.controller_rate)
+        handler = MidiInputHandler('bench', config, NullSender())
+        feedback = handler.feedback = MidiFeedback(handler.commands, output)
+        ticks = asyncio.run(simulate(handler, feedback, output, args.duration,
+                                     args.update_rate, args.faders))
+
+    stats = feedback.stats()
+    start = midiout.messages[0][0] if midiout.messages else 0
+    per_second = {}
+
+    for timestamp, message in midiout.messages:
+        second = int(timestamp - start)
+        per_second[second] = per_second.get(second, 0) + len(message)
+
+    peak = max(per_second.values()) if per_second else 0
+    echoes = [message for _, message in midiout.messages if message[1] == 1]
+    print("%i updates received, %i MIDI messages sent, %i coalesced, %i suppressed" %
+          (stats['received'], stats['sent'], stats['coalesced'], stats['suppressed']))
+    print("MIDI output: peak %i bytes/s (%.0f%% of DIN MIDI), %i updates/s offered" %
+          (peak, peak / DIN_BYTES_PER_SECOND * 100, args.faders * args.update_rate))
+    print("fader 1: %i moves from controller, %i echoes sent back, last value %s" %
+          (ticks, len(echoes) - 1 if echoes else 0, echoes[-1] if echoes else None))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_multiport.py
+#
+"""Measure memory and CPU use of midi2xairosc serving several MIDI ports and mixers.
+
+Sets up the handlers, OSC clients and output queues like ``run_bridge`` for N MIDI input ports and
+M mixers in one event loop, with fake mixers running on a separate thread. Each port has eight
+fader commands of its own for each mixer and receives controller changes at the given rate.
+Reports the memory allocated for the set-up and the CPU time used by the bridge thread, for
+comparison with the memory of one process per port and mixer pair.
+
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from os.path import join
+
+from xair.client import XAirClient
+from xair.fakemixer import FakeMixer
+from xair.midi2xairosc import MidiInputHandler, read_config
+from xair.oscqueue import OSCOutputQueue
+
+
+FADERS = 8
+CONFIG = """\
+- name: {port} fader {n} on mixer {mixer}
+  port: {port}
+  {mixer_key}
+  status: controllerchange
+  channel: 1
+  data: {cc}
+  osc: /ch/{ch:02}/mix/fader
+  args: ['f:data2']
+"""
+
+
+def write_config(filename, ports, mixers):
+    with open(filename, 'w') as fp:
+        for p, port in enumerate(ports):
+            for m, mixer in enumerate(mixers):
+                for n in range(FADERS):
+                    fp.write(CONFIG.format(port=port, mixer=mixer or 'default', n=n,
+                                           mixer_key='mixer: %s' % mixer if mixer else '',
+                                           cc=m * FADERS + n, ch=p * FADERS + n + 1))
+
+
+def start_mixers(count):
+    """Start fake mixers on a thread of their own and return the loop, ports and mixers."""
+    loop = asyncio.new_event_loop()
+    endpoints = [loop.run_until_complete(loop.create_datagram_endpoint(
+        FakeMixer, local_addr=('127.0.0.1', 0))) for _ in range(count)]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return (loop, [transport.get_extra_info('sockname')[1] for transport, _ in endpoints],
+            [mixer for _, mixer in endpoints])
+
+
+def process_rss():
+    """Return max. RSS in KiB of a new process, which imported midi2xairosc and connected."""
+    code = ("import asyncio, resource, xair.midi2xairosc\n"
+            "from xair.client import XAirClient\n"
+            "asyncio.run(XAirClient('127.0.0.1', 10024).connect())\n"
+            "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n")
+    return int(subprocess.check_output([sys.executable, '-c', code], text=True))
+
+
+async def bridge(config, ports, mixer_ports, rate, duration):
+    loop = asyncio.get_running_loop()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    names = [None] + ['mixer%i' % m for m in range(1, len(mixer_ports))]
+    clients = {}
+    queues = {}
+
+    for name, port in zip(names, mixer_ports):
+        clients[name] = await XAirClient('127.0.0.1', port).connect()
+        queues[name] = OSCOutputQueue(clients[name].bundler, rate=1e6, address_rate=1e6)
+
+    config = read_config(config, set(names))
+    handlers = [MidiInputHandler(port, config.for_port(port), queues[None],
+                                 call_later=loop.call_later, mixers=queues) for port in ports]
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    runners = [asyncio.ensure_future(queue.run()) for queue in queues.values()]
+    interval = 0.01
+    per_tick = max(1, int(rate * interval))
+    cc_count = len(mixer_ports) * FADERS
+    events = 0
+    start = loop.time()
+    cpu = time.thread_time()
+    tick = 0
+
+    while loop.time() - start < duration:
+        for handler in handlers:
+            for n in range(per_tick):
+                handler(([0xB0, (tick * per_tick + n) % cc_count, (tick + n) % 128], 0.0))
+                events += 1
+
+        tick += 1
+        await asyncio.sleep(max(0.0, start + tick * interval - loop.time()))
+
+    cpu = time.thread_time() - cpu
+    await asyncio.sleep(0.1)
+
+    for runner in runners:
+        runner.cancel()
+
+    for queue in queues.values():
+        queue.drain()
+
+    for client in clients.values():
+        client.close()
+
+    return memory, events, cpu, handlers, queues
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-p', '--ports', type=int, nargs='+', default=[1, 2, 4, 8],
+                    help="Numbers of MIDI ports to measure (default: %(default)s)")
+    ap.add_argument('-m', '--mixers', type=int, default=2,
+                    help="Number of mixers (default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=500.0,
+                    help="MIDI events per second and port (default: %(default)s)")
+    ap.add_argument('-d', '--duration', type=float, default=2.0,
+                    help="Duration of each measurement in seconds (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    rss = process_rss()
+    print("one process: max. RSS %.1f MiB" % (rss / 1024))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for count in args.ports:
+            mixer_loop, mixer_ports, mixers = start_mixers(args.mixers)
+            received = sum(mixer.received for mixer in mixers)
+            ports = ['in%02i' % n for n in range(count)]
+            config = join(tmpdir, 'config.yaml')
+            write_config(config, ports, [None] + ['mixer%i' % m for m in range(1, args.mixers)])
+            memory, events, cpu, handlers, queues = asyncio.run(
+                bridge(config, ports, mixer_ports, args.rate, args.duration))
+            time.sleep(0.1)
+            received = sum(mixer.received for mixer in mixers) - received
+            mixer_loop.call_soon_threadsafe(mixer_loop.stop)
+            messages = sum(handler.messages for handler in handlers)
+            sent = sum(queue.stats()['sent'] for queue in queues.values())
+            print("%2i ports x %i mixers: %6.1f KiB set-up, CPU %4.1f%% (%5.2f us/event), "
+                  "%i events, %i messages, %i sent, %i received by mixers "
+                  "(%i processes: %.1f MiB)" %
+                  (count, args.mixers, memory / 1024, cpu / args.duration * 100,
+                   cpu / events * 1e6, events, messages, sent, received, count * args.mixers,
+                   count * args.mixers * rss / 1024))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
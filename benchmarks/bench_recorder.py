@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_recorder.py
+#
+"""Measure file size, write and read speed of a recording of a simulated show.
+
+Feeds received packets for the given show duration to a `Recorder`: all meter banks at the rate
+of the mixer and a steady stream of parameter changes. Then opens the recording, scans all records
+and reads one minute from the middle. For comparison, the size of the same traffic written as text
+by the client's debug logging is estimated from a sample.
+
+"""
+
+import argparse
+import io
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from xair.fakemixer import METER_SIZES
+from xair.meters import encode_meters
+from xair.osc import decode_packet, encode_message
+from xair.recorder import Recorder, RecordingReader
+
+
+METER_RATE = 20
+
+
+class Clock:
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def make_packets(duration, changes):
+    """Yield (timestamp, packet) tuples of simulated traffic in order of time."""
+    frames = {bank: [encode_meters(bank, [int((-60 + 40 * math.sin(i * 0.3 + n * 0.1)) * 256)
+                                          for n in range(size)])
+                     for i in range(32)]
+              for bank, size in METER_SIZES.items()}
+    rnd = random.Random(42)
+    params = ['/ch/%02i/mix/fader' % ch for ch in range(1, 17)] + ['/lr/mix/fader']
+    step = 1.0 / METER_RATE
+
+    for tick in range(int(duration * METER_RATE)):
+        timestamp = tick * step
+
+        for bank, packets in frames.items():
+            yield timestamp, packets[tick % len(packets)]
+
+        for n in range(int(2 * rnd.random() * changes / METER_RATE + 0.5)):
+            yield (timestamp + rnd.random() * step,
+                   encode_message(rnd.choice(params), ('f', rnd.random())))
+
+        if tick % (METER_RATE * 60) == 0:
+            yield timestamp, encode_message('/ch/01/config/name', 'Vocals %i' % tick)
+
+
+def log_size(packets):
+    """Return size of the debug log lines written by XAirClient for given packets."""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+    logger = logging.getLogger('bench_recorder')
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    start = time.perf_counter()
+
+    for data in packets:
+        for msg in decode_packet(data):
+            logger.debug("OSC RECV (%s, %s): %s %s %r", '192.168.1.1', 10024, msg.path, msg.types,
+                         msg.args)
+
+    elapsed = time.perf_counter() - start
+    logger.removeHandler(handler)
+    return len(stream.getvalue().encode('utf-8')), elapsed
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-d', '--duration', type=float, default=3600,
+                    help="Simulated show duration in seconds (default: %(default)s)")
+    ap.add_argument('-c', '--changes', type=int, default=20,
+                    help="Average parameter changes per second (default: %(default)s)")
+    ap.add_argument('-o', '--output',
+                    help="Keep recording in given file (default: temporary file)")
+    args = ap.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = args.output or os.path.join(tmpdir, 'show.xrec')
+        start_time = time.time()
+        clock = Clock(start_time)
+        count = 0
+        sample = []
+        elapsed = 0
+
+        with Recorder(filename, clock=clock) as recorder:
+            for timestamp, data in make_packets(args.duration, args.changes):
+                clock.now = start_time + timestamp
+                count += 1
+
+                if len(sample) < 10000:
+                    sample.append(data)
+
+                start = time.perf_counter()
+                recorder.packet_received(data, ('192.168.1.1', 10024))
+                elapsed += time.perf_counter() - start
+
+        stats = recorder.stats()
+        size = os.path.getsize(filename)
+        text_size, text_elapsed = log_size(sample)
+        print("%i packets, %i records, %i blocks, %i keys" %
+              (count, stats['records'], stats['blocks'], stats['keys']))
+        print("recording: %.1f MB, %.2f s, %.2f us/packet" %
+              (size / 1e6, elapsed, elapsed / count * 1e6))
+        print("debug log: ~%.1f MB, ~%.2f s (estimated from %i packets)" %
+              (text_size / len(sample) * count / 1e6, text_elapsed / len(sample) * count,
+               len(sample)))
+
+        start = time.perf_counter()
+        reader = RecordingReader(filename)
+        opened = time.perf_counter() - start
+
+        start = time.perf_counter()
+        records = sum(1 for _ in reader.read())
+        scanned = time.perf_counter() - start
+
+        middle = start_time + args.duration / 2
+        start = time.perf_counter()
+        minute = sum(1 for _ in reader.read(middle, middle + 60))
+        seeked = time.perf_counter() - start
+        reader.close()
+
+        print("open: %.1f ms, full scan: %.2f s (%i records), one minute at %i s: %.1f ms "
+              "(%i records)" % (opened * 1e3, scanned, records, args.duration / 2, seeked * 1e3,
+                                minute))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
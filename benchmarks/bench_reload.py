@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_reload.py
+#
+"""Measure event latency and loss while midi2xairosc reloads its configuration.
+
+A thread stands in for the rtmidi callback thread and hands MIDI events to the event loop at a
+steady rate, while the configuration file is rewritten a number of times, alternating between two
+valid versions and, once, an invalid one. ``ConfigWatcher`` picks up the changes. Reports the
+events sent and handled, the time to build and swap the configuration and the max. time from
+sending an event to handling it. With ``--inline``, the configuration is read on the event loop
+thread instead, for comparison.
+
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+
+from os.path import join
+
+from xair.midi2xairosc import ConfigWatcher, MidiInputHandler, read_config
+
+
+CONFIG = """\
+- name: Channel {ch} fader
+  status: controllerchange
+  channel: {channel}
+  data: {cc}
+  osc: /ch/{ch:02}/mix/fader
+  args: ['f:value']
+  transform: {{curve: db}}
+"""
+
+
+class NullSender:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, path, *args):
+        self.sent += 1
+
+
+def write_config(filename, channel, commands):
+    with open(filename, 'w') as fp:
+        fp.write("".join(CONFIG.format(ch=n % 16 + 1, channel=channel, cc=n % 32)
+                         for n in range(commands)))
+
+
+class TimedHandler:
+    """Wrap a MIDI input handler and record the latency of each event."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.handled = 0
+        self.max_latency = 0.0
+
+    def __call__(self, event, sent):
+        self.handler(event)
+        self.handled += 1
+        self.max_latency = max(self.max_latency, time.perf_counter() - sent)
+
+
+def produce(loop, callback, rate, stop):
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    count = 0
+
+    while not stop.is_set():
+        loop.call_soon_threadsafe(callback, ([0xB0, count % 32, count % 128], 0.0),
+                                  time.perf_counter())
+        count += 1
+        time.sleep(max(0.0, start + count * interval - time.perf_counter()))
+
+    return count
+
+
+async def simulate(filename, handler, args):
+    loop = asyncio.get_running_loop()
+    timed = TimedHandler(handler)
+    watcher = ConfigWatcher(filename, [handler], interval=0.05)
+    stop = threading.Event()
+    producer = loop.run_in_executor(None, produce, loop, timed, args.rate, stop)
+    inline_times = []
+    await asyncio.sleep(0.2)
+
+    for n in range(args.reloads):
+        if n == args.reloads // 2:
+            with open(filename, 'w') as fp:
+                fp.write("- name: broken\n  status: [controllerchange\n")
+        else:
+            write_config(filename, 1 + n % 2, args.commands)
+
+        if args.inline:
+            start = time.perf_counter()
+
+            try:
+                handler.set_config(read_config(filename))
+            except IOError:
+                pass
+
+            inline_times.append(time.perf_counter() - start)
+        else:
+            await watcher.check()
+
+        await asyncio.sleep(0.2)
+
+    stop.set()
+    sent = await producer
+    await asyncio.sleep(0.05)
+    return sent, timed, watcher, inline_times
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-c', '--commands', type=int, default=2000,
+                    help="Number of commands in the configuration (default: %(default)s)")
+    ap.add_argument('-n', '--reloads', type=int, default=10,
+                    help="Number of configuration changes (default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=2000.0,
+                    help="MIDI events per second (default: %(default)s)")
+    ap.add_argument('-i', '--inline', action="store_true",
+                    help="Read the configuration on the event loop thread")
+    args = ap.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = join(tmpdir, 'config.yaml')
+        write_config(filename, 2, args.commands)
+        handler = MidiInputHandler('bench', filename, NullSender())
+        sent, timed, watcher, inline_times = asyncio.run(simulate(filename, handler, args))
+
+    stats = watcher.stats()
+    print("%i MIDI events sent, %i handled, %i lost, max. latency %.1f ms" %
+          (sent, timed.handled, sent - timed.handled, timed.max_latency * 1e3))
+
+    if args.inline:
+        print("inline reloads: max. %.1f ms on the event loop thread" %
+              (max(inline_times) * 1e3))
+    else:
+        print("%i reloads, %i failed, last build %.1f ms, max. swap %.1f us, "
+              "%i pending 14-bit values dropped" %
+              (stats['reloads'], stats['errors'], (stats['build_time'] or 0) * 1e3,
+               stats['max_swap_time'] * 1e6, stats['dropped']))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
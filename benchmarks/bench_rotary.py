@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_rotary.py
+#
+"""Measure the max. number of encoder edges per second decoded without loss.
+
+Random back and forth turns are replayed through the simulated input backend and the decoded
+value is compared with the expected one. For comparison, the 'sampled' mode reads both line
+levels with one syscall each per edge, like the C.H.I.P. backend reading the sysfs GPIO value
+files, while the 'events' mode uses the levels passed with the edge, like the gpiod backend.
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from xair.rotary import RotaryEncoder, SimulatedBackend, quadrature_edges
+
+
+class SampledBackend(SimulatedBackend):
+    """Simulated backend, which reads both line levels from a file on each edge."""
+
+    def __init__(self, fd):
+        super().__init__()
+        self.fd = fd
+
+    def setup(self, pin_dt, pin_clk, callback):
+        fd = self.fd
+        pread = os.pread
+        current = self
+
+        def edge(levels, timestamp):
+            # read dt and clk values, the result is ignored, only the syscalls count
+            pread(fd, 2, 0)
+            pread(fd, 2, 0)
+            callback(current.levels, timestamp)
+
+        super().setup(pin_dt, pin_clk, edge)
+
+    def replay(self, edges, realtime=False):
+        callback = self.callback
+
+        for timestamp, levels in edges:
+            self.levels = levels
+            callback(levels, timestamp)
+
+
+def make_edges(number, seed=0):
+    rnd = random.Random(seed)
+    edges = []
+    expected = 0
+    levels = 0b00
+
+    while len(edges) < number:
+        count = rnd.choice((-1, 1)) * rnd.randint(1, 64)
+        edges.extend(quadrature_edges(count, interval=1e-4, start=len(edges) * 1e-4,
+                                      levels=levels))
+        levels = edges[-1][1]
+        expected += count
+
+    return edges, expected
+
+
+def run(name, backend, edges, expected):
+    limit = len(edges) + 1
+    encoder = RotaryEncoder('DT', 'CLK', min_val=-limit, max_val=limit, backend=backend)
+    start = time.perf_counter()
+    backend.replay(edges)
+    elapsed = time.perf_counter() - start
+    # ENC_STATES counts in the other direction, unless reverse is True
+    lost = abs(-expected - encoder.value)
+    print("%-8s %10.0f edges/s  %6.3f us/edge  lost: %i" %
+          (name, len(edges) / elapsed, elapsed / len(edges) * 1e6, lost))
+    encoder.close()
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-n', '--number', type=int, default=200000,
+                    help="Number of edges (default: %(default)s)")
+    args = ap.parse_args(args)
+    edges, expected = make_edges(args.number)
+
+    with tempfile.TemporaryFile() as fp:
+        fp.write(b'1\n')
+        fp.flush()
+        run('sampled', SampledBackend(fp.fileno()), edges, expected)
+
+    run('events', SimulatedBackend(), edges, expected)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_rta.py
+#
+"""Measure time per RTA frame and memory use of the RTA history while streaming.
+
+Appends frames for a given stream duration at the mixer's frame rate to an `RTAHistory` and
+checks with tracemalloc that memory does not grow after the history was allocated.
+
+"""
+
+import argparse
+import math
+import sys
+import time
+import tracemalloc
+
+from array import array
+
+from xair.meters import numpy
+from xair.rta import RTA_BANDS, RTA_RATE, RTAHistory
+
+
+def make_frames(count, bands):
+    return [memoryview(array('h', (int((-40 + 30 * math.sin(i * 0.1 + band * 0.2)) * 256)
+                                   for band in range(bands))))
+            for i in range(count)]
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-d', '--duration', type=float, default=600,
+                    help="Simulated stream duration in seconds (default: %(default)s)")
+    ap.add_argument('-H', '--history', type=float, default=300,
+                    help="History length in seconds (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    frames = make_frames(64, RTA_BANDS)
+    count = int(args.duration * RTA_RATE)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    history = RTAHistory(size=int(args.history * RTA_RATE))
+    allocated = tracemalloc.get_traced_memory()[0] - base
+
+    for i in range(count):
+        history.append(frames[i % len(frames)], i / RTA_RATE)
+
+        if i == history.size - 1:
+            full = tracemalloc.get_traced_memory()[0] - base
+
+    end = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    # time without tracemalloc, which slows down allocations
+    history.clear()
+    start = time.perf_counter()
+
+    for i in range(count):
+        history.append(frames[i % len(frames)], i / RTA_RATE)
+
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        views = history.last(RTA_RATE * 60)
+    read = (time.perf_counter() - start) / 1000
+
+    print("NumPy: %s, %i frames streamed, history of %i frames" %
+          ('yes' if numpy is not None else 'no', count, history.size))
+    print("memory: %.2f MB allocated, %+i bytes when full, %+i bytes at end" %
+          (allocated / 1e6, full - allocated, end - allocated))
+    print("append: %.2f us/frame (%.2f%% of real time)" %
+          (elapsed / count * 1e6, elapsed / args.duration * 100))
+    print("read last minute: %.2f us, %i view(s), %i values" %
+          (read * 1e6, len(views), sum(len(view) for view in views)))
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# bench_transform.py
+#
+"""Measure the per-event cost of midi2xairosc value transforms.
+
+Compares evaluating a curve for each value with looking it up in the table precomputed by
+`Transform` and measures the time per MIDI event through ``MidiInputHandler`` for plain data
+bytes, curves, 14-bit controller pairs and NRPN data entry.
+
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+
+from os.path import join
+
+from xair.midi2xairosc import MidiInputHandler
+from xair.transform import Transform, make_curve
+
+
+CONFIG = """\
+- name: plain
+  status: controllerchange
+  channel: 1
+  data: 1
+  osc: /ch/01/mix/fader
+  args: ['f:data2']
+- name: db
+  status: controllerchange
+  channel: 1
+  data: 2
+  osc: /ch/02/mix/fader
+  args: ['f:value']
+  transform: {curve: db, min: -60, max: 10}
+- name: 14bit
+  status: controllerchange
+  channel: 1
+  data: 3
+  osc: /ch/03/mix/fader
+  args: ['f:value']
+  transform: {curve: db, mode: 14bit}
+- name: nrpn
+  status: controllerchange
+  channel: 2
+  osc: /ch/01/eq/1/f
+  args: ['f:value']
+  transform: {curve: log, min: 20, max: 20000, mode: nrpn, nrpn: 257}
+"""
+
+
+class NullSender:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, path, *args):
+        self.sent += 1
+
+
+def bench_conversion(curve, kwargs, repeat):
+    transform = Transform(curve, mode='14bit', **kwargs)
+    func = make_curve(curve, resolution=16384, **kwargs)
+    table = transform.table
+    values = range(16384)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in values:
+            func(raw)
+    evaluated = (time.perf_counter() - start) / repeat / len(values)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in values:
+            table[raw]
+    looked_up = (time.perf_counter() - start) / repeat / len(values)
+
+    print("%-22s evaluated: %6.3f us/value  table: %6.3f us/value" %
+          ('curve ' + curve, evaluated * 1e6, looked_up * 1e6))
+
+
+def bench_handler(name, handler, events, values_per_pass, repeat):
+    osc = handler.osc
+    osc.sent = 0
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        for event in events:
+            handler(event)
+
+    elapsed = time.perf_counter() - start
+    print("%-22s %6.3f us/event  %6.3f us/value  %i messages" %
+          ('handler ' + name, elapsed / repeat / len(events) * 1e6,
+           elapsed / repeat / values_per_pass * 1e6, osc.sent))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-r', '--repeat', type=int, default=20,
+                    help="Number of passes (default: %(default)s)")
+    args = ap.parse_args(args)
+
+    bench_conversion('db', {}, args.repeat)
+    bench_conversion('log', dict(min=20, max=20000), args.repeat)
+    bench_conversion('table', dict(points=[[0, 0.0], [8192, 0.75], [16383, 1.0]]), args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = join(tmpdir, 'config.yaml')
+
+        with open(config, 'w') as fp:
+            fp.write(CONFIG)
+
+        # without call_later, MSBs are passed on immediately and each LSB sends again
+        handler = MidiInputHandler('bench', config, NullSender())
+
+    repeat = args.repeat * 10
+    bench_handler('plain', handler, [([0xB0, 1, value], 0) for value in range(128)], 128,
+                  repeat)
+    bench_handler('db', handler, [([0xB0, 2, value], 0) for value in range(128)], 128, repeat)
+    bench_handler('14bit', handler, [([0xB0, cc, value], 0) for value in range(128)
+                                     for cc in (3, 35)], 128, repeat)
+    bench_handler('nrpn', handler, [([0xB1, 99, 2], 0), ([0xB1, 98, 1], 0)] +
+                  [([0xB1, cc, value], 0) for value in range(128) for cc in (6, 38)], 128,
+                  repeat)
+
+
+if __name__ == '__main__':
+    sys.exit(main() or 0)
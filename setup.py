@@ -68,8 +68,8 @@ Topic :: System :: Networking
 
 install_requires = [
     'cmd2',
-    'pyliblo',
     'python-rtmidi',
+    'pyyaml',
 ]
 
 
@@ -91,7 +91,8 @@ setup(
     install_requires=install_requires,
     entry_points={
         'console_scripts': [
-            'xaircmd=xair.xaircmd:main'
+            'xaircmd=xair.xaircmd:main',
+            'xair-surface=xair.surface:main',
         ]
     },
     cmdclass={'test': ToxTestCommand},
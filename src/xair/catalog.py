@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+#
+# catalog.py
+#
+"""Catalog of X-AIR OSC commands read from ``xair-cmdlist.csv``.
+
+The parsed catalog is cached in a binary file next to the CSV file (or in the user's cache
+directory, if the package directory is not writable), which is rebuilt automatically when the
+CSV file changes.
+
+"""
+
+import logging
+import marshal
+import os
+import re
+import struct
+
+from collections import namedtuple
+from os.path import dirname, expanduser, join
+
+
+log = logging.getLogger(__name__)
+
+XAirCommand = namedtuple('XAirCommand', 'address,types,range,values,description'.split(','))
+RANGE_RX = re.compile(r'\{(\d+)\.\.(\d+)\}')
+CACHE_MAGIC = b'XAIRCAT\0'
+CACHE_VERSION = 1
+# magic, cache format version, CSV mtime (ns), CSV size, CSV SHA-1 hash
+_cache_header = struct.Struct('>8sHqq20s')
+
+
+def parse_commands(filename='xair-cmdlist.csv'):
+    """Read command catalog and return a dict mapping OSC addresses to `XAirCommand` instances.
+
+    Addresses may contain ranges like ``{1..4}``, which are stored unexpanded. Rows, whose
+    address starts with '#', are ignored.
+
+    """
+    # Only needed when the catalog cache is rebuilt, so import lazily to speed up startup
+    import csv
+
+    commands = dict()
+    with open(join(dirname(__file__), filename), newline='') as csvfile:
+        reader = csv.reader(csvfile, delimiter=',', strict=True)
+        try:
+            for i, row in enumerate(reader):
+                if i == 0 and tuple(row) == XAirCommand._fields:
+                    continue
+                if not row or row[0].startswith('#'):
+                    continue
+                try:
+                    commands[row[0]] = XAirCommand(*row)
+                except TypeError:
+                    log.warning("Invalid command in '%s', line %i: %r", filename, i, row)
+        except csv.Error as exc:
+            log.error("Error in command file '%s', line %i: %s", filename, i, exc)
+    return commands
+
+
+def expand_address(address):
+    """Return list of concrete addresses for an address containing ranges like ``{01..18}``.
+
+    Numbers are zero-padded to the width of the range start, if it has a leading zero.
+
+    """
+    match = RANGE_RX.search(address)
+
+    if not match:
+        return [address]
+
+    start, end = match.groups()
+    fmt = '%0{}i'.format(len(start)) if start.startswith('0') and len(start) > 1 else '%i'
+    head, tail = address[:match.start()], address[match.end():]
+    expanded = []
+
+    for num in range(int(start), int(end) + 1):
+        expanded.extend(head + fmt % num + rest for rest in expand_address(tail))
+
+    return expanded
+
+
+def expand_commands(commands):
+    """Return a dict mapping concrete addresses to commands with all address ranges expanded."""
+    expanded = dict()
+
+    for pattern, cmd in commands.items():
+        for address in expand_address(pattern):
+            expanded[address] = cmd._replace(address=address)
+
+    return expanded
+
+
+class CommandTrie:
+    """A prefix tree of OSC addresses split into path segments.
+
+    Each node is a list of the command tuple for the address ending at the node (or None) and a
+    dict mapping segment names to child nodes, so lookup, validation and completion take time
+    proportional to the number of segments in the address, independent of the size of the
+    catalog. Nodes consist only of built-in types, so the trie can be serialized with `marshal`.
+
+    """
+
+    __slots__ = ('root',)
+
+    def __init__(self, commands=None, root=None):
+        self.root = [None, {}] if root is None else root
+
+        if commands:
+            for address, cmd in commands.items():
+                self.insert(address, cmd)
+
+    @classmethod
+    def from_catalog(cls, filename='xair-cmdlist.csv'):
+        """Return trie of all commands in the catalog file with address ranges expanded."""
+        return cls(expand_commands(parse_commands(filename)))
+
+    def insert(self, address, cmd):
+        node = self.root
+
+        for segment in address.strip('/').split('/'):
+            child = node[1].get(segment)
+
+            if child is None:
+                child = node[1][segment] = [None, {}]
+
+            node = child
+
+        node[0] = tuple(cmd)
+
+    def node(self, address):
+        """Return the node for given address (with or without leading slash) or None."""
+        node = self.root
+        address = address.strip('/')
+
+        if address:
+            for segment in address.split('/'):
+                node = node[1].get(segment)
+
+                if node is None:
+                    return None
+
+        return node
+
+    def get(self, address, default=None):
+        """Return `XAirCommand` for given address or ``default``."""
+        node = self.node(address)
+        return default if node is None or node[0] is None else XAirCommand(*node[0])
+
+    def __contains__(self, address):
+        node = self.node(address)
+        return node is not None and node[0] is not None
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        """Yield all addresses in the trie in sorted order."""
+        stack = [('', self.root)]
+
+        while stack:
+            path, node = stack.pop()
+
+            if node[0] is not None:
+                yield path
+
+            stack.extend((path + '/' + segment, node[1][segment])
+                         for segment in sorted(node[1], reverse=True))
+
+    def types(self, address):
+        """Return OSC type tags of the parameter at given address or an empty string."""
+        node = self.node(address)
+        return node[0][1] if node is not None and node[0] is not None else ''
+
+    def complete(self, text):
+        """Return completions of the last segment of given (partial) address.
+
+        The completions are returned with the same prefix as ``text``. Segments, which are not an
+        address themselves, but have children, are returned with a trailing slash.
+
+        """
+        head, sep, partial = text.rpartition('/')
+        node = self.node(head)
+
+        if node is None:
+            return []
+
+        prefix = head + sep
+        return [prefix + segment + ('/' if child[1] and child[0] is None else '')
+                for segment, child in sorted(node[1].items())
+                if segment.startswith(partial)]
+
+
+def _cache_filenames(filename):
+    csvpath = join(dirname(__file__), filename)
+    cachedir = os.environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache')
+    return csvpath, (csvpath + '.cache', join(cachedir, 'xair-remote', filename + '.cache'))
+
+
+def _read_cache(cachepath, csvstat, get_hash):
+    with open(cachepath, 'rb') as fp:
+        header = fp.read(_cache_header.size)
+
+        try:
+            magic, version, mtime, size, digest = _cache_header.unpack(header)
+        except struct.error:
+            return None
+
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+
+        if (mtime, size) != (csvstat.st_mtime_ns, csvstat.st_size) and digest != get_hash():
+            return None
+
+        return CommandTrie(root=marshal.loads(fp.read()))
+
+
+def _write_cache(cachepath, csvstat, digest, trie):
+    import tempfile
+
+    os.makedirs(dirname(cachepath), exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=dirname(cachepath), prefix='.catalog-')
+
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(_cache_header.pack(CACHE_MAGIC, CACHE_VERSION, csvstat.st_mtime_ns,
+                                        csvstat.st_size, digest))
+            marshal.dump(trie.root, fp)
+
+        os.chmod(tmppath, 0o644)
+        os.replace(tmppath, cachepath)
+    except OSError:
+        os.unlink(tmppath)
+        raise
+
+
+def load_catalog(filename='xair-cmdlist.csv', use_cache=True):
+    """Return a `CommandTrie` of the catalog, loading it from the binary cache if up to date.
+
+    If the cache is missing or stale, the CSV file is parsed and the cache is rewritten. If only
+    the modification time of the CSV file changed, but not its contents, the cache is rewritten
+    with the new time.
+
+    """
+    csvpath, cachepaths = _cache_filenames(filename)
+
+    if not use_cache:
+        return CommandTrie.from_catalog(filename)
+
+    csvstat = os.stat(csvpath)
+    digest = []
+
+    def get_hash():
+        import hashlib
+
+        if not digest:
+            with open(csvpath, 'rb') as fp:
+                digest.append(hashlib.sha1(fp.read()).digest())
+        return digest[0]
+
+    for cachepath in cachepaths:
+        try:
+            trie = _read_cache(cachepath, csvstat, get_hash)
+        except (OSError, EOFError, ValueError, TypeError) as exc:
+            log.debug("Could not read catalog cache '%s': %s", cachepath, exc)
+            continue
+
+        if trie is not None:
+            if digest:
+                # the CSV was touched but is unchanged, e.g. by a checkout: store its new mtime
+                # and size, so the next start does not need to hash it again
+                try:
+                    _write_cache(cachepath, csvstat, digest[0], trie)
+                except OSError as exc:
+                    log.debug("Could not update catalog cache '%s': %s", cachepath, exc)
+
+            return trie
+
+    trie = CommandTrie.from_catalog(filename)
+
+    for cachepath in cachepaths:
+        try:
+            _write_cache(cachepath, csvstat, get_hash(), trie)
+        except OSError as exc:
+            log.debug("Could not write catalog cache '%s': %s", cachepath, exc)
+        else:
+            log.debug("Wrote catalog cache '%s'.", cachepath)
+            break
+
+    return trie
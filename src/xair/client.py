@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# client.py
+#
+"""An asyncio-based OSC client for Behringer X-AIR / MIDAS M-AIR mixers."""
+
+import asyncio
+import logging
+
+from collections import OrderedDict, deque
+
+from .osc import (DEFAULT_MTU, BundleSender, OSCError, decode_packet, encode_bundle,
+                  encode_message)
+
+
+log = logging.getLogger(__name__)
+
+# Subscriptions via /xremote expire after 10 seconds
+XREMOTE_INTERVAL = 9.0
+
+
+class OSCProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol passing decoded OSC messages to a callback.
+
+    If ``raw_callback`` is given, it is called with each received packet first and the packet is
+    only decoded, if it returns a false value.
+
+    """
+
+    def __init__(self, callback, raw_callback=None):
+        self.callback = callback
+        self.raw_callback = raw_callback
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.raw_callback is not None and self.raw_callback(data, addr):
+            return
+
+        try:
+            messages = decode_packet(data)
+        except OSCError as exc:
+            log.warning("Invalid OSC packet from %s:%i: %s", addr[0], addr[1], exc)
+            return
+
+        for msg in messages:
+            self.callback(msg, addr)
+
+    def error_received(self, exc):
+        log.warning("OSC socket error: %s", exc)
+
+
+class XAirClient:
+    """Send OSC messages to and receive replies from an X-AIR mixer.
+
+    All methods must be called from the thread running the event loop, on which `connect` was
+    awaited. Replies to queries are matched to requests by OSC address, so any number of queries
+    may be in flight at the same time. All received messages, including replies to queries, are
+    also passed to the handlers registered with `add_handler`.
+
+    """
+
+    def __init__(self, server, port=10024, srcport=0, timeout=0.5, mtu=DEFAULT_MTU):
+        self.server = server
+        self.port = port
+        self.srcport = srcport
+        self.timeout = timeout
+        self.transport = None
+        self.bundler = BundleSender(self._send_datagram, mtu=mtu)
+        self._waiters = {}
+        self._handlers = []
+        self._raw_handlers = []
+        self._monitors = []
+        self._keepalive = None
+
+    async def connect(self):
+        """Create the UDP endpoint for communication with the mixer."""
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: OSCProtocol(self._dispatch, self._dispatch_raw),
+            local_addr=('0.0.0.0', self.srcport),
+            remote_addr=(self.server, self.port))
+        return self
+
+    def close(self):
+        """Stop keepalive, cancel pending queries and close the UDP endpoint."""
+        self.stop_keepalive()
+
+        for waiters in self._waiters.values():
+            for fut in waiters:
+                fut.cancel()
+
+        self._waiters.clear()
+
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def add_handler(self, callback, path=None):
+        """Call ``callback(msg)`` for each received message.
+
+        If ``path`` is given, only messages with this address are passed to the callback.
+
+        """
+        self._handlers.append((path, callback))
+
+    def remove_handler(self, callback, path=None):
+        self._handlers.remove((path, callback))
+
+    def add_raw_handler(self, callback, prefix):
+        """Call ``callback(data, addr)`` for each received packet starting with ``prefix``.
+
+        ``prefix`` is a bytes object, e.g. the beginning of an OSC address. Matching packets are
+        passed on undecoded, for handlers which parse the binary data themselves, and are not
+        passed to the handlers registered with `add_handler` or to pending queries.
+
+        """
+        self._raw_handlers.append((prefix, callback))
+
+    def remove_raw_handler(self, callback, prefix):
+        self._raw_handlers.remove((prefix, callback))
+
+    def add_monitor(self, callback):
+        """Call ``callback(data, addr)`` for each received packet, before it is dispatched.
+
+        Monitors get all packets undecoded, including those taken by raw handlers, e.g. to record
+        them.
+
+        """
+        self._monitors.append(callback)
+
+    def remove_monitor(self, callback):
+        self._monitors.remove(callback)
+
+    def _send_datagram(self, data):
+        if self.transport is None:
+            raise OSCError("Client not connected.")
+
+        self.transport.sendto(data)
+
+    def send(self, path, *args):
+        """Send OSC message with given address and arguments immediately."""
+        log.debug("OSC SEND -> (%s, %s): %s %r", self.server, self.port, path, args)
+        self._send_datagram(encode_message(path, *args))
+
+    async def query(self, path, *args, timeout=None, bundle=False):
+        """Send OSC message and return the first message received with the same address.
+
+        Raises `asyncio.TimeoutError` if no reply is received within ``timeout`` seconds (default:
+        ``self.timeout``). If ``bundle`` is True, the query is sent wrapped in an OSC bundle.
+
+        """
+        fut = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(path, deque())
+        waiters.append(fut)
+        msg = encode_message(path, *args)
+
+        try:
+            log.debug("OSC QUERY -> (%s, %s): %s %r", self.server, self.port, path, args)
+            self._send_datagram(encode_bundle([msg]) if bundle else msg)
+            return await asyncio.wait_for(fut, self.timeout if timeout is None else timeout)
+        finally:
+            try:
+                waiters.remove(fut)
+            except ValueError:
+                pass
+
+            if not waiters and self._waiters.get(path) is waiters:
+                del self._waiters[path]
+
+    async def query_retry(self, path, *args, timeout=None, retries=2):
+        """Like `query`, but resend the query up to ``retries`` times if no reply arrives."""
+        for attempt in range(retries + 1):
+            try:
+                return await self.query(path, *args, timeout=timeout)
+            except asyncio.TimeoutError:
+                if attempt == retries:
+                    raise
+
+                log.debug("No reply to query %s, retrying (%i/%i).", path, attempt + 1, retries)
+
+    async def query_many(self, queries, timeout=None, retries=2, window=32):
+        """Send many queries back to back and collect the replies.
+
+        ``queries`` is an iterable of OSC addresses or ``(address, args)`` tuples. At most
+        ``window`` queries are in flight at the same time; each query is timed out and retried
+        separately. Returns an ordered dict mapping each address to the reply message, or to None
+        if no reply was received.
+
+        """
+        sem = asyncio.Semaphore(window) if window else None
+
+        async def run(path, args):
+            try:
+                if sem is None:
+                    return await self.query_retry(path, *args, timeout=timeout, retries=retries)
+
+                async with sem:
+                    return await self.query_retry(path, *args, timeout=timeout, retries=retries)
+            except asyncio.TimeoutError:
+                return None
+
+        queries = [(query, ()) if isinstance(query, str) else query for query in queries]
+        replies = await asyncio.gather(*(run(path, args) for path, args in queries))
+        return OrderedDict((path, reply) for (path, _), reply in zip(queries, replies))
+
+    async def probe_bundles(self, timeout=None):
+        """Return True if the mixer answers a query sent in an OSC bundle."""
+        try:
+            await self.query('/xinfo', timeout=timeout, bundle=True)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+    def start_keepalive(self, interval=XREMOTE_INTERVAL):
+        """Periodically send '/xremote' to keep receiving parameter change notifications."""
+        if self._keepalive is None:
+            self._keepalive = asyncio.ensure_future(self._send_keepalive(interval))
+
+    def stop_keepalive(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+
+    async def _send_keepalive(self, interval):
+        while True:
+            try:
+                self.send('/xremote')
+            except OSCError as exc:
+                log.warning("Could not send keepalive: %s", exc)
+
+            await asyncio.sleep(interval)
+
+    def _dispatch_raw(self, data, addr):
+        for callback in self._monitors:
+            try:
+                callback(data, addr)
+            except Exception:
+                log.exception("Unhandled exception in OSC packet monitor %r.", callback)
+
+        for prefix, callback in self._raw_handlers:
+            if data.startswith(prefix):
+                try:
+                    callback(data, addr)
+                except Exception:
+                    log.exception("Unhandled exception in raw OSC packet handler %r.", callback)
+
+                return True
+
+        return False
+
+    def _dispatch(self, msg, addr):
+        log.debug("OSC RECV (%s, %s): %s %s %r", addr[0], addr[1], msg.path, msg.types, msg.args)
+        waiters = self._waiters.get(msg.path)
+
+        while waiters:
+            fut = waiters.popleft()
+
+            if not fut.done():
+                fut.set_result(msg)
+                break
+
+        for path, callback in self._handlers:
+            if path is None or path == msg.path:
+                try:
+                    callback(msg)
+                except Exception:
+                    log.exception("Unhandled exception in OSC message handler %r.", callback)
+
+
+def _test():
+    from .fakemixer import start_fake_mixer
+
+    async def test():
+        transport, mixer = await start_fake_mixer('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+
+        async with XAirClient('127.0.0.1', port) as client:
+            print("Bundles supported:", await client.probe_bundles())
+            print(await client.query('/xinfo'))
+            client.send('/ch/01/mix/fader', 0.5)
+            replies = await asyncio.gather(*(client.query('/ch/%02i/mix/fader' % ch)
+                                             for ch in range(1, 17)))
+
+            for msg in replies:
+                print(msg.path, msg.args)
+
+        transport.close()
+
+    asyncio.run(test())
+
+
+if __name__ == '__main__':
+    _test()
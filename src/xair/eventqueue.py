@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+#
+# eventqueue.py
+#
+"""An event dispatcher, which queues events and runs handlers outside of the caller's thread.
+
+Input callbacks (e.g. from rtmidi or GPIO interrupts) only put events into a bounded queue, so a
+slow handler can not stall input processing. The queue is drained either by a task in an asyncio
+event loop (`QueuedEventDispatcher.run`) or by a pool of worker threads
+(`QueuedEventDispatcher.start`).
+
+"""
+
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict, deque
+
+from .events import EventDispatcher, on_event
+
+
+log = logging.getLogger(__name__)
+
+# Backpressure policies, i.e. what happens to a new event when the queue is full
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+COALESCE = 'coalesce'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+def offload(func):
+    """Mark event handler to run in an executor when the queue is drained by an asyncio loop.
+
+    Use this for handlers, which block, e.g. on disk I/O. Apply it below `on_event`::
+
+        @on_event('fader')
+        @offload
+        def on_fader(self, event):
+            ...
+
+    """
+    func._handler_offload = True
+    return func
+
+
+class QueuedEventDispatcher(EventDispatcher):
+    """Event dispatcher, which queues events and passes them to handlers asynchronously.
+
+    `dispatch` can be called from any thread and returns immediately. Events are kept in a queue
+    (or "lane") per event type and events of the same type are always passed to the handlers in
+    the order they were dispatched. Events of different types may be handled concurrently.
+
+    At most ``maxsize`` events are queued. When the queue is full, ``policy`` determines what
+    happens to a new event:
+
+    ``'drop-oldest'``
+        The oldest queued event of the same type (or of the type with the most queued events)
+        is discarded.
+    ``'drop-newest'``
+        The new event is discarded.
+    ``'coalesce'``
+        Every new event replaces a queued event of the same type with the same key, as returned
+        by ``key(event)`` (default: the event type), regardless of the queue size. If there is no
+        such event and the queue is full, the oldest event is discarded. Events of different
+        types are never coalesced, even if ``key`` returns the same key for them.
+
+    When the queue is drained by `run`, handlers may be coroutine functions, which are awaited,
+    and handlers marked with `offload` are run in the loop's default executor.
+
+    """
+
+    def __init__(self, maxsize=1024, policy=DROP_OLDEST, key=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown backpressure policy: %r" % (policy,))
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.queued = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._size = 0
+        self._lanes = OrderedDict()
+        self._active = set()
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._workers = []
+        self._running = False
+        self._wakeup = None
+
+    def dispatch(self, *events):
+        """Queue one or more events for dispatching to the handlers."""
+        self.dispatch_many(events)
+
+    def dispatch_many(self, events):
+        """Queue all events from given iterable for dispatching to the handlers."""
+        with self._cond:
+            for event in events:
+                self._put(event)
+
+            self._cond.notify_all()
+
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def dispatch_now(self, *events):
+        """Pass events to the handlers immediately, in the caller's thread."""
+        super().dispatch_many(events)
+
+    def _put(self, event):
+        lane = self._lanes.get(event.type)
+
+        if lane is None:
+            lane = self._lanes[event.type] = deque()
+
+        if self.policy == COALESCE:
+            # coalesce per type only, so each event stays in the lane of its type
+            key = event.type if self.key is None else (event.type, self.key(event))
+            item = self._pending.get(key)
+
+            if item is not None:
+                item[1] = event
+                self.coalesced += 1
+                return
+
+            item = self._pending[key] = [key, event]
+        else:
+            item = event
+
+        if self._size >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return
+
+            self._drop_oldest(lane)
+
+        lane.append(item)
+        self._size += 1
+        self.queued += 1
+        self.max_depth = max(self.max_depth, self._size)
+
+    def _drop_oldest(self, lane):
+        if not lane:
+            lane = max(self._lanes.values(), key=len)
+
+        item = lane.popleft()
+
+        if self.policy == COALESCE:
+            del self._pending[item[0]]
+
+        self._size -= 1
+        self.dropped += 1
+
+    def _pop(self, type_):
+        """Return next event of given type or None if there is none and release the lane.
+
+        Must be called with the lock held.
+
+        """
+        lane = self._lanes.get(type_)
+
+        if not lane:
+            self._active.discard(type_)
+            return None
+
+        item = lane.popleft()
+        self._size -= 1
+
+        if self.policy == COALESCE:
+            del self._pending[item[0]]
+            return item[1]
+
+        return item
+
+    def _acquire_lane(self):
+        """Return type of an event lane with queued events, which no consumer is working on."""
+        for type_, lane in self._lanes.items():
+            if lane and type_ not in self._active:
+                self._active.add(type_)
+                return type_
+
+    def stats(self):
+        """Return dict with event counters and current and maximum queue depth."""
+        with self._cond:
+            return dict(queued=self.queued, dispatched=self.dispatched, dropped=self.dropped,
+                        coalesced=self.coalesced, depth=self._size, max_depth=self.max_depth,
+                        lanes={type_: len(lane) for type_, lane in self._lanes.items() if lane})
+
+    def _handle(self, event):
+        EventDispatcher.dispatch_many(self, (event,))
+
+    async def _handle_async(self, event):
+        chains = self._handler_chains
+        chain = chains.get(event.type) if chains is not None else None
+
+        if chain is None:
+            chain = self._handler_chain(event.type)
+
+        for handler in chain:
+            try:
+                if getattr(handler, '_handler_offload', False):
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(None, handler, event)
+                else:
+                    result = handler(event)
+
+                    if asyncio.iscoroutine(result):
+                        result = await result
+
+                if result:
+                    break
+            except Exception:
+                log.exception("Unhandled exception in event handler %r.", handler)
+
+    async def run(self):
+        """Drain the queue from the running asyncio event loop.
+
+        Each event type with queued events is handled by a separate task, which awaits the
+        handlers of one event before taking the next.
+
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        tasks = set()
+
+        def notify():
+            # the flag is only cleared before the lanes are checked, so the check is safe
+            if wakeup.is_set():
+                return
+            elif threading.get_ident() == thread_id:
+                wakeup.set()
+            else:
+                loop.call_soon_threadsafe(wakeup.set)
+
+        thread_id = threading.get_ident()
+        self._wakeup = notify
+
+        try:
+            while True:
+                wakeup.clear()
+
+                with self._cond:
+                    lanes = []
+
+                    while True:
+                        type_ = self._acquire_lane()
+
+                        if type_ is None:
+                            break
+
+                        lanes.append(type_)
+
+                for type_ in lanes:
+                    task = asyncio.ensure_future(self._drain_lane(type_))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                await wakeup.wait()
+        finally:
+            self._wakeup = None
+
+            for task in tasks:
+                task.cancel()
+
+            with self._cond:
+                self._active.clear()
+
+    async def _drain_lane(self, type_):
+        while True:
+            with self._cond:
+                event = self._pop(type_)
+
+            if event is None:
+                return
+
+            await self._handle_async(event)
+
+            with self._cond:
+                self.dispatched += 1
+
+    def start(self, workers=1):
+        """Start given number of worker threads, which drain the queue."""
+        with self._cond:
+            if self._workers:
+                return
+
+            self._running = True
+
+            for i in range(workers):
+                thread = threading.Thread(target=self._run, name='EventWorker-%i' % i,
+                                          daemon=True)
+                self._workers.append(thread)
+                thread.start()
+
+    def stop(self, flush=True):
+        """Stop the worker threads and optionally handle all events still queued."""
+        with self._cond:
+            if not self._workers:
+                return
+
+            self._running = False
+            self._cond.notify_all()
+
+        for thread in self._workers:
+            thread.join()
+
+        self._workers = []
+
+        if flush:
+            self.drain()
+
+    def drain(self):
+        """Handle all queued events in the caller's thread."""
+        while True:
+            with self._cond:
+                type_ = self._acquire_lane()
+
+                if type_ is None:
+                    return
+
+                event = self._pop(type_)
+
+            while event is not None:
+                self._handle(event)
+
+                with self._cond:
+                    self.dispatched += 1
+                    event = self._pop(type_)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                type_ = None
+
+                while self._running:
+                    type_ = self._acquire_lane()
+
+                    if type_ is not None:
+                        break
+
+                    self._cond.wait()
+
+                if type_ is None:
+                    break
+
+                event = self._pop(type_)
+
+            while event is not None:
+                self._handle(event)
+
+                with self._cond:
+                    self.dispatched += 1
+                    event = self._pop(type_) if self._running else self._release(type_)
+
+    def _release(self, type_):
+        self._active.discard(type_)
+
+
+def _test():
+    import time
+
+    from .events import Event
+
+    logging.basicConfig(level=logging.INFO)
+
+    class Handler:
+        @on_event('fader')
+        async def on_fader(self, event):
+            await asyncio.sleep(0.01)
+            print("fader", event.channel, event.value)
+
+        @on_event('log')
+        @offload
+        def on_log(self, event):
+            time.sleep(0.01)
+            print("log", event.msg)
+
+    async def test():
+        dispatcher = QueuedEventDispatcher(maxsize=8, policy=COALESCE,
+                                           key=lambda e: (e.type, e.get('channel')))
+        dispatcher.push_handlers(Handler())
+        runner = asyncio.ensure_future(dispatcher.run())
+
+        for i in range(100):
+            dispatcher.dispatch(Event(type='fader', channel=i % 4, value=i),
+                                Event(type='log', msg="message %i" % i))
+
+        await asyncio.sleep(0.2)
+        print(dispatcher.stats())
+        runner.cancel()
+
+    asyncio.run(test())
+
+
+if __name__ == '__main__':
+    _test()
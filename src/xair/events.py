@@ -1,59 +1,259 @@
 # -*- coding: utf-8 -*-
+"""Events and an event dispatcher with a stack of event handlers.
+
+This module runs on CPython and on MicroPython. Modules which are not available on small
+boards, like `inspect` and `weakref`, are only used if they can be imported. Event classes do not
+use metaclasses or ``__init_subclass__``, which many MicroPython ports do not support. Where
+classes have no ``__subclasses__`` method (MicroPython), `Event.event_types` only knows classes
+registered with `register_event`.
+
+Without `weakref`, callables marked with `on_event`, which do not support setting attributes on
+them (e.g. functions on MicroPython), are kept alive by the module until passed to
+`forget_handler`. This does not matter for module-level functions and methods, but handlers
+created at run-time, like closures, should be forgotten once removed from all dispatchers.
+
+"""
 
-import inspect
 import logging
 
 from collections import OrderedDict
 
+try:
+    from inspect import isclass
+except ImportError:
+    def isclass(obj):
+        return isinstance(obj, type)
+
+try:
+    from weakref import WeakKeyDictionary
+except ImportError:
+    WeakKeyDictionary = dict
+
 
 log = logging.getLogger(__name__)
 
+# Event types of marked handlers, which do not support setting attributes on them.
+# Handlers are referenced weakly (if possible), so marking them does not keep them alive.
+_handler_to_event = WeakKeyDictionary()
+
 
 def is_event(event):
-    """Return True if event is a (strict) subclass or an instance of Event."""
-    return ((inspect.isclass(event) and issubclass(event, Event)) or isinstance(event, Event)
-            and event.type is not None)
+    """Return True if event is a (strict) subclass or an instance of Event or SlotEvent."""
+    return ((isclass(event) and issubclass(event, (Event, SlotEvent))) or
+            isinstance(event, (Event, SlotEvent)) and event.type is not None)
 
 
 def on_event(event):
     """Mark function or method as a handler for the given event (type)."""
 
     def decorator(func):
-        func._handler_for = event.type if is_event(event) else event
+        type_ = event.type if is_event(event) else event
+
+        try:
+            func._handler_for = type_
+        except AttributeError:
+            _handler_to_event[func] = type_
+
         return func
 
     return decorator
 
 
+def forget_handler(handler):
+    """Remove the event type mark of a handler, which does not support setting attributes on it.
+
+    Only needed if `weakref` is not available, to release handlers marked with `on_event`.
+
+    """
+    try:
+        _handler_to_event.pop(handler, None)
+    except TypeError:  # not hashable or weak-referencable
+        pass
+
+
+def handler_event(handler):
+    """Return the event type, for which given callable was marked as a handler, or None."""
+    type_ = getattr(handler, '_handler_for', None)
+
+    if type_ is None and _handler_to_event:
+        try:
+            type_ = _handler_to_event.get(getattr(handler, '__func__', handler))
+        except TypeError:  # not hashable or weak-referencable
+            pass
+
+    return type_
+
+
 class Bunch(dict):
     """A generic container object with unified attribute and dict-style access to its members."""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__dict__ = self
 
+        try:
+            self.__dict__ = self
+        except (AttributeError, TypeError):
+            # MicroPython: instance dict can not be replaced, members are looked up in
+            # __getattr__, except 'type', which would be found on the class first
+            if 'type' in self:
+                self.type = self['type']
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+# Event classes registered explicitly with `register_event`
+_registry = OrderedDict()
+# Slot names of `SlotEvent` sub-classes, including inherited ones, by class
+_slot_fields = {}
 
-class Registrable(type):
-    """Meta-class for registrable and sub-classes.
 
-    Holds a registry of all sub-classes.
+def register_event(cls):
+    """Register event class by its type for `Event.event_types`. Can be used as class decorator.
+
+    Only needed on platforms, where classes have no ``__subclasses__`` method.
 
     """
-    registry = OrderedDict()
+    if cls.type:
+        _registry[cls.type] = cls
+
+    return cls
+
+
+def _subclasses(cls):
+    """Yield all sub-classes of given class recursively (none on MicroPython)."""
+    for subclass in getattr(cls, '__subclasses__', tuple)():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def _event_types():
+    registry = OrderedDict(_registry)
 
-    def __init__(cls, clsname, bases, classdict):
-        type_ = getattr(cls, 'type')
-        if type_:
-            cls.registry[type_] = cls
+    for base in (Event, SlotEvent):
+        for cls in _subclasses(base):
+            if cls.type:
+                registry.setdefault(cls.type, cls)
 
+    return registry.keys()
 
-class Event(Bunch, metaclass=Registrable):
+
+def _fields_of(cls):
+    """Return names of all slots of class and its base classes, base classes first."""
+    fields = _slot_fields.get(cls)
+
+    if fields is None:
+        fields = []
+        bases = getattr(cls, '__bases__', ())
+
+        for base in bases:
+            fields.extend(name for name in _fields_of(base) if name not in fields)
+
+        slots = getattr(cls, '__slots__', ())
+
+        # inherited, if the class does not define __slots__ itself
+        if not any(getattr(base, '__slots__', None) is slots for base in bases):
+            fields.extend((slots,) if isinstance(slots, str) else slots)
+
+        fields = _slot_fields[cls] = tuple(fields)
+
+    return fields
+
+
+class Event(Bunch):
     """Base class for events."""
     type = None
 
     @classmethod
     def event_types(cls):
-        return cls.registry.keys()
+        """Return the types of all `Event` and `SlotEvent` sub-classes."""
+        return _event_types()
+
+
+class SlotEvent:
+    """Base class for compact events with a fixed set of attributes.
+
+    Sub-classes list their attributes in ``__slots__``. Instances have no ``__dict__``, so they
+    need much less memory than `Event` instances, which are dicts, and do not create reference
+    cycles, so they are freed immediately when no longer referenced. Attributes can be given as
+    positional arguments in the order of ``__slots__`` or as keyword arguments::
+
+        class FaderEvent(SlotEvent):
+            type = 'fader'
+            __slots__ = ('channel', 'value')
+
+        event = FaderEvent(1, 0.75)
+
+    """
+    __slots__ = ()
+    type = None
+
+    def __init__(self, *args, **kwargs):
+        if args:
+            fields = _slot_fields.get(self.__class__) or _fields_of(self.__class__)
+
+            for name, value in zip(fields, args):
+                setattr(self, name, value)
+
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(
+            "{}={!r}".format(name, getattr(self, name, None)) for name in self._fields))
+
+    @property
+    def _fields(self):
+        return _fields_of(self.__class__)
+
+    @classmethod
+    def event_types(cls):
+        """Return the types of all `Event` and `SlotEvent` sub-classes."""
+        return _event_types()
+
+
+class EventPool:
+    """A free list of `SlotEvent` instances of one class for re-use.
+
+    Events obtained with `acquire` must be passed to `release` once all handlers are done with
+    them, i.e. handlers must not keep references to pooled events. Released events have all their
+    attributes removed, so a re-used event has only the attributes given to `acquire`, like a new
+    one, and the pool keeps no references to old attribute values.
+
+    """
+
+    def __init__(self, cls, maxsize=256):
+        self.cls = cls
+        self.maxsize = maxsize
+        self._free = []
+
+    def acquire(self, *args, **kwargs):
+        """Return a released event, re-initialized with the given attributes, or a new one."""
+        if self._free:
+            event = self._free.pop()
+            event.__init__(*args, **kwargs)
+            return event
+
+        return self.cls(*args, **kwargs)
+
+    def release(self, event):
+        if len(self._free) < self.maxsize:
+            for name in event._fields:
+                try:
+                    delattr(event, name)
+                except AttributeError:
+                    pass
+
+            self._free.append(event)
 
 
 class EventDispatcher:
@@ -61,7 +261,13 @@ class EventDispatcher:
 
     Can be also instantiated and used directly without sub-classing.
 
+    For each event type, the chain of handlers, from the top of the handler stack to the bottom,
+    is computed on first dispatch and cached until handlers are pushed or popped.
+
     """
+    _handler_stack = ()
+    _handler_chains = None
+
     def push_handlers(self, *args, **kwargs):
         """Push given event handlers on top of the handler stack.
 
@@ -72,31 +278,31 @@ class EventDispatcher:
         value specifies the handler callable.
 
         """
-        if not hasattr(self, '_handler_stack'):
+        if not self._handler_stack:
             self._handler_stack = []
 
-        self._handler_stack.append({})
+        handlers = {}
 
         for obj in args:
-            if hasattr(obj, '_handler_for'):
-                members = (('', obj),)
-            else:
-                members = inspect.getmembers(obj, predicate=inspect.ismethod)
+            event = handler_event(obj)
 
-            for name, method in members:
-                if name.startswith('__'):
-                    continue
+            if event:
+                members = ((event, obj),)
+            else:
+                members = _marked_methods(obj)
 
-                event = getattr(method, '_handler_for', None)
-                if event:
-                    if isinstance(event, Event) and event.type is not None:
-                        event = event.type
-                    self._handler_stack[-1][event] = method
+            for event, method in members:
+                if isinstance(event, (Event, SlotEvent)) and event.type is not None:
+                    event = event.type
+                handlers[event] = method
 
         for event, handler in kwargs.items():
             if is_event(event):
                 event = event.type
-            self._handler_stack[-1][event] = handler
+            handlers[event] = handler
+
+        self._handler_stack.append(handlers)
+        self._handler_chains = None
 
     def pop_handlers(self):
         """Remove the top layer of event handlers from the stack
@@ -104,24 +310,113 @@ class EventDispatcher:
         :raises IndexError: if the handler stack is empty.
 
         """
-        return getattr(self, '_handler_stack', []).pop()
+        if not self._handler_stack:
+            raise IndexError("pop from empty handler stack")
+
+        self._handler_chains = None
+        return self._handler_stack.pop()
+
+    def remove_handlers(self, *args, **kwargs):
+        """Remove given event handlers from the handler stack.
+
+        Handlers are given like for `push_handlers`. Each is removed from the topmost layer,
+        which contains it. Layers left empty are removed from the stack.
+
+        """
+        handlers = []
+
+        for obj in args:
+            event = handler_event(obj)
+            handlers.extend(((event, obj),) if event else _marked_methods(obj))
+
+        for event, handler in kwargs.items():
+            handlers.append((event.type if is_event(event) else event, handler))
+
+        stack = self._handler_stack
+
+        for event, handler in handlers:
+            for i in range(len(stack) - 1, -1, -1):
+                layer = stack[i]
+
+                if layer.get(event) == handler:
+                    del layer[event]
+
+                    if not layer:
+                        # by index: list.remove would drop the first *equal* (empty) layer
+                        del stack[i]
+
+                    break
+
+        self._handler_chains = None
+
+    def _handler_chain(self, type_):
+        chains = self._handler_chains
+
+        if chains is None:
+            chains = self._handler_chains = {}
+
+        chain = chains[type_] = tuple(handlers[type_] for handlers in reversed(self._handler_stack)
+                                      if type_ in handlers)
+        return chain
 
     def dispatch(self, *events):
         """Dispatch one or more events to all matching handlers on the stack."""
-        if not hasattr(self, '_handler_stack'):
-            self._handler_stack = []
+        self.dispatch_many(events)
+
+    def dispatch_many(self, events):
+        """Dispatch all events from given iterable to all matching handlers on the stack.
 
+        Events are passed to the handlers, from the top of the stack downwards, until a handler
+        returns a true value.
+
+        """
         for event in events:
-            assert isinstance(event, Event)
-            # Search handler stack for matching event handlers
-            for handlers in reversed(self._handler_stack):
-                handler = handlers.get(event.type, None)
-                if handler:
-                    try:
-                        if handler(event):
-                            break
-                    except:
-                        log.exception("Unhandled exception in event handler %r.", handler)
+            # handlers may push or pop handlers, which resets the cache
+            chains = self._handler_chains
+            chain = chains.get(event.type) if chains is not None else None
+
+            if chain is None:
+                chain = self._handler_chain(event.type)
+
+            for handler in chain:
+                try:
+                    if handler(event):
+                        break
+                except Exception:
+                    log.exception("Unhandled exception in event handler %r.", handler)
+
+
+def _class_members(cls):
+    mro = getattr(cls, '__mro__', None)
+
+    if mro is None:
+        # MicroPython
+        for name in dir(cls):
+            yield name, getattr(cls, name, None)
+    else:
+        seen = set()
+
+        for klass in mro:
+            for name, attr in vars(klass).items():
+                if name not in seen:
+                    seen.add(name)
+                    yield name, attr
+
+
+def _marked_methods(obj):
+    """Yield (event type, bound method) for all methods of obj marked with `on_event`.
+
+    Only looks at class attributes, so properties and other attributes are not evaluated.
+
+    """
+    for name, attr in _class_members(type(obj)):
+        if name.startswith('__') or not callable(attr):
+            continue
+
+        event = handler_event(attr)
+
+        if event:
+            yield event, getattr(obj, name)
 
 
 def _test():
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# fakemixer.py
+#
+"""A fake X-AIR mixer OSC server for testing without hardware."""
+
+import argparse
+import asyncio
+import logging
+import math
+import sys
+import time
+
+from .catalog import expand_commands, parse_commands
+from .client import XREMOTE_INTERVAL
+from .meters import encode_meters
+from .osc import BUNDLE_HEADER, OSCError, decode_packet, encode_message
+
+
+log = logging.getLogger(__name__)
+
+XINFO = ('127.0.0.1', 'XR18-FAKE', 'XR18', '1.17')
+DEFAULT_VALUES = {
+    'f': 0.0,
+    'i': 0,
+    's': '',
+}
+# Number of values sent for each meter bank (16 for all others)
+METER_SIZES = {
+    0: 40,
+    1: 96,
+    2: 36,
+    3: 56,
+    4: 100,
+    5: 44,
+}
+METER_INTERVAL = 0.05
+
+
+def default_state():
+    """Return a dict with initial values for a small set of common parameters."""
+    state = {
+        '/lr/mix/fader': [('f', 0.75)],
+        '/lr/mix/on': [('i', 1)],
+    }
+
+    for ch in range(1, 17):
+        state['/ch/%02i/mix/fader' % ch] = [('f', 0.0)]
+        state['/ch/%02i/mix/on' % ch] = [('i', 1)]
+
+    return state
+
+
+def catalog_state():
+    """Return a dict with initial values for all typed parameters in the command catalog."""
+    state = default_state()
+
+    for address, cmd in expand_commands(parse_commands()).items():
+        if cmd.types in DEFAULT_VALUES and address not in state:
+            state[address] = [(cmd.types, DEFAULT_VALUES[cmd.types])]
+
+    return state
+
+
+class FakeMixer(asyncio.DatagramProtocol):
+    """Answer OSC queries from an in-memory parameter state.
+
+    Messages without arguments are treated as queries and answered with the current value of the
+    parameter, if it is in ``state``. Messages with arguments set the parameter value and are
+    forwarded to all clients, which sent an '/xremote' message within the last ten seconds.
+
+    Clients subscribed to meter banks with '/meters' receive synthetic meter values every
+    ``meter_interval`` seconds for ten seconds.
+
+    If ``accept_bundles`` is False, OSC bundles are silently ignored, like by firmware versions,
+    which do not support them.
+
+    """
+
+    def __init__(self, state=None, accept_bundles=True, meter_interval=METER_INTERVAL):
+        self.state = default_state() if state is None else state
+        self.accept_bundles = accept_bundles
+        self.meter_interval = meter_interval
+        self.received = 0
+        self.sent = 0
+        self.transport = None
+        self._xremote = {}
+        self._meters = {}
+        self._meter_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self._meter_timer is not None:
+            self._meter_timer.cancel()
+            self._meter_timer = None
+
+    def datagram_received(self, data, addr):
+        if data.startswith(BUNDLE_HEADER) and not self.accept_bundles:
+            return
+
+        try:
+            messages = decode_packet(data)
+        except OSCError as exc:
+            log.warning("Invalid OSC packet from %s:%i: %s", addr[0], addr[1], exc)
+            return
+
+        for msg in messages:
+            self.received += 1
+            self.handle_message(msg, addr)
+
+    def reply(self, addr, path, *args):
+        self.transport.sendto(encode_message(path, *args), addr)
+        self.sent += 1
+
+    def handle_message(self, msg, addr):
+        if msg.path == '/xremote':
+            self._xremote[addr] = time.monotonic() + XREMOTE_INTERVAL + 1
+        elif msg.path in ('/xinfo', '/info'):
+            self.reply(addr, msg.path, *XINFO)
+        elif msg.path == '/meters' and msg.args:
+            self.subscribe_meters(addr, msg.args[0])
+        elif not msg.args:
+            value = self.state.get(msg.path)
+
+            if value is not None:
+                self.reply(addr, msg.path, *value)
+        elif msg.path in self.state:
+            self.state[msg.path] = list(zip(msg.types, msg.args))
+            self.notify(msg, addr)
+
+    def subscribe_meters(self, addr, path):
+        try:
+            bank = int(str(path).rsplit('/', 1)[-1])
+        except ValueError:
+            log.warning("Invalid meters subscription from %s:%i: %r", addr[0], addr[1], path)
+            return
+
+        self._meters[(addr, bank)] = time.monotonic() + XREMOTE_INTERVAL + 1
+
+        if self._meter_timer is None:
+            self._meter_timer = asyncio.get_running_loop().call_soon(self.send_meters)
+
+    def meter_values(self, bank, now):
+        """Return synthetic meter values (in 1/256 dB) slowly moving between -60 and -6 dB."""
+        return [int((-33 + 27 * math.sin(now * 0.7 + i * 0.4)) * 256)
+                for i in range(METER_SIZES.get(bank, 16))]
+
+    def send_meters(self):
+        now = time.monotonic()
+        packets = {}
+
+        for (addr, bank), expires in list(self._meters.items()):
+            if expires < now:
+                del self._meters[(addr, bank)]
+                continue
+
+            data = packets.get(bank)
+
+            if data is None:
+                data = packets[bank] = encode_meters(bank, self.meter_values(bank, now))
+
+            self.transport.sendto(data, addr)
+            self.sent += 1
+
+        if self._meters:
+            loop = asyncio.get_running_loop()
+            self._meter_timer = loop.call_later(self.meter_interval, self.send_meters)
+        else:
+            self._meter_timer = None
+
+    def notify(self, msg, sender):
+        """Send parameter change to all subscribed clients except the sender."""
+        now = time.monotonic()
+        data = None
+
+        for addr, expires in list(self._xremote.items()):
+            if expires < now:
+                del self._xremote[addr]
+            elif addr != sender:
+                if data is None:
+                    data = encode_message(msg.path, *zip(msg.types, msg.args))
+
+                self.transport.sendto(data, addr)
+                self.sent += 1
+
+
+async def start_fake_mixer(host='127.0.0.1', port=10024, **kwargs):
+    """Start a fake mixer listening on given address and return (transport, protocol)."""
+    loop = asyncio.get_running_loop()
+    return await loop.create_datagram_endpoint(lambda: FakeMixer(**kwargs),
+                                               local_addr=(host, port))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-v', '--verbose', action="store_true",
+                    help="Be verbose")
+    ap.add_argument('--no-bundles', action="store_true",
+                    help="Ignore OSC bundles")
+    ap.add_argument('-c', '--catalog', action="store_true",
+                    help="Initialize state with all parameters from the command catalog")
+    ap.add_argument('-p', '--port', type=int, default=10024,
+                    help="UDP port to listen on (default: %(default)s)")
+    ap.add_argument('host', metavar="ADDRESS", nargs='?', default="127.0.0.1",
+                    help="Address to listen on (default: %(default)s)")
+
+    args = ap.parse_args(args if args is not None else sys.argv[1:])
+
+    logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    async def serve():
+        transport, _ = await start_fake_mixer(args.host, args.port,
+                                              state=catalog_state() if args.catalog else None,
+                                              accept_bundles=not args.no_bundles)
+        log.info("Fake mixer listening on %s:%i.", args.host, args.port)
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            transport.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print('')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) or 0)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# latency.py
+#
+"""A fixed-bucket histogram for latency measurements."""
+
+import bisect
+import math
+
+
+# Upper bucket bounds in milliseconds, the last bucket collects everything above
+DEFAULT_BOUNDS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class LatencyHistogram:
+    """Count latencies in buckets with fixed bounds (in milliseconds).
+
+    Recording a value is a bisection and an increment, so it can be done on the hot path.
+    Percentiles are estimated as the upper bound of the bucket containing them.
+
+    """
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Record one latency given in seconds."""
+        ms = seconds * 1000.0
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+        if ms < self.min:
+            self.min = ms
+        if ms > self.max:
+            self.max = ms
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """Return upper bucket bound (ms) below which ``pct`` percent of the values are."""
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * pct / 100.0
+        cumulative = 0
+
+        for bound, count in zip(self.bounds + (self.max,), self.counts):
+            cumulative += count
+
+            if cumulative >= threshold:
+                return min(bound, self.max)
+
+        return self.max
+
+    def summary(self):
+        """Return one line summary with count, min, mean, p50, p99 and max."""
+        if not self.count:
+            return "n=0"
+
+        return ("n=%i min=%.3f mean=%.3f p50<=%.3f p99<=%.3f max=%.3f ms" %
+                (self.count, self.min, self.mean, self.percentile(50), self.percentile(99),
+                 self.max))
+
+    def format(self, width=40):
+        """Return multi-line text rendering of the histogram."""
+        lines = [self.summary()]
+        peak = max(self.counts) or 1
+        lower = 0.0
+
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            if count:
+                label = ("%g - %g ms" % (lower, bound) if bound != math.inf
+                         else "> %g ms" % lower)
+                lines.append("%16s %8i %s" % (label, count, '#' * max(1, count * width // peak)))
+
+            lower = bound
+
+        return "\n".join(lines)
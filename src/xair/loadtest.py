@@ -0,0 +1,533 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# loadtest.py
+#
+"""Load test midi2xairosc and OSC clients over loopback, without MIDI or mixer hardware.
+
+A fake mixer with the parameter state seeded from the command catalog (``xair-cmdlist.csv``)
+listens on a loopback UDP port. MIDI events are passed to a `MidiInputHandler` for a
+midi2xairosc configuration, whose OSC messages are sent to the fake mixer through an output
+queue and client, like with ``midi2xairosc``. The events are handed to the event loop from a
+separate thread, like the rtmidi callback thread does.
+
+MIDI events are either generated with one of these patterns:
+
+``sweep``
+    all mapped controllers move up and down continuously, in turn, at a steady rate
+``burst``
+    all mapped controllers jump to new values at the same time, twice per second, with the same
+    average rate
+``random``
+    random controllers and values at random times (Poisson arrivals)
+
+or replayed from a recording (see `xair.recorder`). MIDI events are stored in recordings as
+messages to ``/midi`` with one MIDI message argument. All other messages in a recording are sent
+by the fake mixer to a client subscribed with ``/xremote``, like parameter changes made on the
+mixer, e.g. to replay a session recorded with ``xaircmd --record``.
+
+For both directions, the number of messages sent, received and lost and percentiles of the time
+from sending a MIDI event or OSC message until the resulting OSC message arrives are reported.
+Messages replaced by a newer value in the output queue of midi2xairosc are counted as
+coalesced, not as lost. With ``--max-loss`` and ``--max-p99``, the program exits with an error, if
+a limit is exceeded, e.g. for regression tests.
+
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import random
+import sys
+import time
+
+from collections import deque
+
+from .client import XAirClient
+from .fakemixer import FakeMixer, catalog_state
+from .latency import LatencyHistogram
+from .osc import encode_message
+from .oscqueue import OSCOutputQueue, is_continuous
+from .recorder import Recorder, RecordingReader
+
+try:
+    from .midi2xairosc import SINGLE_DATA_STATUS, MidiInputHandler, read_config
+except ImportError:
+    MidiInputHandler = read_config = None
+    # program change and channel pressure
+    SINGLE_DATA_STATUS = (0xC0, 0xD0)
+
+
+log = logging.getLogger(__name__)
+
+PATTERNS = ('sweep', 'burst', 'random')
+MIDI_PATH = '/midi'
+BURST_INTERVAL = 0.5
+# Time to wait for outstanding messages after the last one was sent
+SETTLE_TIME = 0.5
+
+
+def mapped_controllers(commands):
+    """Return ``(status byte, data1)`` of commands with an OSC message and a fixed data1 value.
+
+    For commands matching any channel, the status byte for channel 1 is used.
+
+    """
+    controllers = []
+
+    for cmd in commands:
+        if cmd.osc and isinstance(cmd.data, int) and cmd.status < 0xF0:
+            controller = (cmd.status_bytes()[0], cmd.data)
+
+            if controller not in controllers:
+                controllers.append(controller)
+
+    return controllers
+
+
+def generate_events(pattern, controllers, rate, duration, seed=0):
+    """Yield ``(time, MIDI message)`` tuples for given pattern in order of time.
+
+    Times are given in seconds from the start. ``rate`` is the average number of events per
+    second.
+
+    """
+    if pattern not in PATTERNS:
+        raise ValueError("Unknown pattern '%s', must be one of: %s" %
+                         (pattern, ", ".join(PATTERNS)))
+
+    if not controllers:
+        raise ValueError("No controllers to generate events for.")
+
+    count = int(rate * duration)
+    rnd = random.Random(seed)
+
+    if pattern == 'sweep':
+        for n in range(count):
+            status, data1 = controllers[n % len(controllers)]
+            offset = n / rate
+            # triangle wave with a period of two seconds, shifted for each controller
+            phase = (offset / 2.0 + n % len(controllers) / len(controllers)) % 1.0
+            yield offset, [status, data1, int(127 * (1 - abs(2 * phase - 1)))]
+    elif pattern == 'burst':
+        size = max(1, int(rate * BURST_INTERVAL))
+
+        for n in range(count):
+            status, data1 = controllers[n % len(controllers)]
+            yield n // size * BURST_INTERVAL, [status, data1, rnd.randrange(128)]
+    else:
+        offset = 0.0
+
+        for n in range(count):
+            offset += rnd.expovariate(rate)
+
+            if offset >= duration:
+                break
+
+            status, data1 = rnd.choice(controllers)
+            yield offset, [status, data1, rnd.randrange(128)]
+
+
+def write_session(filename, midi_events, start=None):
+    """Append ``(time, MIDI message)`` tuples to a recording as ``/midi`` messages."""
+    if start is None:
+        start = time.time()
+
+    with Recorder(filename) as recorder:
+        for offset, message in midi_events:
+            message = list(message[:3]) + [0] * (3 - len(message[:3]))
+            recorder.write(MIDI_PATH, 'm', [[0] + message], start + offset)
+
+    return recorder.records
+
+
+def read_session(filename):
+    """Read a recording and return lists of MIDI events and OSC messages.
+
+    Returns a ``(midi_events, messages)`` tuple with lists of ``(time, MIDI message)`` and
+    ``(time, OSCMessage)`` tuples, with times in seconds from the start of the recording.
+
+    """
+    midi_events = []
+    messages = []
+
+    with RecordingReader(filename) as reader:
+        start = reader.start_time
+
+        for timestamp, msg in reader.read():
+            if msg.path == MIDI_PATH and msg.types == 'm':
+                message = list(msg.args[0][1:])
+
+                if message[0] & 0xF0 in SINGLE_DATA_STATUS:
+                    del message[2]
+
+                midi_events.append((timestamp - start, message))
+            else:
+                messages.append((timestamp - start, msg))
+
+    return midi_events, messages
+
+
+class Probe:
+    """Count messages and measure their latency by matching encoded messages sent and received.
+
+    `sent` is called with the address and data of each message and the time its cause was sent,
+    `received` with each message arriving at the receiver. Messages, which do not match a message
+    sent, are only counted as ``unexpected``. Messages to the same address are
+    expected to arrive in order. Those sent before the one received, which did not arrive, are
+    counted as ``superseded``, e.g. if they were coalesced.
+
+    If the same data was sent several times, a received message is matched to the oldest one
+    or, if it was sent with ``coalesce=True``, i.e. only the newest value may be sent on, to the
+    newest one.
+
+    """
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.sent_count = 0
+        self.received_count = 0
+        self.unexpected = 0
+        self.superseded = 0
+        self._pending = {}
+
+    def sent(self, path, data, timestamp, coalesce=False):
+        self.sent_count += 1
+        self._pending.setdefault(path, deque()).append((data, timestamp, coalesce))
+
+    def received(self, path, data):
+        pending = self._pending.get(path)
+        matches = [index for index, item in enumerate(pending or ()) if item[0] == data]
+
+        if not matches:
+            self.unexpected += 1
+            return
+
+        self.received_count += 1
+        index = matches[-1] if pending[matches[0]][2] else matches[0]
+        timestamp = pending[index][1]
+        self.superseded += index
+
+        for _ in range(index + 1):
+            pending.popleft()
+
+        self.histogram.add(time.perf_counter() - timestamp)
+
+    @property
+    def unmatched(self):
+        """Number of messages sent, which did not arrive (yet)."""
+        return sum(len(pending) for pending in self._pending.values())
+
+
+class TracingSender:
+    """Pass OSC messages on to ``sender`` and register them with a `Probe`.
+
+    The time is taken from ``clock``, which returns the time the MIDI event currently handled was
+    sent.
+
+    """
+
+    def __init__(self, sender, probe, clock):
+        self.sender = sender
+        self.probe = probe
+        self.clock = clock
+
+    def send(self, path, *args):
+        self.probe.sent(path, encode_message(path, *args), self.clock(), is_continuous(args))
+        self.sender.send(path, *args)
+
+
+class ProbeMixer(FakeMixer):
+    """A `FakeMixer`, which passes each parameter change it receives to ``probe.received``."""
+
+    def __init__(self, probe, **kwargs):
+        super().__init__(**kwargs)
+        self.probe = probe
+
+    def handle_message(self, msg, addr):
+        super().handle_message(msg, addr)
+
+        if msg.args and msg.path != '/meters':
+            self.probe.received(msg.path, encode_message(msg.path, *zip(msg.types, msg.args)))
+
+    def replay(self, msg):
+        """Apply given parameter change as if made on the mixer and notify subscribed clients."""
+        if msg.path in self.state:
+            self.state[msg.path] = list(zip(msg.types, msg.args))
+
+        self.notify(msg, None)
+
+
+def produce(loop, callback, events, speed=1.0):
+    """Pass ``(time, item)`` tuples to ``callback(item, sent)`` on the event loop in real time.
+
+    Runs on the calling thread until all events are handed over and returns the max. delay of
+    handing over an event after its time.
+
+    """
+    start = time.perf_counter()
+    lag = 0.0
+
+    for offset, item in events:
+        due = start + offset / speed
+        now = time.perf_counter()
+
+        if due > now:
+            time.sleep(due - now)
+            now = time.perf_counter()
+
+        lag = max(lag, now - due)
+        loop.call_soon_threadsafe(callback, item, now)
+
+    return lag
+
+
+class LoadTest:
+    """Run MIDI events and OSC messages through midi2xairosc and a client over loopback.
+
+    ``config`` is the filename of a midi2xairosc configuration or None, if only OSC messages are
+    replayed. ``rate`` and ``address_rate`` are the limits of the OSC output queue.
+
+    """
+
+    def __init__(self, config=None, rate=500.0, address_rate=50.0, bundles=True, state=None):
+        if config is not None and MidiInputHandler is None:
+            raise ImportError("Running MIDI events requires the dependencies of midi2xairosc.")
+
+        self.config = None if config is None else read_config(config)
+        self.rate = rate
+        self.address_rate = address_rate
+        self.bundles = bundles
+        self.state = catalog_state() if state is None else state
+        self.midi = Probe()
+        self.osc = Probe()
+        self.midi_sent = 0
+        self.osc_sent = 0
+        self.elapsed = 0.0
+        self.lag = 0.0
+        self.handler = None
+        self.queue = None
+        self._transport = None
+        self._mixer = None
+        self._client = None
+        self._monitor = None
+        self._event_time = 0.0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._transport, self._mixer = await loop.create_datagram_endpoint(
+            lambda: ProbeMixer(self.midi, state=self.state, accept_bundles=self.bundles),
+            local_addr=('127.0.0.1', 0))
+        port = self._transport.get_extra_info('sockname')[1]
+
+        if self.config is not None:
+            self._client = await XAirClient('127.0.0.1', port).connect()
+            self._client.bundler.use_bundles = self.bundles
+            self.queue = OSCOutputQueue(self._client.bundler, rate=self.rate,
+                                        address_rate=self.address_rate)
+            sender = TracingSender(self.queue, self.midi, lambda: self._event_time)
+            self.handler = MidiInputHandler('loadtest', self.config, sender,
+                                            call_later=loop.call_later)
+
+        # receives the replayed parameter changes, like xaircmd or the midi2xairosc feedback
+        self._monitor = await XAirClient('127.0.0.1', port).connect()
+        self._monitor.send('/xremote')
+        await self._monitor.query('/xinfo')
+        self._monitor.add_handler(self._osc_received)
+        return self
+
+    def close(self):
+        for client in (self._client, self._monitor):
+            if client is not None:
+                client.close()
+
+        if self._transport is not None:
+            self._transport.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def controllers(self):
+        """Return the controllers mapped to OSC messages in the configuration."""
+        return [] if self.config is None else mapped_controllers(self.config.commands)
+
+    def _feed(self, message, sent):
+        self.midi_sent += 1
+        self._event_time = sent
+        self.handler((message, 0.0))
+
+    def _replay(self, msg, sent):
+        self.osc_sent += 1
+        self.osc.sent(msg.path, encode_message(msg.path, *zip(msg.types, msg.args)), sent)
+        self._mixer.replay(msg)
+
+    def _osc_received(self, msg):
+        if msg.args:
+            self.osc.received(msg.path, encode_message(msg.path, *zip(msg.types, msg.args)))
+
+    async def run(self, midi_events=(), messages=(), speed=1.0):
+        """Send MIDI events and OSC messages at their times and wait for the results."""
+        loop = asyncio.get_running_loop()
+        runner = None if self.queue is None else asyncio.ensure_future(self.queue.run())
+        start = time.perf_counter()
+        midi_events = list(midi_events)
+        messages = list(messages)
+
+        if midi_events and self.handler is None:
+            raise ValueError("MIDI events given without a configuration.")
+
+        try:
+            lags = await asyncio.gather(
+                loop.run_in_executor(None, produce, loop, self._feed, midi_events, speed),
+                loop.run_in_executor(None, produce, loop, self._replay, messages, speed))
+            self.lag = max(self.lag, *lags)
+            self.elapsed += time.perf_counter() - start
+            await asyncio.sleep(SETTLE_TIME)
+        finally:
+            if runner is not None:
+                runner.cancel()
+
+    def stats(self):
+        """Return dict with the results for MIDI events (``midi``) and OSC messages (``osc``)."""
+        elapsed = self.elapsed or math.inf
+        queue = self.queue.stats() if self.queue is not None else dict(sent=0, coalesced=0)
+        midi = dict(events=self.midi_sent, handled=0 if self.handler is None else
+                    self.handler.events, messages=self.midi.sent_count,
+                    coalesced=queue['coalesced'], sent=queue['sent'],
+                    received=self.midi.received_count, latency=self.midi.histogram)
+        midi['lost'] = midi['events'] - midi['handled'] + midi['sent'] - midi['received']
+        osc = dict(sent=self.osc_sent, received=self.osc.received_count,
+                   lost=self.osc_sent - self.osc.received_count, latency=self.osc.histogram)
+
+        for result in (midi, osc):
+            result['throughput'] = result['received'] / elapsed
+
+        return dict(midi=midi, osc=osc, elapsed=self.elapsed, lag=self.lag)
+
+    def report(self):
+        """Return the results as text."""
+        stats = self.stats()
+        midi = stats['midi']
+        osc = stats['osc']
+        lines = ["Elapsed: %.2f s, max. lag of sending: %.1f ms" %
+                 (stats['elapsed'], stats['lag'] * 1e3)]
+
+        if midi['events']:
+            lines.append("MIDI events sent: %(events)i, handled: %(handled)i, OSC messages: "
+                         "%(messages)i, coalesced: %(coalesced)i, sent: %(sent)i, received: "
+                         "%(received)i, lost: %(lost)i, throughput: %(throughput).0f/s" % midi)
+            lines.append("MIDI to OSC latency: " + format_latency(midi['latency']))
+
+        if osc['sent']:
+            lines.append("OSC messages replayed: %(sent)i, received: %(received)i, lost: "
+                         "%(lost)i, throughput: %(throughput).0f/s" % osc)
+            lines.append("OSC latency: " + format_latency(osc['latency']))
+
+        return "\n".join(lines)
+
+
+def format_latency(histogram):
+    """Return one line summary of a `LatencyHistogram` with the p50, p90, p99 and p99.9."""
+    if not histogram.count:
+        return "n=0"
+
+    return ("n=%i min=%.3f mean=%.3f p50<=%.3f p90<=%.3f p99<=%.3f p99.9<=%.3f max=%.3f ms" %
+            (histogram.count, histogram.min, histogram.mean, histogram.percentile(50),
+             histogram.percentile(90), histogram.percentile(99), histogram.percentile(99.9),
+             histogram.max))
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-p', '--pattern', choices=PATTERNS, default='sweep',
+                    help="Pattern of generated MIDI events (default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=200.0,
+                    help="Generated MIDI events per second (default: %(default)s)")
+    ap.add_argument('-d', '--duration', type=float, default=10.0,
+                    help="Duration of generated MIDI events in seconds (default: %(default)s)")
+    ap.add_argument('--seed', type=int, default=0,
+                    help="Seed for random values (default: %(default)s)")
+    ap.add_argument('-R', '--replay', metavar="FILE",
+                    help="Replay MIDI events and OSC messages from recording instead of "
+                         "generating MIDI events")
+    ap.add_argument('--speed', type=float, default=1.0,
+                    help="Speed factor for sending events (default: %(default)s)")
+    ap.add_argument('-s', '--save', metavar="FILE",
+                    help="Append generated MIDI events to recording for later replay")
+    ap.add_argument('--osc-rate', type=float, default=500.0,
+                    help="Max. number of OSC messages sent per second (default: %(default)s)")
+    ap.add_argument('--address-rate', type=float, default=50.0,
+                    help="Max. number of messages per second sent to the same address of a "
+                         "continuous parameter (default: %(default)s)")
+    ap.add_argument('-n', '--no-bundles', action="store_true",
+                    help="Send each OSC message in a packet of its own")
+    ap.add_argument('--max-loss', type=int,
+                    help="Exit with an error, if more messages are lost")
+    ap.add_argument('--max-p99', type=float, metavar="MS",
+                    help="Exit with an error, if the 99th latency percentile is higher")
+    ap.add_argument('-v', '--verbose', action="store_true",
+                    help="Be verbose")
+    ap.add_argument('config', metavar="CONFIG", nargs='?',
+                    help="midi2xairosc configuration file (may be omitted when replaying only "
+                         "OSC messages)")
+
+    args = ap.parse_args(args if args is not None else sys.argv[1:])
+
+    logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    try:
+        test = LoadTest(args.config, rate=args.osc_rate, address_rate=args.address_rate,
+                        bundles=not args.no_bundles)
+    except (IOError, ImportError) as exc:
+        return "Could not set up load test: %s" % exc
+
+    messages = []
+
+    try:
+        if args.replay:
+            midi_events, messages = read_session(args.replay)
+        elif args.config is None:
+            return "A configuration or a recording to replay is required."
+        else:
+            midi_events = list(generate_events(args.pattern, test.controllers(), args.rate,
+                                               args.duration, args.seed))
+
+            if args.save:
+                write_session(args.save, midi_events)
+    except (IOError, ValueError) as exc:
+        return "Could not prepare events: %s" % exc
+
+    if midi_events and args.config is None:
+        log.warning("No configuration given, ignoring %i MIDI events.", len(midi_events))
+        midi_events = []
+
+    log.info("Sending %i MIDI events and %i OSC messages.", len(midi_events), len(messages))
+
+    async def run():
+        async with test:
+            await test.run(midi_events, messages, args.speed)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print('')
+
+    print(test.report())
+    stats = test.stats()
+    lost = stats['midi']['lost'] + stats['osc']['lost']
+    p99 = max(result['latency'].percentile(99) for result in (stats['midi'], stats['osc']))
+
+    if args.max_loss is not None and lost > args.max_loss:
+        return "Too many messages lost: %i > %i" % (lost, args.max_loss)
+
+    if args.max_p99 is not None and p99 > args.max_p99:
+        return "Latency too high: p99 %.3f ms > %.3f ms" % (p99, args.max_p99)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) or 0)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+# meters.py
+#
+"""Subscription to and decoding of the mixer's level meter streams.
+
+After a client sent ``/meters ,s /meters/N``, the mixer sends the values of meter bank ``N``
+about every 50 ms for ten seconds as OSC messages with address ``/meters/N`` and one blob
+argument. The blob contains the number of values as a little-endian 32-bit integer, followed by
+the values as little-endian signed 16-bit integers in units of 1/256 dB.
+
+Blobs are decoded without copying into a ``memoryview`` of the packet data and each packet is
+published as one `MeterEvent`. If NumPy is installed, the conversion to dB is vectorized.
+
+"""
+
+import asyncio
+import logging
+import struct
+import sys
+import time
+
+from array import array
+
+from .client import XREMOTE_INTERVAL
+from .events import EventDispatcher, SlotEvent
+from .osc import OSCError, encode_message
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+log = logging.getLogger(__name__)
+
+METERS_PREFIX = b'/meters/'
+# Meter values are in units of 1/256 dB
+DB_PER_UNIT = 1.0 / 256
+
+_int32 = struct.Struct('>i')
+_uint32le = struct.Struct('<I')
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def decode_meters(data):
+    """Decode a meters packet and return the bank number and the raw values.
+
+    The values are returned as a memoryview of signed 16-bit integers, which refers to the
+    packet data, i.e. nothing is copied (except on big-endian hosts).
+
+    :raises OSCError: if the packet is not a valid meters message.
+
+    """
+    try:
+        end = data.index(b'\0', len(METERS_PREFIX))
+        bank = int(data[len(METERS_PREFIX):end])
+        pos = (end + 4) & ~3
+
+        if data[pos:pos + 4] != b',b\0\0':
+            raise OSCError("Not a meters message: %r" % bytes(data[:pos + 4]))
+
+        size = _int32.unpack_from(data, pos + 4)[0]
+        count = _uint32le.unpack_from(data, pos + 8)[0]
+    except (ValueError, struct.error) as exc:
+        raise OSCError("Malformed meters message: %s" % exc)
+
+    start = pos + 12
+    end = start + count * 2
+
+    if count * 2 + 4 > size or end > len(data):
+        raise OSCError("Truncated meters blob: %i values in %i bytes" % (count, size))
+
+    view = memoryview(data)[start:end]
+
+    if _BIG_ENDIAN:
+        values = array('h', view.tobytes())
+        values.byteswap()
+        return bank, memoryview(values)
+
+    return bank, view.cast('h')
+
+
+def encode_meters(bank, values):
+    """Encode meters message for given bank and raw values (in 1/256 dB)."""
+    values = array('h', values)
+
+    if _BIG_ENDIAN:
+        values.byteswap()
+
+    return encode_message('/meters/%i' % bank,
+                          ('b', _uint32le.pack(len(values)) + values.tobytes()))
+
+
+def to_db(values):
+    """Convert raw meter values to dB.
+
+    Returns a NumPy float32 array, if NumPy is installed, otherwise a list of floats.
+
+    """
+    if numpy is not None:
+        return numpy.frombuffer(values, dtype=numpy.int16) * numpy.float32(DB_PER_UNIT)
+
+    scale = DB_PER_UNIT
+    return [value * scale for value in values]
+
+
+class MeterEvent(SlotEvent):
+    """All meter values of one bank received in one packet.
+
+    ``values`` is a memoryview of the raw signed 16-bit values (1/256 dB), which is only valid as
+    long as the event is referenced. Use `db` to get the values in dB.
+
+    """
+    type = 'meters'
+    __slots__ = ('bank', 'values', 'timestamp')
+
+    def db(self):
+        return to_db(self.values)
+
+
+class Meters(EventDispatcher):
+    """Subscribe to meter banks and dispatch a `MeterEvent` for each received meters packet.
+
+    Meter packets are taken from the client before they are decoded as generic OSC messages.
+    While running, subscriptions are renewed every ``renew_interval`` seconds.
+
+    """
+
+    def __init__(self, client, banks=(), renew_interval=XREMOTE_INTERVAL, clock=time.monotonic):
+        self.client = client
+        self.banks = set(banks)
+        self.renew_interval = renew_interval
+        self.clock = clock
+        self.frames = 0
+        self.errors = 0
+        self._renew_task = None
+
+    def start(self):
+        """Start receiving meter packets and renewing subscriptions."""
+        if self._renew_task is None:
+            self.client.add_raw_handler(self._received, METERS_PREFIX)
+            self._renew_task = asyncio.ensure_future(self._renew())
+
+    def stop(self):
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            self._renew_task = None
+            self.client.remove_raw_handler(self._received, METERS_PREFIX)
+
+    def subscribe(self, bank):
+        self.banks.add(bank)
+
+        if self._renew_task is not None:
+            self._send_subscription(bank)
+
+    def unsubscribe(self, bank):
+        """Stop renewing the subscription to given bank, so it expires."""
+        self.banks.discard(bank)
+
+    def stats(self):
+        return dict(frames=self.frames, errors=self.errors, banks=sorted(self.banks))
+
+    def _send_subscription(self, bank):
+        try:
+            self.client.send('/meters', '/meters/%i' % bank)
+        except OSCError as exc:
+            log.warning("Could not renew meters subscription for bank %i: %s", bank, exc)
+
+    async def _renew(self):
+        while True:
+            for bank in sorted(self.banks):
+                self._send_subscription(bank)
+
+            await asyncio.sleep(self.renew_interval)
+
+    def _received(self, data, addr):
+        try:
+            bank, values = decode_meters(data)
+        except OSCError as exc:
+            self.errors += 1
+            log.debug("Invalid meters packet from %s:%i: %s", addr[0], addr[1], exc)
+            return
+
+        self.frames += 1
+        self.dispatch(MeterEvent(bank, values, self.clock()))
+
+
+def _test():
+    from .client import XAirClient
+    from .fakemixer import start_fake_mixer
+
+    def on_meters(event):
+        db = event.db()
+        print("/meters/%i: %i values, max %.1f dB" % (event.bank, len(db), max(db)))
+
+    async def test():
+        transport, mixer = await start_fake_mixer('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+
+        async with XAirClient('127.0.0.1', port) as client:
+            meters = Meters(client, banks=(0, 2))
+            meters.push_handlers(meters=on_meters)
+            meters.start()
+            await asyncio.sleep(0.3)
+            meters.stop()
+            print(meters.stats())
+
+        transport.close()
+
+    asyncio.run(test())
+
+
+if __name__ == '__main__':
+    _test()
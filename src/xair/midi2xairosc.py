@@ -2,25 +2,112 @@
 #
 # midi2xairosc.py
 #
-"""Bridge MIDI commands to Behringer X-Air / MIDAS M-AIR OSC commands."""
+"""Bridge MIDI commands to Behringer X-Air / MIDAS M-AIR OSC commands.
+
+Each entry in the YAML configuration maps a MIDI event to either an external
+command (``command``), which is run in a sub-process, or an OSC message
+(``osc``), which is sent directly to the mixer over a persistent UDP socket::
+
+    - name: Channel 1 fader
+      status: controllerchange
+      channel: 1
+      data: 7
+      osc: /ch/01/mix/fader
+      args: ['f:data2']
+
+Each OSC argument is given as ``TYPE:SOURCE``, where ``TYPE`` is an OSC type
+tag (``i``, ``f`` or ``s``) and ``SOURCE`` is either one of ``channel``,
+``status``, ``data1``, ``data2`` or ``value`` or a literal value. Event values
+converted to type ``f`` are scaled from 0..127 to 0.0..1.0.
+
+A ``transform`` maps the raw MIDI value to ``value`` with a curve (see
+`xair.transform`), optionally combining 14-bit values from an MSB/LSB
+controller pair (the LSB controller defaults to ``data`` + 32) or a pitch bend
+message, or decoding an NRPN parameter::
+
+    - name: Channel 1 fader
+      status: controllerchange
+      channel: 1
+      data: 7
+      osc: /ch/01/mix/fader
+      args: ['f:value']
+      transform: {curve: db, min: -60, max: 10, mode: 14bit}
+
+    - name: Channel 1 EQ 1 frequency
+      status: controllerchange
+      channel: 1
+      osc: /ch/01/eq/1/f
+      args: ['f:value']
+      transform: {curve: linear, mode: nrpn, nrpn: 0x0101}
+
+Curves are computed into lookup tables when the configuration is loaded, so
+converting a value is a single table lookup.
+
+Several MIDI input ports can be opened by repeating ``--port`` and further
+mixers can be added with ``--mixer NAME=HOST[:PORT]``. A command with a
+``port`` key only handles events from MIDI input ports whose name contains the
+given string and a command with a ``mixer`` key sends its OSC message to the
+mixer with that name instead of the one given with ``--server``::
+
+    - name: Monitor mix fader
+      port: nanoKONTROL
+      mixer: monitors
+      status: controllerchange
+      channel: 1
+      data: 0
+      osc: /bus/1/mix/fader
+      args: ['f:data2']
+
+All ports and mixers are served by one event loop. Each mixer has one UDP
+socket and output queue of its own, which are shared by all MIDI ports.
+
+With ``--watch``, the configuration file is checked for changes periodically
+and re-read without closing the MIDI ports. The new configuration is built in
+a worker thread and then replaces the active one at once. If it cannot be read,
+the active configuration is kept.
+
+OSC messages pass through a rate-limited output queue. Messages with only float
+arguments (faders, pan etc.) are coalesced per address, i.e. only the newest
+pending value is sent, while all other messages are sent in order. All messages
+due in one flush tick are packed into as few OSC bundles as possible.
+
+With ``--feedback``, parameter changes received from the mixer are mapped back
+through the same configuration to MIDI messages sent to a MIDI output, e.g. to
+move motorized faders or switch LEDs, when a parameter is changed on the mixer
+or in another app. A command is used for feedback if it has a fixed channel, a
+fixed controller or note number (unless the status has only one data byte) and
+exactly one OSC argument taken from ``data1``, ``data2`` or a 7-bit ``value``.
+Set ``feedback: false`` to exclude a command. Feedback is suppressed if the
+controller already shows the value and, for ``--hold`` seconds, after MIDI
+input from the controller, so values sent by this program do not bounce back.
+Output is coalesced per controller and rate-limited, so it does not saturate a
+DIN MIDI link.
+
+"""
 
 import argparse
+import asyncio
 import logging
+import os
 import shlex
 import subprocess
 import sys
 import time
 
-from functools import lru_cache
+from functools import partial
 from os.path import exists
 
-import liblo
 import rtmidi
 import yaml
-from rtmidi.midiutil import open_midiinput
+from rtmidi.midiutil import open_midiinput, open_midioutput
 from rtmidi.midiconstants import (CHANNEL_PRESSURE, CONTROLLER_CHANGE, NOTE_ON, NOTE_OFF,
                                   PITCH_BEND, POLY_PRESSURE, PROGRAM_CHANGE)
 
+from .client import XAirClient
+from .osc import OSCError
+from .oscqueue import OSCOutputQueue
+from .transform import DATA_ENTRY_MSB, NRPN_CONTROLLERS, MSBLSBMerger, NRPNDecoder, Transform
+
 
 log = logging.getLogger('midi2xairosc')
 BACKEND_MAP = {
@@ -40,33 +127,655 @@ STATUS_MAP = {
 }
 
 
+EVENT_FIELDS = ('channel', 'status', 'data1', 'data2', 'value')
+# Channel messages with only one data byte
+SINGLE_DATA_STATUS = (PROGRAM_CHANGE, CHANNEL_PRESSURE)
+OSC_TYPES = {
+    'i': int,
+    'f': float,
+    's': str,
+}
+# OSC argument values for event values (data bytes, channel and status) by OSC type tag
+FIELD_TABLES = {
+    'i': tuple(range(256)),
+    'f': tuple(min(1.0, value / 127) for value in range(256)),
+    's': tuple(str(value) for value in range(256)),
+}
+
+
+def parse_osc_arg(spec):
+    """Parse an OSC argument spec of the form 'TYPE:SOURCE'.
+
+    Returns a ``(typetag, field, value)`` tuple, where ``field`` is the name of the MIDI event
+    field to take the argument value from or ``None``, if ``value`` is a literal.
+
+    """
+    try:
+        typetag, source = str(spec).split(':', 1)
+        conv = OSC_TYPES[typetag]
+    except (KeyError, ValueError):
+        raise ValueError("Invalid OSC argument specification: %r" % spec)
+
+    if source in EVENT_FIELDS:
+        return (typetag, source, None)
+
+    return (typetag, None, conv(source))
+
+
+def parse_mixer(spec):
+    """Parse a mixer specification of the form 'NAME=HOST[:PORT]'.
+
+    Returns a ``(name, host, port)`` tuple. The port defaults to 10024.
+
+    """
+    name, sep, address = str(spec).partition('=')
+    host, _, port = address.partition(':')
+
+    try:
+        if not (sep and name and host):
+            raise ValueError
+
+        port = int(port) if port else 10024
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid mixer specification, must be "
+                                         "NAME=HOST[:PORT]: %s" % spec)
+
+    return name, host, port
+
+
+def parse_status(status):
+    """Return MIDI status byte for given status name or number.
+
+    Names are looked up (case-insensitively) in ``STATUS_MAP``, numbers may be given as integers
+    or as strings in any notation understood by ``int(x, 0)``, e.g. ``'0xB0'``. The channel nibble
+    of channel message status bytes is masked off.
+
+    """
+    if isinstance(status, str):
+        value = STATUS_MAP.get(status.strip().lower())
+
+        if value is None:
+            try:
+                value = int(status, 0)
+            except ValueError:
+                raise ValueError("Unknown status '%s'." % status)
+    else:
+        value = int(status)
+
+    if not 0x80 <= value <= 0xFF:
+        raise ValueError("Invalid status byte: %r" % status)
+
+    return value & 0xF0 if value < 0xF0 else value
+
+
 class Command(object):
     def __init__(self, name='', description='', status=0xB0, channel=None, data=None,
-                 command=None):
+                 command=None, osc=None, args=None, feedback=True, transform=None, port=None,
+                 mixer=None):
         self.name = name
         self.description = description
-        self.status = status
+        self.port = None if port is None else str(port)
+        self.mixer = None if mixer is None else str(mixer)
+        self.status = parse_status(status)
         self.channel = channel
         self.command = command
+        self.osc = osc
+        self.args = [parse_osc_arg(arg) for arg in args or ()]
+        self.feedback = feedback
 
-        if data is None or isinstance(data, int):
-            self.data = data
-        elif hasattr(data, 'split'):
-            self.data = map(int, data.split())
-        else:
+        if osc is not None and not osc.startswith('/'):
+            raise ValueError("OSC address must start with a slash: %s" % osc)
+
+        if hasattr(data, 'split'):
+            data = [int(value) for value in data.split()]
+
+        if isinstance(data, (list, tuple)):
+            if not 1 <= len(data) <= 2:
+                raise ValueError("'data' field must contain one or two values.")
+
+            data = tuple(int(value) for value in data)
+
+            if len(data) == 1:
+                data = data[0]
+        elif data is not None and not isinstance(data, int):
             raise TypeError("Could not parse 'data' field.")
 
+        self.data = data
+
+        if transform is None and any(field == 'value' for _, field, _ in self.args):
+            transform = {}
+
+        self.transform = None if transform is None else Transform(**transform)
+
+        if self.transform is not None:
+            self._check_transform()
+
+        self.build_args = self.compile_args()
+
+    def _check_transform(self):
+        mode = self.transform.mode
+
+        if mode == 'nrpn' and self.status != CONTROLLER_CHANGE:
+            raise ValueError("Transform mode 'nrpn' requires status 'controllerchange'.")
+        elif mode == '14bit' and self.status == CONTROLLER_CHANGE:
+            if not isinstance(self.data, int) or not 0 <= self.data < 32:
+                raise ValueError("Transform mode '14bit' requires an MSB controller number "
+                                 "(0..31) as 'data'.")
+
+            if self.transform.lsb is None:
+                self.transform.lsb = self.data + 32
+        elif mode == '14bit' and self.status != PITCH_BEND:
+            raise ValueError("Transform mode '14bit' requires status 'controllerchange' or "
+                             "'pitchbend'.")
+
+    def compile_args(self):
+        """Return a function, which builds the OSC arguments from a dict of event values.
+
+        Event values are converted to argument values by looking them up in precomputed tables.
+
+        """
+        getters = []
+
+        for typetag, field, value in self.args:
+            if field is None:
+                getters.append(lambda values, arg=(typetag, value): arg)
+                continue
+
+            if field == 'value':
+                table = self.transform.table_for(typetag)
+            else:
+                table = FIELD_TABLES[typetag]
+
+            getters.append(lambda values, typetag=typetag, field=field, table=table:
+                           (typetag, table[values[field] or 0]))
+
+        return lambda values: [get(values) for get in getters]
+
+    def status_bytes(self):
+        """Return list of MIDI status bytes, which this command matches."""
+        if self.status >= 0xF0:
+            return [self.status]
+        elif self.channel is None:
+            return [self.status | ch for ch in range(16)]
+        else:
+            return [self.status | (self.channel - 1) & 0xF]
+
+
+def build_dispatch_table(commands):
+    """Build an index for constant-time lookup of the command matching a MIDI event.
+
+    The table maps ``(status_byte, data1)`` tuples to dicts, which map ``data2`` to the matching
+    command, with the ``None`` key matching any ``data2`` value. Commands without data and
+    commands without a channel are expanded to all data byte values resp. all channels. When
+    several commands match the same event, the one which comes first in ``commands`` wins.
+
+    """
+    table = {}
+
+    for cmd in commands:
+        transform = cmd.transform
+
+        if transform is not None and transform.mode == 'nrpn':
+            # dispatched by the NRPN decoders
+            continue
+
+        if cmd.data is None:
+            data1_values = range(128)
+        elif transform is not None and transform.lsb is not None:
+            data1_values = (cmd.data, transform.lsb)
+        elif isinstance(cmd.data, int):
+            data1_values = (cmd.data,)
+        else:
+            data1_values = (cmd.data[0],)
+
+        for status in cmd.status_bytes():
+            # Events without data bytes match any command for their status
+            table.setdefault((status, None), {}).setdefault(None, cmd)
+
+            for data1 in data1_values:
+                entry = table.setdefault((status, data1), {})
+
+                if isinstance(cmd.data, tuple):
+                    # An earlier command matching any data2 value takes precedence
+                    if None not in entry:
+                        entry.setdefault(cmd.data[1], cmd)
+                else:
+                    entry.setdefault(None, cmd)
+
+    return table
+
+
+def build_nrpn_table(commands):
+    """Build an index mapping ``(status_byte, parameter number)`` to NRPN commands.
+
+    Like for `build_dispatch_table`, the first of several matching commands wins.
+
+    """
+    table = {}
+
+    for cmd in commands:
+        if cmd.transform is not None and cmd.transform.mode == 'nrpn':
+            for status in cmd.status_bytes():
+                table.setdefault((status, cmd.transform.nrpn), cmd)
+
+    return table
+
+
+class MappingConfig(object):
+    """The commands of a configuration and the tables for looking them up by MIDI event.
+
+    Instances are not changed after creation, so they can be built in one thread and used in
+    another.
+
+    """
+
+    def __init__(self, commands=(), filename=None):
+        self.commands = list(commands)
+        self.filename = filename
+        self.dispatch_table = build_dispatch_table(self.commands)
+        self.nrpn_table = build_nrpn_table(self.commands)
+        # LSB timeout of the NRPN decoder for each status byte with NRPN commands
+        self.nrpn_timeouts = {status: cmd.transform.timeout
+                              for (status, _), cmd in reversed(list(self.nrpn_table.items()))}
+
+    def for_port(self, port):
+        """Return configuration with the commands handling events from the given MIDI port.
+
+        These are all commands without a ``port`` and those whose ``port`` is contained in the
+        port name. The commands are shared, not copied.
+
+        """
+        if all(cmd.port is None for cmd in self.commands):
+            return self
+
+        return MappingConfig([cmd for cmd in self.commands
+                              if cmd.port is None or cmd.port in port], self.filename)
+
+
+def read_config(filename, mixers=None):
+    """Read commands from given YAML configuration file and return a `MappingConfig`.
+
+    If a collection of mixer names is given as ``mixers``, the ``mixer`` of each command must be
+    one of them.
+
+    :raises IOError: if the file cannot be read or parsed or contains an invalid command.
+
+    """
+    if not exists(filename):
+        raise IOError("Config file not found: %s" % filename)
+
+    try:
+        with open(filename) as patch:
+            data = yaml.safe_load(patch)
+    except yaml.YAMLError as exc:
+        raise IOError("Could not parse config file: %s" % exc)
+
+    if not isinstance(data, list):
+        raise IOError("Config file must contain a list of command specifications.")
+
+    commands = []
+
+    for cmdspec in data:
+        try:
+            if isinstance(cmdspec, dict) and ('command' in cmdspec or 'osc' in cmdspec):
+                cmd = Command(**cmdspec)
+            elif isinstance(cmdspec, (list, tuple)) and len(cmdspec) >= 2:
+                cmd = Command(*cmdspec)
+            else:
+                raise ValueError("Not a command specification: %r" % cmdspec)
+        except (TypeError, ValueError) as exc:
+            log.debug(cmdspec)
+            raise IOError("Invalid command specification: %s" % exc)
+        else:
+            if mixers is not None and cmd.mixer is not None and cmd.mixer not in mixers:
+                raise IOError("Unknown mixer '%s' in command '%s'." % (cmd.mixer, cmd.name))
+
+            log.debug("Config: %s\n%s\n", cmd.name, cmd.description)
+            commands.append(cmd)
+
+    return MappingConfig(commands, filename)
+
+
+class ConfigWatcher(object):
+    """Re-read a configuration file, when it changes, and activate it in MidiInputHandler instances.
+
+    The file's modification time and size are checked every ``interval`` seconds. The file is
+    read with ``loader(filename)`` and the lookup tables for the port of each handler are built
+    in a worker thread of the event loop, while the handlers keep handling MIDI events with the
+    active configuration. If the file cannot be read, the active configuration is kept.
+    ``on_reload(config)`` is called after a new configuration was activated. No MIDI events are
+    lost while reloading, only values of 14-bit and NRPN commands, for which the MSB but not yet
+    the LSB was received, are dropped on activation (see `MidiInputHandler.set_config`).
+
+    """
+
+    def __init__(self, filename, handlers, interval=1.0, on_reload=None, loader=read_config):
+        self.filename = filename
+        self.handlers = list(handlers)
+        self.interval = interval
+        self.on_reload = on_reload
+        self.loader = loader
+        self.reloads = 0
+        self.errors = 0
+        self.build_time = None
+        self.swap_time = None
+        self.max_swap_time = 0.0
+        self.dropped = 0
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def check(self):
+        """Reload the configuration, if the file changed since the last check."""
+        stamp = self._file_stamp()
+
+        if stamp is None or stamp == self._stamp:
+            return False
+
+        self._stamp = stamp
+        return await self.reload()
+
+    def _build(self):
+        config = self.loader(self.filename)
+        return config, [config.for_port(handler.port) for handler in self.handlers]
+
+    async def reload(self):
+        """Read the configuration in a worker thread and activate it, if successful."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        try:
+            config, port_configs = await loop.run_in_executor(None, self._build)
+        except IOError as exc:
+            self.errors += 1
+            log.error("Could not reload configuration, keeping the active one: %s", exc)
+            return False
+
+        built = time.perf_counter()
+        dropped = 0
+
+        for handler, port_config in zip(self.handlers, port_configs):
+            dropped += handler.set_config(port_config)
+
+        if self.on_reload is not None:
+            self.on_reload(config)
+
+        self.swap_time = time.perf_counter() - built
+        self.max_swap_time = max(self.max_swap_time, self.swap_time)
+        self.build_time = built - start
+        self.dropped += dropped
+        self.reloads += 1
+        log.info("Reloaded configuration with %i commands in %.1f ms (swap: %.1f us, %i pending "
+                 "14-bit values dropped).", len(config.commands), self.build_time * 1e3,
+                 self.swap_time * 1e6, dropped)
+        return True
+
+    def stats(self):
+        return dict(reloads=self.reloads, errors=self.errors, build_time=self.build_time,
+                    swap_time=self.swap_time, max_swap_time=self.max_swap_time,
+                    dropped=self.dropped)
+
+
+def feedback_mapping(cmd):
+    """Return how to map the OSC message of a command back to a MIDI message.
+
+    Returns a ``(status_byte, data1, index, convert)`` tuple, where ``index`` is the position of
+    the OSC argument, which is converted to the variable MIDI data byte by ``convert(value)``, or
+    None, if the command does not map to exactly one MIDI message.
+
+    """
+    if cmd.osc is None or not cmd.feedback or cmd.channel is None or cmd.status >= 0xF0:
+        return None
+
+    sources = [(index, typetag, field) for index, (typetag, field, _) in enumerate(cmd.args)
+               if field in ('data1', 'data2', 'value')]
+
+    if len(sources) != 1:
+        return None
+
+    index, typetag, field = sources[0]
+    status = cmd.status | (cmd.channel - 1) & 0xF
+
+    if field != 'value':
+        convert = partial(midi_value, typetag)
+    elif cmd.transform.mode == '7bit':
+        field, convert = cmd.transform.source, cmd.transform.inverse
+    else:
+        return None
+
+    if cmd.status in SINGLE_DATA_STATUS:
+        return (status, None, index, convert) if field == 'data1' else None
+    elif field == 'data2' and isinstance(cmd.data, int):
+        return (status, cmd.data, index, convert)
+    elif field == 'data2' and cmd.data is None and cmd.status == PITCH_BEND:
+        return (status, 0, index, convert)
+
+    return None
+
+
+def build_feedback_table(commands):
+    """Build an index mapping mixer names and OSC addresses to the feedback mappings of all
+    matching commands.
+
+    Commands, for which `feedback_mapping` returns None, are skipped.
+
+    """
+    table = {}
+
+    for cmd in commands:
+        mapping = feedback_mapping(cmd)
+
+        if mapping is None:
+            if cmd.osc is not None and cmd.feedback:
+                log.debug("No MIDI feedback for command '%s'.", cmd.name)
+        else:
+            table.setdefault((cmd.mixer, cmd.osc), []).append(mapping)
+
+    return table
+
+
+def midi_value(typetag, value):
+    """Convert an OSC argument value to a MIDI data byte value (the reverse of `do_osc`)."""
+    if typetag == 'f':
+        value = round(float(value) * 127)
+
+    return max(0, min(127, int(value)))
+
+
+class MidiSender:
+    """Pass messages from an `OSCOutputQueue` to an rtmidi ``MidiOut`` instance.
+
+    The queue is used with the controller (status byte and controller or note number) as the
+    address and the MIDI message as the only argument.
+
+    """
+
+    def __init__(self, midiout):
+        self.midiout = midiout
+        self.bytes_sent = 0
+
+    def send(self, controller, message):
+        self.midiout.send_message(message)
+        self.bytes_sent += len(message)
+
+
+class MidiFeedback:
+    """Send mixer parameter changes as MIDI messages to the controllers mapped to them.
+
+    ``output`` is an `OSCOutputQueue` with a `MidiSender`. `osc_received` must be registered as a
+    handler for all messages received from each mixer, with the mixer's name as used in the
+    configuration (None for the default mixer), and `midi_received` be called with each MIDI
+    event received from the controller.
+
+    Feedback is suppressed if it equals the last value received from or sent to the controller.
+    Within ``hold`` seconds after MIDI input from a controller, feedback for it is held back and
+    only the newest value is sent after that time, if it differs from the controller value.
+    Held values are released by timers set with ``call_later(delay, func)`` (default: the
+    ``call_later`` method of the running event loop).
+
+    """
+
+    def __init__(self, commands, output, hold=0.5, clock=time.monotonic, call_later=None):
+        self.table = build_feedback_table(commands)
+        self.output = output
+        self.hold = hold
+        self.clock = clock
+        self.call_later = call_later
+        self.received = 0
+        self.suppressed = 0
+        self._values = {}
+        self._touched = {}
+        self._held = {}
+
+    def set_commands(self, commands):
+        """Replace the feedback mappings, e.g. after the configuration was reloaded."""
+        self.table = build_feedback_table(commands)
+
+    def addresses(self, mixer=None):
+        """Return list of all OSC addresses of given mixer mapped to MIDI feedback."""
+        return [path for name, path in self.table if name == mixer]
+
+    def midi_received(self, event):
+        """Remember the value and time of a MIDI event received from a controller."""
+        if len(event) >= 3:
+            # feedback only sets the MSB of pitch bend
+            data1 = 0 if event[0] & 0xF0 == PITCH_BEND else event[1]
+            controller, value = (event[0], data1), event[2]
+        elif len(event) == 2:
+            controller, value = (event[0], None), event[1]
+        else:
+            return
+
+        self._values[controller] = value
+        self._touched[controller] = self.clock()
+
+    def osc_received(self, msg, mixer=None):
+        mappings = self.table.get((mixer, msg.path))
+
+        if not mappings:
+            return
+
+        self.received += 1
+
+        for status, data1, index, convert in mappings:
+            try:
+                value = convert(msg.args[index])
+            except (IndexError, TypeError, ValueError):
+                log.debug("Cannot map %s %r to MIDI.", msg.path, msg.args)
+                continue
+
+            controller = (status, data1)
+
+            if controller in self._held:
+                self._held[controller] = value
+                continue
+
+            touched = self._touched.get(controller)
+            delay = 0.0 if touched is None else touched + self.hold - self.clock()
+
+            if delay > 0:
+                self._held[controller] = value
+                self._call_later(delay, partial(self._release, controller))
+            else:
+                self._send(controller, value)
+
+    def _call_later(self, delay, func):
+        call_later = self.call_later or asyncio.get_running_loop().call_later
+        call_later(delay, func)
+
+    def _release(self, controller):
+        value = self._held.pop(controller, None)
+
+        if value is None:
+            return
+
+        touched = self._touched.get(controller)
+        delay = touched + self.hold - self.clock()
+
+        if delay > 0:
+            # controller was moved again while the feedback was held
+            self._held[controller] = value
+            self._call_later(delay, partial(self._release, controller))
+        else:
+            self._send(controller, value)
+
+    def _send(self, controller, value):
+        if self._values.get(controller) == value:
+            self.suppressed += 1
+            return
+
+        self._values[controller] = value
+        status, data1 = controller
+        message = [status, value] if data1 is None else [status, data1, value]
+        self.output.send(controller, message, coalesce=True)
+
+    def stats(self):
+        return dict(received=self.received, suppressed=self.suppressed, held=len(self._held),
+                    **self.output.stats())
+
 
 class MidiInputHandler(object):
-    def __init__(self, port, config):
+    """Look up the command for each MIDI event and send its OSC message or run it.
+
+    ``call_later(delay, func)`` (e.g. ``loop.call_later``) is used for the LSB timeout of 14-bit
+    and NRPN values. Without it, an MSB is passed on without waiting for the LSB.
+
+    ``config`` is the filename of a configuration file or a `MappingConfig` instance. OSC messages
+    of commands with a ``mixer`` are sent to the sender with this name in the dict ``mixers``, all
+    others to ``osc``.
+
+    """
+
+    def __init__(self, port, config, osc=None, feedback=None, call_later=None, mixers=None):
         self.port = port
+        self.osc = osc
+        self.mixers = {} if mixers is None else mixers
+        self.feedback = feedback
+        self.call_later = call_later
+        self.config = MappingConfig()
+        self.events = 0
+        self.unmatched = 0
+        self.messages = 0
+        self.dropped = 0
+        self._mergers = {}
+        self._nrpn_decoders = {}
         self._wallclock = time.time()
-        self.commands = dict()
-        self.load_config(config)
+
+        if isinstance(config, MappingConfig):
+            self.set_config(config)
+        else:
+            self.load_config(config)
+
+    @property
+    def commands(self):
+        return self.config.commands
+
+    @property
+    def dispatch_table(self):
+        return self.config.dispatch_table
+
+    def stats(self):
+        """Return dict with the number of MIDI events handled, of those matching no command, of
+        OSC messages sent and of pending 14-bit values dropped by configuration changes."""
+        return dict(events=self.events, unmatched=self.unmatched, messages=self.messages,
+                    dropped=self.dropped)
 
     def __call__(self, event, data=None):
         event, deltatime = event
         self._wallclock += deltatime
+        self.events += 1
+        config = self.config
 
         if event[0] < 0xF0:
             channel = (event[0] & 0xF) + 1
@@ -86,30 +795,43 @@ class MidiInputHandler(object):
         log.debug("[%s] @%i CH:%2s %02X %s %s", self.port, self._wallclock,
                   channel or '-', status, data1, data2 or '')
 
+        if self.feedback is not None:
+            self.feedback.midi_received(event)
+
+        if (status == CONTROLLER_CHANGE and data1 in NRPN_CONTROLLERS and
+                event[0] in config.nrpn_timeouts):
+            decoder = self._nrpn_decoders.get(event[0])
+
+            if decoder is None:
+                decoder = self._nrpn_decoders[event[0]] = NRPNDecoder(
+                    partial(self._nrpn_received, event[0]), config.nrpn_timeouts[event[0]],
+                    self.call_later)
+
+            decoder.feed(data1, data2)
+            return
+
         # Look for matching command definitions
-        cmd = self.lookup_command(status, channel, data1, data2)
-
-        if cmd:
-            cmdline = cmd.command % dict(
-                channel=channel,
-                data1=data1,
-                data2=data2,
-                status=status)
-            self.do_command(cmdline)
-
-    @lru_cache()
-    def lookup_command(self, status, channel, data1, data2):
-        for cmd in self.commands.get(status, []):
-            if channel is not None and cmd.channel != channel:
-                continue
+        cmd = self.lookup_command(event[0], data1, data2, config)
+
+        if cmd is None:
+            self.unmatched += 1
+        else:
+            values = dict(channel=channel, data1=data1, data2=data2, status=status)
+
+            if cmd.transform is not None:
+                self.do_transform(cmd, event[0], values)
+            elif cmd.osc:
+                self.do_osc(cmd, values)
+            else:
+                self.do_command(cmd.command % values)
 
-            if (data1 is None and data2 is None) or cmd.data is None:
-                return cmd
-            elif isinstance(cmd.data, int) and cmd.data == data1:
-                return cmd
-            elif (isinstance(cmd.data, (list, tuple)) and
-                    cmd.data[0] == data1 and cmd.data[1] == data2):
-                return cmd
+    def lookup_command(self, status, data1=None, data2=None, config=None):
+        """Return the command matching the given MIDI status byte and data bytes or None."""
+        entry = (self.config if config is None else config).dispatch_table.get((status, data1))
+
+        if entry:
+            cmd = entry.get(data2)
+            return entry.get(None) if cmd is None else cmd
 
     def do_command(self, cmdline):
         log.info("Calling external command: %s", cmdline)
@@ -119,85 +841,315 @@ class MidiInputHandler(object):
         except:
             log.exception("Error calling external command.")
 
-    def load_config(self, filename):
-        if not exists(filename):
-            raise IOError("Config file not found: %s" % filename)
+    def do_transform(self, cmd, status_byte, values):
+        """Pass the raw value of the event to `do_value` once it is complete."""
+        transform = cmd.transform
 
-        with open(filename) as patch:
-            data = yaml.load(patch)
+        if transform.mode == '7bit':
+            self.do_value(cmd, values, values[transform.source] or 0)
+        elif values['status'] == PITCH_BEND:
+            self.do_value(cmd, values, (values['data2'] or 0) << 7 | (values['data1'] or 0))
+        else:
+            merger = self._mergers.get((status_byte, cmd))
 
-        for cmdspec in data:
-            try:
-                if isinstance(cmdspec, dict) and 'command' in cmdspec:
-                    cmd = Command(**cmdspec)
-                elif len(cmdspec) >= 2:
-                    cmd = Command(*cmdspec)
-            except (TypeError, ValueError) as exc:
-                log.debug(cmdspec)
-                raise IOError("Invalid command specification: %s" % exc)
+            if merger is None:
+                callback = partial(self._merged, cmd, values['channel'], values['status'])
+                merger = self._mergers[(status_byte, cmd)] = MSBLSBMerger(
+                    callback, transform.timeout, self.call_later)
+
+            if values['data1'] == transform.lsb:
+                merger.lsb_received(values['data2'])
             else:
-                status = STATUS_MAP.get(cmd.status.strip().lower())
+                merger.msb_received(values['data2'])
 
-                if status is None:
-                    try:
-                        int(cmd.status)
-                    except:
-                        log.error("Unknown status '%s'. Ignoring command",
-                                  cmd.status)
+    def _merged(self, cmd, channel, status, value):
+        values = dict(channel=channel, data1=cmd.data, data2=value >> 7, status=status)
+        self.do_value(cmd, values, value)
 
-                log.debug("Config: %s\n%s\n", cmd.name, cmd.description)
-                self.commands.setdefault(status, []).append(cmd)
+    def _nrpn_received(self, status_byte, param, value):
+        cmd = self.config.nrpn_table.get((status_byte, param))
 
+        if cmd is not None:
+            values = dict(channel=(status_byte & 0xF) + 1, data1=DATA_ENTRY_MSB,
+                          data2=value >> 7, status=CONTROLLER_CHANGE)
+            self.do_value(cmd, values, value)
 
-def main(args=None):
-    """Main program function.
+    def do_value(self, cmd, values, raw):
+        """Run command with given raw value converted by its transform."""
+        values['value'] = raw
 
-    Parses command line (parsed via ``args`` or from ``sys.argv``), detects
-    and optionally lists MIDI input ports, opens given MIDI input port,
-    and attaches MIDI input handler object.
+        if cmd.osc:
+            self.do_osc(cmd, values)
+        else:
+            values['value'] = cmd.transform.table[raw]
+            self.do_command(cmd.command % values)
 
-    """
+    def do_osc(self, cmd, values):
+        args = cmd.build_args(values)
+        log.debug("OSC SEND: %s %r", cmd.osc, args)
+        osc = self.osc if cmd.mixer is None else self.mixers.get(cmd.mixer)
+
+        if osc is None:
+            log.warning("No OSC destination configured. Ignoring command '%s'.", cmd.name)
+            return
+
+        try:
+            osc.send(cmd.osc, *args)
+        except (IOError, OSCError) as exc:
+            log.error("Error sending OSC message: %s", exc)
+        else:
+            self.messages += 1
+
+    def load_config(self, filename):
+        """Read configuration file and replace the active configuration with it.
+
+        :raises IOError: if the file cannot be read, the active configuration is kept.
+
+        """
+        self.set_config(read_config(filename).for_port(self.port))
+
+    def set_config(self, config):
+        """Replace the active configuration with given `MappingConfig`.
+
+        The configuration is replaced by a single assignment, so each event is looked up either
+        in the old or the new configuration, also when called from another thread. 14-bit and
+        NRPN values, for which only the MSB was received, are discarded with the old commands.
+        Returns the number of discarded values.
+
+        """
+        pending = list(self._mergers.values()) + list(self._nrpn_decoders.values())
+        self.config = config
+        self._mergers = {}
+        self._nrpn_decoders = {}
+        dropped = sum(1 for merger in pending if merger.discard())
+        self.dropped += dropped
+        return dropped
+
+
+def build_parser():
+    """Return the command line argument parser."""
     parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
     padd = parser.add_argument
     padd('-b', '--backend', choices=sorted(BACKEND_MAP),
          help='MIDI backend API (default: OS dependant)')
-    padd('-p', '--port',
-         help='MIDI input port name or number (default: open virtual input)')
+    padd('-p', '--port', action='append',
+         help='MIDI input port name or number, may be given several times '
+              '(default: open virtual input)')
+    padd('-s', '--server', default='192.168.1.1',
+         help="Hostname or IP address of X-AIR's UDP server (default: %(default)s)")
+    padd('-o', '--oscport', type=int, default=10024,
+         help="UDP destination port of the X-AIR's server (default: %(default)s)")
+    padd('-m', '--mixer', action='append', type=parse_mixer, default=[],
+         metavar="NAME=HOST[:PORT]",
+         help="Add a mixer for commands with 'mixer: NAME', may be given several times")
+    padd('-r', '--rate', type=float, default=500.0,
+         help="Max. number of OSC messages sent per second (default: %(default)s)")
+    padd('-a', '--address-rate', type=float, default=50.0,
+         help="Max. number of messages per second sent to the same address of a continuous "
+              "parameter, e.g. a fader (default: %(default)s)")
+    padd('-n', '--no-bundles', action="store_true",
+         help="Send each OSC message in a packet of its own instead of using OSC bundles")
+    padd('-f', '--feedback', nargs='?', default=False, metavar="PORT",
+         help="Send mixer parameter changes to given MIDI output port name or number "
+              "(default without PORT: open virtual output)")
+    padd('--feedback-rate', type=float, default=500.0,
+         help="Max. number of MIDI feedback messages sent per second (default: %(default)s, "
+              "about half of the bandwidth of a DIN MIDI link)")
+    padd('--controller-rate', type=float, default=25.0,
+         help="Max. number of MIDI feedback messages per second sent to the same controller "
+              "(default: %(default)s)")
+    padd('--hold', type=float, default=0.5,
+         help="Hold back feedback to a controller for given number of seconds after it sent "
+              "MIDI input (default: %(default)s)")
+    padd('-w', '--watch', action="store_true",
+         help="Reload the configuration file when it changes")
+    padd('--watch-interval', type=float, default=1.0,
+         help="Seconds between checks of the configuration file for changes "
+              "(default: %(default)s)")
     padd('-v', '--verbose',
          action="store_true", help='verbose output')
     padd(dest='config', metavar="CONFIG",
          help='Configuration file in YAML syntax.')
+    return parser
+
+
+def main(args=None):
+    """Main program function.
 
-    args = parser.parse_args(args if args is not None else sys.argv[1:])
+    Parses command line (parsed via ``args`` or from ``sys.argv``), detects
+    and optionally lists MIDI input ports, opens given MIDI input ports,
+    and attaches a MIDI input handler object to each.
+
+    """
+    args = build_parser().parse_args(args if args is not None else sys.argv[1:])
 
     logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s",
                         level=logging.DEBUG if args.verbose else logging.INFO)
 
+    midiins = []
+    midiout = None
+
     try:
-        midiin, port_name = open_midiinput(
-            args.port,
-            use_virtual=True,
-            api=BACKEND_MAP.get(args.backend, rtmidi.API_UNSPECIFIED),
-            client_name='midi2xairosc',
-            port_name='MIDI input')
-    except (IOError, ValueError) as exc:
-        return "Could not open MIDI input: %s" % exc
+        for port in args.port or [None]:
+            try:
+                midiins.append(open_midiinput(
+                    port,
+                    use_virtual=True,
+                    api=BACKEND_MAP.get(args.backend, rtmidi.API_UNSPECIFIED),
+                    client_name='midi2xairosc',
+                    port_name='MIDI input'))
+            except (IOError, ValueError) as exc:
+                return "Could not open MIDI input: %s" % exc
+
+        if args.feedback is not False:
+            try:
+                midiout, _ = open_midioutput(
+                    args.feedback,
+                    use_virtual=True,
+                    api=BACKEND_MAP.get(args.backend, rtmidi.API_UNSPECIFIED),
+                    client_name='midi2xairosc',
+                    port_name='MIDI feedback')
+            except (IOError, ValueError) as exc:
+                return "Could not open MIDI output: %s" % exc
+
+        log.info("Entering main loop. Press Control-C to exit.")
+        return asyncio.run(run_bridge(midiins, args, midiout))
     except (EOFError, KeyboardInterrupt):
-        return
+        print('')
+    finally:
+        for midiin, _ in midiins:
+            midiin.close_port()
+
+        del midiins
+
+        if midiout is not None:
+            midiout.close_port()
+            del midiout
+
+
+async def run_bridge(midiins, args, midiout=None):
+    """Pass MIDI input to the handlers and send resulting OSC messages until cancelled.
+
+    ``midiins`` is a list of ``(midiin, port_name)`` tuples. Each MIDI input port gets a handler
+    of its own. MIDI events are received on the rtmidi callback threads and handed over to the
+    event loop, so the handlers, output queues and OSC clients all run on the event loop thread.
+    Each mixer (the one given with ``args.server`` and those in ``args.mixer``) has one OSC client
+    and output queue, shared by all handlers.
+
+    If ``midiout`` is given, mixer parameter changes are sent to it as MIDI feedback.
+
+    If ``args.watch`` is set, the configuration file is reloaded when it changes.
+
+    """
+    loop = asyncio.get_running_loop()
+    # mixer name -> (host, port), the mixer without a name is the default one
+    mixers = {None: (args.server, args.oscport)}
+    mixers.update((name, (host, port)) for name, host, port in args.mixer)
+
+    try:
+        config = read_config(args.config, mixers)
+    except IOError as exc:
+        return "Could not load configuration: %s" % exc
 
-    log.debug("Attaching MIDI input handler.")
-    midiin.set_callback(MidiInputHandler(port_name, args.config))
+    clients = {}
 
-    log.info("Entering main loop. Press Control-C to exit.")
     try:
-        # just wait for keyboard interrupt in main thread
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print('')
+        for name, (host, port) in mixers.items():
+            clients[name] = await XAirClient(host, port).connect()
+    except OSError as exc:
+        for client in clients.values():
+            client.close()
+
+        return "Invalid OSC destination: %s" % exc
+
+    if args.no_bundles:
+        bundles = [False] * len(clients)
+    else:
+        bundles = await asyncio.gather(*(client.probe_bundles() for client in clients.values()))
+
+    queues = {}
+
+    for (name, client), use_bundles in zip(clients.items(), bundles):
+        if not use_bundles:
+            if not args.no_bundles:
+                log.warning("No reply to bundled OSC query from %s:%i. Not using OSC bundles.",
+                            client.server, client.port)
+
+            client.bundler.use_bundles = False
+
+        queues[name] = OSCOutputQueue(client.bundler, rate=args.rate,
+                                      address_rate=args.address_rate)
+
+    handlers = [MidiInputHandler(port_name, config.for_port(port_name), queues[None],
+                                 call_later=loop.call_later, mixers=queues)
+                for _, port_name in midiins]
+    feedback = None
+    tasks = [queue.run() for queue in queues.values()]
+
+    if midiout is not None:
+        output = OSCOutputQueue(MidiSender(midiout), rate=args.feedback_rate,
+                                address_rate=args.controller_rate)
+        feedback = MidiFeedback(config.commands, output, hold=args.hold,
+                                call_later=loop.call_later)
+        tasks.append(output.run())
+
+        for handler in handlers:
+            handler.feedback = feedback
+
+        for name, client in clients.items():
+            client.add_handler(partial(feedback.osc_received, mixer=name))
+            client.start_keepalive()
+            # replies to the queries are passed to the feedback handler like parameter changes
+            tasks.append(client.query_many(feedback.addresses(name)))
+
+    watcher = None
+
+    if args.watch:
+        def reloaded(config):
+            if feedback is not None:
+                feedback.set_commands(config.commands)
+
+                # get current values of parameters added to the configuration
+                for name, client in clients.items():
+                    asyncio.ensure_future(client.query_many(feedback.addresses(name)))
+
+        watcher = ConfigWatcher(args.config, handlers, args.watch_interval, reloaded,
+                                loader=partial(read_config, mixers=mixers))
+        tasks.append(watcher.run())
+
+    log.debug("Attaching MIDI input handlers.")
+
+    for (midiin, _), handler in zip(midiins, handlers):
+        midiin.set_callback(lambda event, handler: loop.call_soon_threadsafe(handler, event),
+                            handler)
+
+    try:
+        await asyncio.gather(*tasks)
     finally:
-        midiin.close_port()
-        del midiin
+        for midiin, _ in midiins:
+            midiin.cancel_callback()
+
+        for handler in handlers:
+            log.info("MIDI input '%s' - events received: %i, unmatched: %i, OSC messages: %i",
+                     handler.port, handler.events, handler.unmatched, handler.messages)
+
+        for name, client in clients.items():
+            queue = queues[name]
+            queue.drain()
+            client.close()
+            stats = queue.stats()
+            log.info("Mixer %s (%s:%i) - OSC messages sent: %i, coalesced: %i, UDP packets "
+                     "sent: %i", name or 'default', client.server, client.port, stats['sent'],
+                     stats['coalesced'], client.bundler.packets_sent)
+
+        if feedback is not None:
+            log.info("MIDI feedback received: %(received)i, sent: %(sent)i, coalesced: "
+                     "%(coalesced)i, suppressed: %(suppressed)i", feedback.stats())
+
+        if watcher is not None:
+            log.info("Configuration reloads: %(reloads)i, failed: %(errors)i, max. swap time: "
+                     "%(max_swap_time).6f s, pending 14-bit values dropped: %(dropped)i",
+                     watcher.stats())
 
 
 if __name__ == '__main__':
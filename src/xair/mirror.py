@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# mirror.py
+#
+"""An in-memory mirror of the mixer parameter state kept current via subscriptions."""
+
+import asyncio
+import logging
+import time
+
+from collections import namedtuple
+
+from .client import XREMOTE_INTERVAL
+from .osc import OSCError, OSCMessage, typetag
+
+
+log = logging.getLogger(__name__)
+
+MirrorEntry = namedtuple('MirrorEntry', 'msg,timestamp')
+
+
+class StateMirror:
+    """Keep a tree of the last known values of mixer parameters.
+
+    The mirror registers with the client to receive all incoming messages and applies them to
+    a tree of nested dicts, one level per address segment, with `MirrorEntry` leaves holding the
+    message and the time it was received. While running, it sends '/xremote' and renews all
+    subscriptions added with `subscribe` every ``renew_interval`` seconds, before they expire.
+
+    """
+
+    def __init__(self, client, max_age=5.0, renew_interval=XREMOTE_INTERVAL,
+                 clock=time.monotonic):
+        self.client = client
+        self.max_age = max_age
+        self.renew_interval = renew_interval
+        self.clock = clock
+        self.tree = {}
+        self.updates = 0
+        self._subscriptions = {}
+        self._renew_task = None
+
+    def start(self):
+        """Start receiving updates and renewing subscriptions."""
+        if self._renew_task is None:
+            self.client.add_handler(self.update)
+            self._renew_task = asyncio.ensure_future(self._renew())
+
+    def stop(self):
+        if self._renew_task is not None:
+            self._renew_task.cancel()
+            self._renew_task = None
+            self.client.remove_handler(self.update)
+
+    def subscribe(self, path, rate=1):
+        """Subscribe to updates of given address at given rate (in units of ~0.5 Hz)."""
+        self._subscriptions[path] = rate
+
+        if self._renew_task is not None:
+            self._send_subscription(path, rate)
+
+    def unsubscribe(self, path):
+        self._subscriptions.pop(path, None)
+
+    def _send_subscription(self, path, rate):
+        try:
+            self.client.send('/subscribe', path, rate)
+        except OSCError as exc:
+            log.warning("Could not renew subscription for %s: %s", path, exc)
+
+    async def _renew(self):
+        while True:
+            try:
+                self.client.send('/xremote')
+            except OSCError as exc:
+                log.warning("Could not send /xremote: %s", exc)
+
+            for path, rate in self._subscriptions.items():
+                self._send_subscription(path, rate)
+
+            await asyncio.sleep(self.renew_interval)
+
+    def update(self, msg, timestamp=None):
+        """Apply received message (or a value sent by us) to the tree."""
+        if not msg.args or not msg.path.startswith('/'):
+            return
+
+        node = self.tree
+        *parents, leaf = msg.path[1:].split('/')
+
+        for segment in parents:
+            child = node.get(segment)
+
+            if not isinstance(child, dict):
+                child = node[segment] = {}
+
+            node = child
+
+        node[leaf] = MirrorEntry(msg, self.clock() if timestamp is None else timestamp)
+        self.updates += 1
+
+    def set(self, path, *args):
+        """Record a value we sent to the mixer, since it does not echo our own changes back."""
+        try:
+            args = [arg if isinstance(arg, tuple) else (typetag(arg), arg) for arg in args]
+        except OSCError:
+            self.invalidate(path)
+        else:
+            self.update(OSCMessage(path, ''.join(tag for tag, _ in args),
+                                   [value for _, value in args]))
+
+    def entry(self, path):
+        """Return `MirrorEntry` for given address or None, if no value is known."""
+        node = self.tree
+
+        for segment in path[1:].split('/'):
+            if not isinstance(node, dict):
+                return None
+
+            node = node.get(segment)
+
+            if node is None:
+                return None
+
+        return node if isinstance(node, MirrorEntry) else None
+
+    def age(self, path):
+        """Return seconds since the value for given address was received or None."""
+        entry = self.entry(path)
+        return None if entry is None else self.clock() - entry.timestamp
+
+    def get(self, path, max_age=None):
+        """Return last received message for given address if it is not older than ``max_age``.
+
+        Returns None if there is no value for the address or it is stale.
+
+        """
+        entry = self.entry(path)
+        max_age = self.max_age if max_age is None else max_age
+
+        if entry is not None and self.clock() - entry.timestamp <= max_age:
+            return entry.msg
+
+    def invalidate(self, path):
+        """Remove the value for given address from the tree."""
+        *parents, leaf = path[1:].split('/')
+        node = self.tree
+
+        for segment in parents:
+            node = node.get(segment)
+
+            if not isinstance(node, dict):
+                return
+
+        node.pop(leaf, None)
+
+    def items(self, prefix='/'):
+        """Yield ``(address, entry)`` tuples for all values below given address prefix."""
+        node = self.tree
+        segments = [segment for segment in prefix.split('/') if segment]
+
+        for segment in segments:
+            node = node.get(segment) if isinstance(node, dict) else None
+
+            if node is None:
+                return
+
+        stack = [('/' + '/'.join(segments), node)]
+
+        while stack:
+            path, node = stack.pop()
+
+            if isinstance(node, MirrorEntry):
+                yield path, node
+            else:
+                base = path.rstrip('/')
+                stack.extend((base + '/' + segment, child)
+                             for segment, child in sorted(node.items(), reverse=True))
+
+    async def read(self, path, max_age=None, timeout=None):
+        """Return value for given address from the mirror if fresh, otherwise query the mixer."""
+        msg = self.get(path, max_age)
+
+        if msg is None:
+            # the client passes the reply to update() as well
+            msg = await self.client.query(path, timeout=timeout)
+
+        return msg
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+# osc.py
+#
+"""Encoding and decoding of OSC messages and bundles and a bundling OSC sender."""
+
+import struct
+
+from collections import namedtuple
+
+
+# Max. UDP payload size for an ethernet MTU of 1500 bytes (minus IPv4 and UDP headers)
+DEFAULT_MTU = 1472
+BUNDLE_HEADER = b'#bundle\0'
+# OSC time tag with special meaning "immediately"
+IMMEDIATELY = 1
+
+_int32 = struct.Struct('>i')
+_uint64 = struct.Struct('>Q')
+_ARG_DECODERS = {
+    'i': struct.Struct('>i'),
+    'f': struct.Struct('>f'),
+    'h': struct.Struct('>q'),
+    'd': struct.Struct('>d'),
+    't': _uint64,
+    'r': struct.Struct('>I'),
+}
+_ARG_CONSTANTS = {
+    'T': True,
+    'F': False,
+    'N': None,
+    'I': float('inf'),
+}
+_ARG_ENCODERS = {
+    'i': struct.Struct('>i').pack,
+    'f': struct.Struct('>f').pack,
+    'h': struct.Struct('>q').pack,
+    'd': struct.Struct('>d').pack,
+    'c': lambda value: _int32.pack(ord(value)),
+}
+
+
+OSCMessage = namedtuple('OSCMessage', 'path,types,args')
+
+
+class OSCError(Exception):
+    """Raised when an OSC message cannot be encoded or decoded."""
+
+
+def encode_string(value):
+    """Encode given str or bytes as NUL-terminated string padded to a multiple of four bytes."""
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+
+    return value + b'\0' * (4 - len(value) % 4)
+
+
+def encode_blob(value):
+    """Encode given bytes as OSC blob (size followed by data padded to a multiple of four)."""
+    size = len(value)
+    return _int32.pack(size) + bytes(value) + b'\0' * (-size % 4)
+
+
+def typetag(value):
+    """Return the OSC type tag for given Python value."""
+    if value is True:
+        return 'T'
+    elif value is False:
+        return 'F'
+    elif value is None:
+        return 'N'
+    elif isinstance(value, int):
+        return 'i'
+    elif isinstance(value, float):
+        return 'f'
+    elif isinstance(value, str):
+        return 's'
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return 'b'
+
+    raise OSCError("Unsupported OSC argument type: %r" % type(value))
+
+
+def encode_message(path, *args):
+    """Encode OSC message with given address and arguments.
+
+    Arguments may be given either as plain Python values, whose OSC type is derived with
+    `typetag`, or as ``(typetag, value)`` tuples.
+
+    """
+    tags = [',']
+    data = []
+
+    for arg in args:
+        if isinstance(arg, tuple):
+            tag, value = arg
+        else:
+            tag, value = typetag(arg), arg
+
+        tags.append(tag)
+
+        try:
+            if tag in 'TFNI':
+                continue
+            elif tag == 's' or tag == 'S':
+                data.append(encode_string(value))
+            elif tag == 'b':
+                data.append(encode_blob(value))
+            else:
+                data.append(_ARG_ENCODERS[tag](value))
+        except (KeyError, TypeError, struct.error) as exc:
+            raise OSCError("Could not encode argument %r with type tag '%s': %s" %
+                           (value, tag, exc))
+
+    return encode_string(path) + encode_string(''.join(tags)) + b''.join(data)
+
+
+def encode_bundle(elements, timetag=IMMEDIATELY):
+    """Encode OSC bundle from given list of encoded messages or bundles."""
+    data = [BUNDLE_HEADER, _uint64.pack(timetag)]
+
+    for element in elements:
+        data.append(_int32.pack(len(element)))
+        data.append(element)
+
+    return b''.join(data)
+
+
+def decode_string(data, pos=0):
+    """Decode NUL-terminated string at given position.
+
+    Returns the string and the position after the padding following it.
+
+    """
+    end = data.index(b'\0', pos)
+    return data[pos:end].decode('utf-8', errors='replace'), (end + 4) & ~3
+
+
+def decode_message(data):
+    """Decode an OSC message and return it as an `OSCMessage` instance."""
+    try:
+        path, pos = decode_string(data)
+
+        if pos >= len(data):
+            # Messages without type tag string are allowed by OSC 1.0
+            return OSCMessage(path, '', [])
+
+        types, pos = decode_string(data, pos)
+
+        if not types.startswith(','):
+            raise OSCError("Invalid type tag string: %r" % types)
+
+        types = types[1:]
+        args = []
+
+        for tag in types:
+            if tag in _ARG_CONSTANTS:
+                args.append(_ARG_CONSTANTS[tag])
+            elif tag == 's' or tag == 'S':
+                value, pos = decode_string(data, pos)
+                args.append(value)
+            elif tag == 'b':
+                size = _int32.unpack_from(data, pos)[0]
+                pos += 4
+                args.append(bytes(data[pos:pos + size]))
+                pos += size + (-size % 4)
+            elif tag == 'c':
+                args.append(chr(_int32.unpack_from(data, pos)[0]))
+                pos += 4
+            elif tag == 'm':
+                args.append(tuple(data[pos:pos + 4]))
+                pos += 4
+            else:
+                decoder = _ARG_DECODERS[tag]
+                args.append(decoder.unpack_from(data, pos)[0])
+                pos += decoder.size
+    except KeyError as exc:
+        raise OSCError("Unsupported OSC type tag: %s" % exc)
+    except (ValueError, struct.error) as exc:
+        raise OSCError("Malformed OSC message: %s" % exc)
+
+    return OSCMessage(path, types, args)
+
+
+def decode_packet(data):
+    """Decode OSC packet and return a list of all messages in it.
+
+    Bundles are flattened recursively, their time tags are ignored.
+
+    """
+    if not data.startswith(BUNDLE_HEADER):
+        return [decode_message(data)]
+
+    messages = []
+    pos = len(BUNDLE_HEADER) + 8
+
+    while pos < len(data):
+        try:
+            size = _int32.unpack_from(data, pos)[0]
+        except struct.error as exc:
+            raise OSCError("Malformed OSC bundle: %s" % exc)
+
+        pos += 4
+        messages.extend(decode_packet(data[pos:pos + size]))
+        pos += size
+
+    return messages
+
+
+class BundleSender:
+    """Collect OSC messages and send them packed into as few OSC bundles as possible.
+
+    ``send_datagram`` is called with the encoded data of each packet. Messages passed to `send`
+    are buffered until `flush` is called, which packs them into bundles, each of which fits into
+    ``mtu`` bytes. A bundle, which would only contain a single message, is sent as a plain message.
+    Messages, which are too large to fit in a bundle, are sent as is.
+
+    If ``use_bundles`` is False, e.g. because the receiver does not support bundles, each message
+    is sent in a packet of its own.
+
+    """
+
+    def __init__(self, send_datagram, mtu=DEFAULT_MTU, use_bundles=True):
+        self.send_datagram = send_datagram
+        self.mtu = mtu
+        self.use_bundles = use_bundles
+        self.messages_sent = 0
+        self.packets_sent = 0
+        self._buffer = []
+
+    def send(self, path, *args):
+        """Encode OSC message and add it to the send buffer."""
+        self._buffer.append(encode_message(path, *args))
+
+    def send_encoded(self, msg):
+        """Add an already encoded OSC message to the send buffer."""
+        self._buffer.append(msg)
+
+    def flush(self):
+        """Send all buffered messages and return the number of packets sent."""
+        buffer, self._buffer = self._buffer, []
+
+        if not buffer:
+            return 0
+
+        packets = self.pack(buffer) if self.use_bundles else buffer
+
+        for packet in packets:
+            self.send_datagram(packet)
+
+        self.messages_sent += len(buffer)
+        self.packets_sent += len(packets)
+        return len(packets)
+
+    def pack(self, messages):
+        """Return a list of packets with given encoded messages packed into bundles."""
+        packets = []
+        elements = []
+        size = len(BUNDLE_HEADER) + 8
+
+        for msg in messages:
+            msgsize = len(msg) + 4
+
+            if elements and size + msgsize > self.mtu:
+                packets.append(elements[0] if len(elements) == 1 else encode_bundle(elements))
+                elements = []
+                size = len(BUNDLE_HEADER) + 8
+
+            elements.append(msg)
+            size += msgsize
+
+        if elements:
+            packets.append(elements[0] if len(elements) == 1 else encode_bundle(elements))
+
+        return packets
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# oscqueue.py
+#
+"""A rate-limited, coalescing output queue for OSC messages."""
+
+import asyncio
+import logging
+import threading
+import time
+
+from collections import OrderedDict, deque
+
+
+log = logging.getLogger(__name__)
+
+
+def is_continuous(args):
+    """Return True if all given ``(typetag, value)`` arguments are floats.
+
+    Messages for continuous parameters (faders, pan, etc.) can be coalesced, i.e. only the newest
+    value needs to be sent, while discrete parameters (mutes, switches etc.) must not be.
+
+    """
+    return bool(args) and all(isinstance(arg, tuple) and arg[0] == 'f' for arg in args)
+
+
+class OSCOutputQueue:
+    """Queue OSC messages and pass them on to a sender at a limited rate.
+
+    Messages for continuous parameters are coalesced per OSC address, i.e. only the newest pending
+    value is kept, and each address is sent at most ``address_rate`` times per second. Discrete
+    messages are always sent, in the order they were queued. The total number of messages sent per
+    second is limited to ``rate``, with bursts of up to ``burst`` messages.
+
+    ``sender`` must have a ``send(path, *args)`` method. If it also has a ``flush()`` method, it
+    is called after all messages due in one flush tick have been passed to ``send``.
+
+    """
+
+    def __init__(self, sender, rate=500.0, address_rate=50.0, burst=None, clock=time.monotonic):
+        self.sender = sender
+        self.rate = rate
+        self.address_interval = 1.0 / address_rate if address_rate else 0.0
+        self.burst = burst if burst is not None else max(1.0, rate / 20)
+        self.clock = clock
+        self.sent = 0
+        self.coalesced = 0
+        self._tokens = self.burst
+        self._last_refill = clock()
+        self._discrete = deque()
+        self._pending = OrderedDict()
+        self._last_sent = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._wakeup = None
+
+    def send(self, path, *args, coalesce=None):
+        """Queue OSC message with given address and arguments.
+
+        If ``coalesce`` is None, the message is coalesced if ``is_continuous(args)`` is true.
+
+        """
+        if coalesce is None:
+            coalesce = is_continuous(args)
+
+        with self._cond:
+            if coalesce:
+                if path in self._pending:
+                    self.coalesced += 1
+
+                self._pending[path] = args
+            else:
+                self._discrete.append((path, args))
+
+            self._cond.notify()
+
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def stats(self):
+        """Return dict with counters of sent and coalesced messages and current queue lengths."""
+        with self._cond:
+            return dict(sent=self.sent, coalesced=self.coalesced,
+                        pending=len(self._pending), discrete=len(self._discrete))
+
+    def flush(self, now=None):
+        """Pass messages, which are due, to the sender.
+
+        Returns the delay in seconds until the next message will be due or None, if the queue is
+        empty.
+
+        """
+        with self._cond:
+            batch, delay = self._take(self.clock() if now is None else now)
+
+        self._send(batch)
+        return delay
+
+    def drain(self):
+        """Send all queued messages immediately, disregarding rate limits."""
+        with self._cond:
+            batch = list(self._discrete) + list(self._pending.items())
+            self._discrete.clear()
+            self._pending.clear()
+            self.sent += len(batch)
+
+        self._send(batch)
+
+    def _send(self, batch):
+        for path, args in batch:
+            try:
+                self.sender.send(path, *args)
+            except Exception as exc:
+                log.error("Error sending OSC message %s: %s", path, exc)
+
+        if batch and hasattr(self.sender, 'flush'):
+            self.sender.flush()
+
+    def _take(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        batch = []
+
+        while self._discrete and self._tokens >= 1:
+            batch.append(self._discrete.popleft())
+            self._tokens -= 1
+
+        next_due = None
+        starved = bool(self._discrete)
+
+        for path in list(self._pending):
+            due = self._last_sent.get(path, 0.0) + self.address_interval
+
+            if due > now:
+                next_due = due if next_due is None else min(next_due, due)
+            elif self._tokens >= 1:
+                batch.append((path, self._pending.pop(path)))
+                self._last_sent[path] = now
+                self._tokens -= 1
+            else:
+                starved = True
+                break
+
+        self.sent += len(batch)
+
+        if not self._discrete and not self._pending:
+            return batch, None
+        elif starved:
+            return batch, max(0.0, 1 - self._tokens) / self.rate
+        else:
+            return batch, max(0.0, next_due - now)
+
+    async def run(self):
+        """Flush the queue from the running asyncio event loop whenever messages are due.
+
+        When the queue is run this way, `send` must only be called from the event loop thread.
+
+        """
+        wakeup = asyncio.Event()
+        self._wakeup = wakeup.set
+
+        try:
+            while True:
+                wakeup.clear()
+                delay = self.flush()
+
+                if delay is None:
+                    await wakeup.wait()
+                elif delay > 0:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self._wakeup = None
+
+    def start(self):
+        """Start a background thread, which flushes the queue whenever messages are due."""
+        with self._cond:
+            if self._thread is not None:
+                return
+
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='OSCOutputQueue', daemon=True)
+            self._thread.start()
+
+    def stop(self, flush=True):
+        """Stop the background thread and optionally send all messages still queued."""
+        with self._cond:
+            if self._thread is None:
+                return
+
+            self._running = False
+            self._cond.notify()
+
+        self._thread.join()
+        self._thread = None
+
+        if flush:
+            self.drain()
+
+    def _run(self):
+        delay = None
+
+        while True:
+            with self._cond:
+                if not self._running:
+                    break
+
+                if delay is None and not self._discrete and not self._pending:
+                    self._cond.wait()
+                elif delay:
+                    self._cond.wait(delay)
+
+                if not self._running:
+                    break
+
+            delay = self.flush()
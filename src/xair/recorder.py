@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+#
+# recorder.py
+#
+"""Recording of received OSC traffic to a compact binary file and reading it back.
+
+A recording file starts with a header of eight bytes (``XAIRREC`` and a version byte), followed
+by blocks of records. Each record holds the time of reception, an address and the message
+arguments. Each block stores its records column by column:
+
+* ``names``: new keys, i.e. distinct pairs of OSC address and type tags, first used in this block,
+  as NUL-separated UTF-8 strings. Keys are numbered in order of first use across the file.
+* ``times``: time of each record in microseconds since the block start (uint32)
+* ``keys``: key number of each record (uint16)
+* ``floats``, ``ints``: all float32 and int32 arguments in record order
+* ``lengths``, ``data``: the size and the concatenated bytes of all strings, blobs and other
+  arguments
+
+All numbers are little-endian. A block starts with a 32-byte header (magic, size, number of
+records and new keys, start and end time as float64) and the sizes of the seven columns, each of
+which is padded to a multiple of eight bytes, so it can be used without copying, e.g. with
+``memoryview.cast`` or ``numpy.frombuffer``.
+
+`Recorder` buffers records in memory and appends them to the file in large blocks.
+`RecordingReader` maps the file into memory, builds an index of block times on opening and
+only decodes the blocks needed for a requested time range.
+
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+from array import array
+from collections import namedtuple
+
+from .meters import METERS_PREFIX, decode_meters
+from .osc import OSCError, OSCMessage, decode_packet
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'XAIRREC'
+VERSION = 1
+BLOCK_MAGIC = b'BLK\0'
+# Flush the block buffer when it holds this many bytes or records spanning this many seconds
+BLOCK_SIZE = 256 * 1024
+FLUSH_INTERVAL = 10.0
+MAX_KEYS = 65536
+
+_header = struct.Struct('<7sB')
+_block = struct.Struct('<4sIIIdd')
+_columns = struct.Struct('<7I4x')
+_uint32le = struct.Struct('<I')
+_BIG_ENDIAN = sys.byteorder == 'big'
+# Arguments stored in the variable-size column, besides strings and blobs
+_VAR_CODECS = {
+    'h': struct.Struct('<q'),
+    't': struct.Struct('<Q'),
+    'd': struct.Struct('<d'),
+    'r': struct.Struct('<I'),
+}
+_CONSTANTS = {
+    'T': True,
+    'F': False,
+    'N': None,
+    'I': float('inf'),
+}
+
+BlockInfo = namedtuple('BlockInfo', 'offset,start,end,count,first')
+Columns = namedtuple('Columns', 'times,keys,floats,ints,lengths,data')
+
+
+def _pad(size):
+    return -size % 8
+
+
+def _cast(view, fmt):
+    """Return view of little-endian data as given format, copied only on big-endian hosts."""
+    if _BIG_ENDIAN:
+        values = array(fmt, view.tobytes())
+        values.byteswap()
+        return memoryview(values)
+
+    return view.cast(fmt)
+
+
+def _column_bytes(column):
+    if _BIG_ENDIAN and isinstance(column, array):
+        column = array(column.typecode, column)
+        column.byteswap()
+
+    return memoryview(column).cast('B')
+
+
+class Recorder:
+    """Append OSC messages with their time of reception to a recording file.
+
+    Records are collected in columns in memory and written as one block, when the buffered data
+    reaches ``block_size`` bytes or spans ``flush_interval`` seconds, and on `flush` and `close`.
+    If the file exists, records are appended to it, after removing an incomplete last block.
+
+    `packet_received` can be registered with `XAirClient.add_monitor` to record all packets
+    received from the mixer.
+
+    """
+
+    def __init__(self, filename, block_size=BLOCK_SIZE, flush_interval=FLUSH_INTERVAL,
+                 clock=time.time):
+        self.filename = filename
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.records = 0
+        self.blocks = 0
+        self.errors = 0
+        self._keys = {}
+        self._meter_keys = {}
+        self._new_keys = []
+
+        if os.path.exists(filename) and os.path.getsize(filename):
+            with RecordingReader(filename) as reader:
+                self._keys = {key: i for i, key in enumerate(reader.keys)}
+                end = reader.data_end
+
+            # blocks appended after an incomplete one could not be read
+            self._fp = open(filename, 'r+b')
+            self._fp.truncate(end)
+            self._fp.seek(end)
+        else:
+            self._fp = open(filename, 'wb')
+            self._fp.write(_header.pack(MAGIC, VERSION))
+
+        self._reset()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _reset(self):
+        self._start = None
+        self._end = None
+        self._times = array('I')
+        self._keyids = array('H')
+        self._floats = array('f')
+        self._ints = array('i')
+        self._lengths = array('I')
+        self._data = bytearray()
+        self._new_keys = []
+
+    def _key(self, path, types):
+        key = (path, types)
+        keyid = self._keys.get(key)
+
+        if keyid is None:
+            if len(self._keys) >= MAX_KEYS:
+                raise OSCError("Too many distinct OSC addresses in recording.")
+
+            keyid = self._keys[key] = len(self._keys)
+            self._new_keys.append(key)
+
+        return keyid
+
+    def _add(self, keyid, timestamp):
+        if self._start is None:
+            self._start = timestamp
+        elif (timestamp - self._start >= self.flush_interval or
+                len(self._data) + len(self._times) * 14 >= self.block_size):
+            self.flush()
+            self._start = timestamp
+
+        self._times.append(max(0, int((timestamp - self._start) * 1e6)))
+        self._keyids.append(keyid)
+        self._end = timestamp
+        self.records += 1
+
+    def write(self, path, types, args, timestamp=None):
+        """Add an OSC message with given address, type tags and arguments to the recording."""
+        if timestamp is None:
+            timestamp = self.clock()
+
+        keyid = self._key(path, types)
+        self._add(keyid, timestamp)
+
+        for tag, value in zip(types, args):
+            if tag == 'f':
+                self._floats.append(value)
+            elif tag == 'i':
+                self._ints.append(value)
+            elif tag in _CONSTANTS:
+                continue
+            else:
+                if tag == 's' or tag == 'S' or tag == 'c':
+                    value = value.encode('utf-8')
+                elif tag == 'm':
+                    value = bytes(value)
+                elif tag in _VAR_CODECS:
+                    value = _VAR_CODECS[tag].pack(value)
+                elif tag != 'b':
+                    raise OSCError("Unsupported OSC type tag: %s" % tag)
+
+                self._lengths.append(len(value))
+                self._data += value
+
+    def write_meters(self, bank, values, timestamp=None):
+        """Add a meter frame with raw values (e.g. from `decode_meters`) as a meters message.
+
+        The frame is stored as the blob of the original message, i.e. the number of values
+        followed by the values as little-endian 16-bit integers.
+
+        """
+        if timestamp is None:
+            timestamp = self.clock()
+
+        keyid = self._meter_keys.get(bank)
+
+        if keyid is None:
+            keyid = self._meter_keys[bank] = self._key('/meters/%i' % bank, 'b')
+
+        self._add(keyid, timestamp)
+
+        if _BIG_ENDIAN or not isinstance(values, (array, memoryview)):
+            values = array('h', values)
+
+            if _BIG_ENDIAN:
+                values.byteswap()
+
+        data = memoryview(values).cast('B')
+        self._lengths.append(len(data) + 4)
+        self._data += _uint32le.pack(len(data) // 2)
+        self._data += data
+
+    def packet_received(self, data, addr=None):
+        """Record all messages in given received OSC packet."""
+        timestamp = self.clock()
+
+        try:
+            if data.startswith(METERS_PREFIX):
+                self.write_meters(*decode_meters(data), timestamp=timestamp)
+                return
+
+            for msg in decode_packet(data):
+                self.write(msg.path, msg.types, msg.args, timestamp)
+        except OSCError as exc:
+            self.errors += 1
+            log.debug("Could not record OSC packet: %s", exc)
+
+    def flush(self):
+        """Write all buffered records to the file as one block."""
+        if not self._times:
+            return
+
+        names = b'\0'.join(b'%s\0%s' % (path.encode('utf-8'), types.encode('utf-8'))
+                           for path, types in self._new_keys)
+        columns = [memoryview(names), _column_bytes(self._times), _column_bytes(self._keyids),
+                   _column_bytes(self._floats), _column_bytes(self._ints),
+                   _column_bytes(self._lengths), memoryview(self._data)]
+        size = _columns.size + sum(len(column) + _pad(len(column)) for column in columns)
+        parts = [_block.pack(BLOCK_MAGIC, size, len(self._times), len(self._new_keys),
+                             self._start, self._end),
+                 _columns.pack(*(len(column) for column in columns))]
+
+        for column in columns:
+            parts.append(column)
+            parts.append(b'\0' * _pad(len(column)))
+
+        self._fp.write(b''.join(parts))
+        self._fp.flush()
+        self.blocks += 1
+        self._reset()
+
+    def close(self):
+        if self._fp is not None:
+            self.flush()
+            self._fp.close()
+            self._fp = None
+
+    def stats(self):
+        return dict(records=self.records, blocks=self.blocks, keys=len(self._keys),
+                    errors=self.errors,
+                    bytes=os.path.getsize(self.filename) + len(self._data) + len(self._times) * 14)
+
+
+class RecordingReader:
+    """Read records from a recording file written by `Recorder`.
+
+    The file is memory-mapped. Opening it only reads the block headers and new keys of each block.
+    Strings are decoded on access, blobs are returned as memoryviews of the mapped file, which stay
+    valid after the reader is closed, until they are released. An incomplete block at the end of
+    the file, e.g. after a crash of the recorder, is ignored. ``data_end`` is the file offset after
+    the last complete block.
+
+    Record times should not decrease, i.e. the clock used for recording should not be adjusted
+    while recording, so blocks can be found by time.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.keys = []
+        self.blocks = []
+        self.data_end = _header.size
+        self._fp = open(filename, 'rb')
+        self._map = None
+        self._view = None
+
+        try:
+            size = os.fstat(self._fp.fileno()).st_size
+
+            if size < _header.size:
+                raise OSCError("Not a recording file: %s" % filename)
+
+            self._map = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+            magic, version = _header.unpack_from(self._map)
+
+            if magic != MAGIC:
+                raise OSCError("Not a recording file: %s" % filename)
+
+            if version != VERSION:
+                raise OSCError("Unsupported recording file version: %i" % version)
+
+            self._index()
+        except Exception:
+            self.close()
+            raise
+
+        self._ends = [block.end for block in self.blocks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return sum(block.count for block in self.blocks)
+
+    def __iter__(self):
+        return self.read()
+
+    def _index(self):
+        pos = _header.size
+        first = 0
+
+        while pos + _block.size <= len(self._map):
+            magic, size, count, new_keys, start, end = _block.unpack_from(self._map, pos)
+
+            if magic != BLOCK_MAGIC:
+                raise OSCError("Invalid block at offset %i in %s" % (pos, self.filename))
+
+            if pos + _block.size + size > len(self._map):
+                log.warning("Ignoring incomplete block at end of %s.", self.filename)
+                break
+
+            if new_keys:
+                offset = pos + _block.size + _columns.size
+                names = bytes(self._map[offset:offset + _columns.unpack_from(
+                    self._map, pos + _block.size)[0]]).decode('utf-8').split('\0')
+                self.keys.extend(zip(names[::2], names[1::2]))
+
+            self.blocks.append(BlockInfo(pos, start, end, count, first))
+            first += count
+            pos += _block.size + size
+
+        self.data_end = pos
+
+    @property
+    def start_time(self):
+        return self.blocks[0].start if self.blocks else None
+
+    @property
+    def end_time(self):
+        return self.blocks[-1].end if self.blocks else None
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # views of blobs or columns are still referenced, the file is unmapped, when they
+                # are released
+                pass
+
+            self._map = None
+
+        self._fp.close()
+
+    def seek(self, timestamp):
+        """Return the index of the first block, which may contain records at or after given time."""
+        return bisect.bisect_left(self._ends, timestamp)
+
+    def columns(self, index):
+        """Return the columns of block with given index as memoryviews of the mapped file.
+
+        Times are returned as microseconds since the start of the block (see `blocks`).
+
+        """
+        pos = self.blocks[index].offset + _block.size
+        sizes = _columns.unpack_from(self._map, pos)
+        pos += _columns.size
+        views = []
+
+        for size in sizes:
+            views.append(self._view[pos:pos + size])
+            pos += size + _pad(size)
+
+        names, times, keys, floats, ints, lengths, data = views
+        return Columns(_cast(times, 'I'), _cast(keys, 'H'), _cast(floats, 'f'), _cast(ints, 'i'),
+                       _cast(lengths, 'I'), data)
+
+    def read_block(self, index, start=None, end=None):
+        """Yield ``(timestamp, OSCMessage)`` for records in block, optionally only in time range.
+
+        Records are included, if ``start <= timestamp < end``.
+
+        """
+        block = self.blocks[index]
+        keys = self.keys
+        times, keyids, floats, ints, lengths, data = self.columns(index)
+        fi = ii = li = pos = 0
+
+        for n in range(block.count):
+            path, types = keys[keyids[n]]
+            timestamp = block.start + times[n] * 1e-6
+            skip = (start is not None and timestamp < start) or (end is not None and
+                                                                 timestamp >= end)
+            args = []
+
+            for tag in types:
+                if tag == 'f':
+                    args.append(floats[fi])
+                    fi += 1
+                elif tag == 'i':
+                    args.append(ints[ii])
+                    ii += 1
+                elif tag in _CONSTANTS:
+                    args.append(_CONSTANTS[tag])
+                else:
+                    size = lengths[li]
+                    value = data[pos:pos + size]
+                    li += 1
+                    pos += size
+
+                    if skip:
+                        continue
+                    elif tag == 's' or tag == 'S' or tag == 'c':
+                        value = str(value, 'utf-8', 'replace')
+                    elif tag == 'm':
+                        value = tuple(value)
+                    elif tag in _VAR_CODECS:
+                        value = _VAR_CODECS[tag].unpack(value)[0]
+
+                    args.append(value)
+
+            if not skip:
+                yield timestamp, OSCMessage(path, types, args)
+
+    def read(self, start=None, end=None):
+        """Yield ``(timestamp, OSCMessage)`` for all records, optionally only in time range."""
+        first = 0 if start is None else self.seek(start)
+
+        for index in range(first, len(self.blocks)):
+            if end is not None and self.blocks[index].start >= end:
+                break
+
+            yield from self.read_block(index, start, end)
+
+
+def _test():
+    import asyncio
+    import tempfile
+
+    from .client import XAirClient
+    from .fakemixer import start_fake_mixer
+    from .meters import Meters
+
+    async def record(recorder):
+        transport, mixer = await start_fake_mixer('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+
+        async with XAirClient('127.0.0.1', port) as client:
+            client.add_monitor(recorder.packet_received)
+            client.send('/xremote')
+            meters = Meters(client, banks=(0, 1))
+            meters.start()
+
+            for ch in range(1, 17):
+                await client.query('/ch/%02i/mix/fader' % ch)
+                client.send('/ch/%02i/mix/on' % ch, 0)
+
+            await asyncio.sleep(0.3)
+            meters.stop()
+
+        transport.close()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'test.xrec')
+
+        with Recorder(filename) as recorder:
+            asyncio.run(record(recorder))
+
+        print(recorder.stats())
+
+        with RecordingReader(filename) as reader:
+            print("%i records in %i blocks, %i keys, %.3f s" % (
+                len(reader), len(reader.blocks), len(reader.keys),
+                reader.end_time - reader.start_time))
+
+            for timestamp, msg in reader.read(end=reader.start_time + 0.1):
+                print("%.3f %s %s %s" % (timestamp - reader.start_time, msg.path, msg.types,
+                                         [len(arg) if msg.types == 'b' else arg
+                                          for arg in msg.args]))
+
+
+if __name__ == '__main__':
+    _test()
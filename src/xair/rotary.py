@@ -2,10 +2,31 @@
 #
 # rotary.py
 #
-"""A class to handle rotary encoders on a Rasberry Pi or NextThing C.H.I.P."""
+"""A class to handle rotary encoders on a Rasberry Pi or NextThing C.H.I.P.
 
-import CHIP_IO.GPIO as GPIO
+The levels of the encoder's two input lines are read by an input backend, which passes them to
+the quadrature decoder of `RotaryEncoder` on each edge:
 
+`CHIPBackend`
+    Uses the ``CHIP_IO`` library on the NextThing C.H.I.P.
+`GpiodBackend`
+    Uses the Linux GPIO character device via the ``gpiod`` library (libgpiod v2 bindings). Edge
+    events carry the new line level, so no extra reads are needed per edge.
+`SimulatedBackend`
+    Replays recorded or generated edge sequences, for testing without hardware.
+
+Backends can also watch single lines for push buttons (see `Button`).
+
+"""
+
+import logging
+import threading
+import time
+
+from .events import EventDispatcher, SlotEvent
+
+
+log = logging.getLogger(__name__)
 
 ENC_STATES = (
     0,   # 00 00
@@ -26,71 +47,436 @@ ENC_STATES = (
     0    # 11 11
 )
 ACCEL_THRESHOLD = 5
+# Line levels (clk << 1 | dt) in the order, in which they change for one full step in the
+# direction, which ENC_STATES counts as positive
+QUADRATURE_SEQUENCE = (0b10, 0b11, 0b01, 0b00)
+
+
+class CHIPBackend:
+    """Input backend using edge detection of the ``CHIP_IO`` library.
+
+    ``pullup`` is one of 'up', 'down' or 'off' (default) or a ``CHIP_IO.GPIO.PUD_*`` constant.
+
+    """
+
+    def __init__(self, pullup=None):
+        import CHIP_IO.GPIO as GPIO
+
+        self.gpio = GPIO
+        self.pullup = {None: GPIO.PUD_OFF, 'off': GPIO.PUD_OFF, 'up': GPIO.PUD_UP,
+                       'down': GPIO.PUD_DOWN}.get(pullup, pullup)
+        self.pins = ()
+
+    def setup(self, pin_dt, pin_clk, callback):
+        GPIO = self.gpio
+        clock = time.monotonic
+
+        def edge(ch):
+            callback(GPIO.input(pin_clk) << 1 | GPIO.input(pin_dt), clock())
+
+        self.pins = (pin_dt, pin_clk)
+
+        for pin in self.pins:
+            GPIO.setup(pin, GPIO.IN, self.pullup)
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=edge)
+
+    def setup_button(self, pin, callback):
+        GPIO = self.gpio
+        clock = time.monotonic
+
+        def edge(ch):
+            callback(GPIO.input(pin), clock())
+
+        self.pins = (pin,)
+        GPIO.setup(pin, GPIO.IN, self.pullup)
+        GPIO.add_event_detect(pin, GPIO.BOTH, callback=edge)
+
+    def close(self):
+        for pin in self.pins:
+            self.gpio.remove_event_detect(pin)
+
+        self.pins = ()
+
+
+class GpiodBackend:
+    """Input backend using the Linux GPIO character device via ``gpiod`` (libgpiod >= 2.0).
+
+    Both lines are requested together. Their initial levels are read with one call, after that
+    the levels are tracked from the edge events, which are read in batches by a background
+    thread. Edge timestamps are taken from the kernel events.
+
+    ``pullup`` is one of 'up', 'down', 'off' or None (leave bias as is).
+
+    """
+
+    def __init__(self, chip='/dev/gpiochip0', pullup=None, consumer='xair-rotary'):
+        self.chip = chip
+        self.pullup = pullup
+        self.consumer = consumer
+        self._request = None
+        self._thread = None
+        self._running = False
+
+    def setup(self, pin_dt, pin_clk, callback):
+        self._request_lines({pin_dt: 1, pin_clk: 2}, callback)
+
+    def setup_button(self, pin, callback):
+        self._request_lines({pin: 1}, callback)
+
+    def _request_lines(self, bits, callback):
+        """Request lines and pass their levels, as bits given by ``bits``, to callback."""
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+
+        bias = {None: Bias.AS_IS, 'off': Bias.DISABLED, 'up': Bias.PULL_UP,
+                'down': Bias.PULL_DOWN}[self.pullup]
+        settings = gpiod.LineSettings(direction=Direction.INPUT, edge_detection=Edge.BOTH,
+                                      bias=bias)
+        pins = tuple(bits)
+        self._request = gpiod.request_lines(self.chip, consumer=self.consumer,
+                                            config={pins: settings})
+        levels = 0
+
+        for pin, value in zip(pins, self._request.get_values(pins)):
+            if value == Value.ACTIVE:
+                levels |= bits[pin]
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, args=(bits, levels, callback),
+                                        name='GpiodBackend', daemon=True)
+        self._thread.start()
+
+    def _run(self, bits, levels, callback):
+        from gpiod import EdgeEvent
+
+        rising = EdgeEvent.Type.RISING_EDGE
+        request = self._request
+
+        while self._running:
+            if not request.wait_edge_events(0.1):
+                continue
+
+            for event in request.read_edge_events():
+                bit = bits[event.line_offset]
+                levels = levels | bit if event.event_type == rising else levels & ~bit
+
+                try:
+                    callback(levels, event.timestamp_ns / 1e9)
+                except Exception:
+                    log.exception("Unhandled exception in rotary encoder callback.")
+
+    def close(self):
+        self._running = False
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._request is not None:
+            self._request.release()
+            self._request = None
+
+
+class SimulatedBackend:
+    """Input backend, which passes given edges to the decoder, for testing without hardware.
+
+    Edge sequences are iterables of ``(timestamp, levels)`` tuples, where ``levels`` is
+    ``clk << 1 | dt``. They can be generated with `quadrature_edges` or recorded from any other
+    backend by passing a callback, which appends its arguments to a list, to its ``setup`` method,
+    and then saved with `save_edges`.
+
+    """
+
+    def __init__(self, levels=0b00, clock=time.monotonic):
+        self.levels = levels
+        self.clock = clock
+        self.callback = None
+
+    def setup(self, pin_dt, pin_clk, callback):
+        self.callback = callback
+
+    def setup_button(self, pin, callback):
+        self.callback = callback
+
+    def close(self):
+        self.callback = None
+
+    def feed(self, levels, timestamp=None):
+        """Pass one edge to the decoder."""
+        self.levels = levels
+        self.callback(levels, self.clock() if timestamp is None else timestamp)
+
+    def replay(self, edges, realtime=False):
+        """Pass all edges to the decoder.
+
+        If ``realtime`` is True, wait between edges according to their timestamps and pass the
+        current time instead. Otherwise, edges are passed as fast as possible with their recorded
+        timestamps.
+
+        """
+        callback = self.callback
+        start = first = None
+        levels = self.levels
+
+        for timestamp, levels in edges:
+            if realtime:
+                if start is None:
+                    start, first = self.clock(), timestamp
+
+                delay = start + (timestamp - first) - self.clock()
+
+                if delay > 0:
+                    time.sleep(delay)
 
+                timestamp = self.clock()
 
-class RotaryEncoder:
-    def __init__(self, pin_dt, pin_clk, pullup=GPIO.PUD_OFF, clicks=1,
-                 min_val=0, max_val=100, accel=0, reverse=False):
+            callback(levels, timestamp)
+
+        self.levels = levels
+
+
+def quadrature_edges(count, interval=0.001, start=0.0, levels=0b00):
+    """Return list of ``count`` edges turning the encoder from given line ``levels``.
+
+    Positive counts are edges in the direction, which `ENC_STATES` counts as positive, negative
+    counts in the other direction. Edges are ``interval`` seconds apart.
+
+    """
+    pos = QUADRATURE_SEQUENCE.index(levels)
+    step = 1 if count >= 0 else -1
+    edges = []
+
+    for i in range(abs(count)):
+        pos = (pos + step) % 4
+        edges.append((start + i * interval, QUADRATURE_SEQUENCE[pos]))
+
+    return edges
+
+
+def save_edges(filename, edges):
+    """Save edge sequence to a text file with one timestamp and levels per line."""
+    with open(filename, 'w') as fp:
+        for timestamp, levels in edges:
+            fp.write("%.9f %i\n" % (timestamp, levels))
+
+
+def load_edges(filename):
+    """Load edge sequence saved with `save_edges`. Empty lines and comments (#) are ignored."""
+    edges = []
+
+    with open(filename) as fp:
+        for line in fp:
+            line = line.split('#', 1)[0].strip()
+
+            if line:
+                timestamp, levels = line.split()
+                edges.append((float(timestamp), int(levels)))
+
+    return edges
+
+
+class EncoderEvent(SlotEvent):
+    """Sent by `RotaryEncoder`, when its value has changed.
+
+    ``delta`` is the change since the previous event and ``timestamp`` the time of the last edge.
+
+    """
+    type = 'encoder_change'
+    __slots__ = ('encoder', 'value', 'delta', 'timestamp')
+
+
+class RotaryEncoder(EventDispatcher):
+    """Decode quadrature signals of a rotary encoder into a bounded value.
+
+    Line levels are provided by ``backend`` (default: a `CHIPBackend` with given ``pullup``).
+
+    If ``accel`` is non-zero, the value changes by more than one per step, the faster the encoder
+    is turned. The acceleration is computed from the edge timestamps and decays with a half-life
+    of ``accel_decay`` seconds, while the encoder is not turned. ``clock`` returns the current
+    time for edges passed without a timestamp and for `acceleration`.
+
+    When the value changes, an `EncoderEvent` is dispatched to the handlers pushed on the encoder.
+    The edge callback of the backend only schedules a dispatch tick by passing a function to
+    ``schedule`` (e.g. ``loop.call_soon_threadsafe``), so handlers run in the thread of the caller
+    of ``schedule``. All changes until the tick runs are coalesced into one event. Without
+    ``schedule``, events are dispatched directly from the edge callback.
+
+    """
+
+    def __init__(self, pin_dt, pin_clk, pullup=None, clicks=1, min_val=0, max_val=100,
+                 accel=0, reverse=False, backend=None, accel_decay=0.05, schedule=None,
+                 name=None, clock=time.monotonic):
         self.pin_dt = pin_dt
         self.pin_clk = pin_clk
+        self.name = name
         self.min_val = min_val * clicks
         self.max_val = max_val * clicks
         self.accel = int((max_val - min_val) / 100 * accel)
         self.max_accel = int((max_val - min_val) / 2)
+        self.accel_decay = accel_decay
         self.clicks = clicks
         self.reverse = 1 if reverse else -1
+        self.schedule = schedule
+        self.clock = clock
         self._value = 0
         self._readings = 0
         self._state = 0
+        self._last_step = None
+        self._last_edge = None
+        self._reported = self.value
+        self._scheduled = False
         self.cur_accel = 0
+        self.backend = CHIPBackend(pullup) if backend is None else backend
+        self.backend.setup(pin_dt, pin_clk, self._update)
 
-        GPIO.setup(pin_dt, GPIO.IN, pullup)
-        GPIO.setup(pin_clk, GPIO.IN, pullup)
-        self.set_callbacks(self._cb)
-
-    def set_callbacks(self, callback=None):
-        GPIO.add_event_detect(self.pin_dt, GPIO.BOTH, callback=callback)
-        GPIO.add_event_detect(self.pin_clk, GPIO.BOTH, callback=callback)
-
-    def _cb(self, ch):
-        self._readings = (self._readings << 2 | GPIO.input(self.pin_clk) << 1 |
-                          GPIO.input(self.pin_dt)) & 0x0f
+    def _update(self, levels, timestamp=None):
+        self._readings = (self._readings << 2 | levels) & 0x0f
         self._state = ENC_STATES[self._readings] * self.reverse
 
         if self._state:
-            self.cur_accel = min(self.max_accel, self.cur_accel + self.accel)
+            if timestamp is None:
+                timestamp = self.clock()
+
+            if self.accel:
+                self.cur_accel = min(self.max_accel, self._decayed_accel(timestamp) + self.accel)
+                self._last_step = timestamp
+
+            value = min(self.max_val, max(self.min_val, self._value +
+                        (1 + (int(self.cur_accel) >> ACCEL_THRESHOLD)) * self._state))
+
+            if value != self._value:
+                self._value = value
+                self._last_edge = timestamp
 
-            self._value = min(self.max_val, max(self.min_val, self._value +
-                              (1 + (self.cur_accel >> ACCEL_THRESHOLD)) *
-                              self._state))
+                if self.schedule is None:
+                    self.tick()
+                elif not self._scheduled:
+                    self._scheduled = True
+                    self.schedule(self.tick)
+
+    def _decayed_accel(self, now):
+        if self._last_step is None or not self.cur_accel:
+            return 0
+
+        return self.cur_accel * 0.5 ** (max(0.0, now - self._last_step) / self.accel_decay)
+
+    def tick(self):
+        """Dispatch an `EncoderEvent`, if the value changed since the last one."""
+        self._scheduled = False
+        value = self.value
+
+        if value != self._reported:
+            delta = value - self._reported
+            self._reported = value
+            self.dispatch(EncoderEvent(self, value, delta, self._last_edge))
 
     def close(self):
-        GPIO.remove_event_detect(self.pin_clk)
-        GPIO.remove_event_detect(self.pin_dt)
+        self.backend.close()
 
     @property
     def value(self):
         return self._value // self.clicks
 
+    @property
+    def acceleration(self):
+        """Return current acceleration, decayed to the current time."""
+        return self._decayed_accel(self.clock())
+
+    def set_value(self, value):
+        """Set value (e.g. to the current parameter value) without dispatching an event."""
+        self._value = min(self.max_val, max(self.min_val, value * self.clicks))
+        self._reported = self.value
+
     def reset(self):
         self._value = 0
+        self.cur_accel = 0
+
+
+class ButtonEvent(SlotEvent):
+    """Sent by `Button`, when it is pressed or released."""
+    type = 'button_change'
+    __slots__ = ('button', 'pressed', 'timestamp')
+
+
+class Button(EventDispatcher):
+    """A push button on a single input line.
+
+    Dispatches a `ButtonEvent` on each press and release. Edges within ``debounce`` seconds after
+    the last accepted change are ignored. If ``active_low`` is True (the default, for buttons
+    connecting the line to ground against a pull-up), a low level means pressed. Events are
+    dispatched via ``schedule``, like those of `RotaryEncoder`, but are not coalesced.
+
+    """
+
+    def __init__(self, pin, pullup='up', active_low=True, debounce=0.01, backend=None,
+                 schedule=None, name=None):
+        self.pin = pin
+        self.name = name
+        self.active_low = active_low
+        self.debounce = debounce
+        self.schedule = schedule
+        self.pressed = False
+        self._last_change = None
+        self.backend = CHIPBackend(pullup) if backend is None else backend
+        self.backend.setup_button(pin, self._update)
+
+    def _update(self, level, timestamp=None):
+        pressed = bool(level) != self.active_low
+
+        if pressed == self.pressed:
+            return
+
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        if self._last_change is not None and timestamp - self._last_change < self.debounce:
+            return
+
+        self.pressed = pressed
+        self._last_change = timestamp
+        event = ButtonEvent(self, pressed, timestamp)
+
+        if self.schedule is None:
+            self.dispatch(event)
+        else:
+            self.schedule(self.dispatch, event)
+
+    def close(self):
+        self.backend.close()
 
 
 def _test():
-    import time
-    e = RotaryEncoder('XIO-P2', 'XIO-P4')
-    oldval = 0
+    import asyncio
+    import sys
+
+    def on_change(event):
+        print("{e.encoder.name}: {e.value} ({e.delta:+d})".format(e=event))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        if len(sys.argv) > 1 and sys.argv[1] == '--simulate':
+            backend = SimulatedBackend()
+            e = RotaryEncoder('DT', 'CLK', backend=backend, min_val=-1000, max_val=1000,
+                              accel=1, schedule=loop.call_soon_threadsafe, name='sim')
+            e.push_handlers(encoder_change=on_change)
+            edges = (quadrature_edges(-40, interval=0.02) +
+                     quadrature_edges(-200, interval=0.001, start=1.0) +
+                     quadrature_edges(20, interval=0.02, start=2.0))
+            await loop.run_in_executor(None, backend.replay, edges, True)
+            await asyncio.sleep(0.1)
+        else:
+            e = RotaryEncoder('XIO-P2', 'XIO-P4', schedule=loop.call_soon_threadsafe,
+                              name='encoder')
+            e.push_handlers(encoder_change=on_change)
+            await asyncio.Event().wait()
+
+        e.close()
 
     try:
-        while True:
-            if e.value != oldval:
-                oldval = e.value
-                print(oldval)
-            time.sleep(0.1)
+        asyncio.run(run())
     except KeyboardInterrupt:
         pass
-    finally:
-        e.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# rta.py
+#
+"""Streaming of the mixer's real-time analyzer (RTA) spectrum with history and peak hold.
+
+The RTA spectrum is sent as meter bank `RTA_BANK` (see `xair.meters`) with one value per band
+in units of 1/256 dB. The signal analyzed is selected with ``/-stat/rta/source``.
+
+Frames are stored in `RTAHistory`, a ring buffer, which is allocated once for a fixed number of
+frames, so memory use does not grow while streaming.
+
+"""
+
+import logging
+import math
+
+from array import array
+
+from .events import EventDispatcher, SlotEvent
+from .meters import DB_PER_UNIT, numpy, to_db
+
+
+log = logging.getLogger(__name__)
+
+RTA_BANK = 4
+RTA_BANDS = 100
+# Meter frames are sent about every 50 ms
+RTA_RATE = 20
+# Raw value used for "no peak yet"
+_FLOOR = -32768
+
+
+class RTAHistory:
+    """A fixed-size ring buffer of RTA frames with peak hold and decay per band.
+
+    Holds the last ``size`` frames of ``bands`` raw int16 values each in one preallocated
+    array. Peaks are held for ``hold`` seconds and then fall by ``decay`` dB per second until
+    they meet the current level. All updates are done in place.
+
+    """
+
+    def __init__(self, size=RTA_RATE * 300, bands=RTA_BANDS, hold=1.0, decay=20.0):
+        self.size = size
+        self.bands = bands
+        self.hold = hold
+        self.decay = decay
+        self.count = 0
+        self.frames = array('h', bytes(size * bands * 2))
+        self.timestamps = array('d', bytes(size * 8))
+        self.peaks = array('h', [_FLOOR]) * bands
+        self.peak_times = array('d', bytes(bands * 8))
+        self._view = memoryview(self.frames)
+        self._index = 0
+        self._last_time = None
+
+        if numpy is not None:
+            self._np_peaks = numpy.frombuffer(self.peaks, dtype=numpy.int16)
+            self._np_peak_times = numpy.frombuffer(self.peak_times, dtype=numpy.float64)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values, timestamp):
+        """Copy frame of raw values (a memoryview or array of int16) into the ring buffer.
+
+        :raises ValueError: if the number of values does not match the number of bands.
+
+        """
+        if len(values) != self.bands:
+            raise ValueError("Expected %i bands, got %i." % (self.bands, len(values)))
+
+        if not isinstance(values, memoryview):
+            values = memoryview(array('h', values))
+
+        start = self._index * self.bands
+        self._view[start:start + self.bands] = values
+        self.timestamps[self._index] = timestamp
+        self._index = (self._index + 1) % self.size
+        self.count = min(self.size, self.count + 1)
+        self._update_peaks(values, timestamp)
+
+    def _update_peaks(self, values, timestamp):
+        fall = 0
+
+        if self._last_time is not None:
+            fall = int(self.decay * max(0.0, timestamp - self._last_time) / DB_PER_UNIT)
+
+        self._last_time = timestamp
+
+        if numpy is not None:
+            current = numpy.frombuffer(values, dtype=numpy.int16)
+            peaks, peak_times = self._np_peaks, self._np_peak_times
+            rising = current >= peaks
+            peaks[rising] = current[rising]
+            peak_times[rising] = timestamp
+            falling = ~rising & (timestamp - peak_times > self.hold)
+            lowered = peaks[falling].astype(numpy.int32) - fall
+            peaks[falling] = numpy.maximum(current[falling], lowered)
+            return
+
+        peaks, peak_times, hold = self.peaks, self.peak_times, self.hold
+
+        for band, value in enumerate(values):
+            if value >= peaks[band]:
+                peaks[band] = value
+                peak_times[band] = timestamp
+            elif timestamp - peak_times[band] > hold:
+                peaks[band] = max(value, peaks[band] - fall)
+
+    def frame(self, age=0):
+        """Return memoryview of the raw values of the frame ``age`` frames before the newest.
+
+        The view refers to the ring buffer, i.e. it is overwritten after ``size`` more frames.
+
+        """
+        if not 0 <= age < self.count:
+            raise IndexError("frame index out of range")
+
+        start = (self._index - 1 - age) % self.size * self.bands
+        return self._view[start:start + self.bands]
+
+    def last(self, n=None):
+        """Return the last ``n`` frames (default: all) as a list of memoryviews.
+
+        The list contains one or, if the frames wrap around the end of the ring buffer, two views
+        of consecutive frames in chronological order, each ``bands`` values per frame. Nothing is
+        copied, e.g. use ``numpy.frombuffer(view, numpy.int16).reshape(-1, bands)`` to get a
+        two-dimensional array.
+
+        """
+        n = self.count if n is None else min(n, self.count)
+        first = (self._index - n) % self.size
+
+        if n == 0:
+            return []
+        elif first + n <= self.size:
+            return [self._view[first * self.bands:(first + n) * self.bands]]
+
+        return [self._view[first * self.bands:], self._view[:self._index * self.bands]]
+
+    def last_timestamps(self, n=None):
+        """Return the timestamps of the last ``n`` frames as a list of memoryviews, like `last`."""
+        n = self.count if n is None else min(n, self.count)
+        first = (self._index - n) % self.size
+        view = memoryview(self.timestamps)
+
+        if n == 0:
+            return []
+        elif first + n <= self.size:
+            return [view[first:first + n]]
+
+        return [view[first:], view[:self._index]]
+
+    def peaks_db(self):
+        """Return current peak-hold values in dB (-inf for bands without a value yet)."""
+        return [-math.inf if value == _FLOOR else value * DB_PER_UNIT for value in self.peaks]
+
+    def clear(self):
+        self.count = 0
+        self._index = 0
+        self._last_time = None
+
+        for band in range(self.bands):
+            self.peaks[band] = _FLOOR
+            self.peak_times[band] = 0.0
+
+
+class RTAEvent(SlotEvent):
+    """Sent by `RTAStream` for each frame added to the history.
+
+    ``frame`` is a memoryview of the raw values in the history's ring buffer.
+
+    """
+    type = 'rta'
+    __slots__ = ('frame', 'timestamp')
+
+    def db(self):
+        return to_db(self.frame)
+
+
+class RTAStream(EventDispatcher):
+    """Feed the RTA frames received by a `xair.meters.Meters` instance into an `RTAHistory`.
+
+    The RTA meter bank is subscribed when the stream is started.
+
+    """
+
+    def __init__(self, meters, history=None, bank=RTA_BANK):
+        self.meters = meters
+        self.history = RTAHistory() if history is None else history
+        self.bank = bank
+        self.dropped = 0
+
+    def start(self):
+        self.meters.push_handlers(meters=self._received)
+        self.meters.subscribe(self.bank)
+
+    def stop(self):
+        self.meters.unsubscribe(self.bank)
+        self.meters.remove_handlers(meters=self._received)
+
+    def set_source(self, source):
+        """Select the signal analyzed by the mixer's RTA."""
+        self.meters.client.send('/-stat/rta/source', ('i', source))
+
+    def _received(self, event):
+        if event.bank != self.bank:
+            return
+
+        try:
+            self.history.append(event.values, event.timestamp)
+        except ValueError as exc:
+            if not self.dropped:
+                log.warning("Ignoring RTA frames: %s", exc)
+
+            self.dropped += 1
+            return
+
+        self.dispatch(RTAEvent(self.history.frame(), event.timestamp))
+
+
+def _test():
+    import asyncio
+
+    from .client import XAirClient
+    from .fakemixer import start_fake_mixer
+    from .meters import Meters
+
+    async def test():
+        transport, mixer = await start_fake_mixer('127.0.0.1', 0)
+        port = transport.get_extra_info('sockname')[1]
+
+        async with XAirClient('127.0.0.1', port) as client:
+            meters = Meters(client)
+            rta = RTAStream(meters, RTAHistory(size=8))
+            meters.start()
+            rta.start()
+            await asyncio.sleep(0.6)
+            rta.stop()
+            meters.stop()
+
+        transport.close()
+        history = rta.history
+        print("%i frames, first view(s): %s" % (len(history), [len(v) for v in history.last()]))
+        print("Peaks (dB):", " ".join("%.1f" % db for db in history.peaks_db()[:10]), "...")
+
+    asyncio.run(test())
+
+
+if __name__ == '__main__':
+    _test()
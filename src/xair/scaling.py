@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# scaling.py
+#
+"""Conversion between control positions and X-AIR OSC parameter values.
+
+X-AIR faders and sends are floats from 0.0 to 1.0, which map to levels in dB piecewise-linearly:
+
+=============  ===============
+float          dB
+=============  ===============
+0.0            -inf
+0.0 - 0.0625   -90 - -60
+0.0625 - 0.25  -60 - -30
+0.25 - 0.5     -30 - -10
+0.5 - 1.0      -10 - +10
+=============  ===============
+
+"""
+
+import math
+
+
+# (float value, dB value, dB per float unit) for the lower end of each segment, highest first
+_FADER_SEGMENTS = (
+    (0.5, -10.0, 40.0),
+    (0.25, -30.0, 80.0),
+    (0.0625, -60.0, 160.0),
+    (0.0, -90.0, 480.0),
+)
+
+
+def fader_to_db(value):
+    """Return level in dB for X-AIR fader float value (-inf for 0.0)."""
+    if value <= 0.0:
+        return -math.inf
+
+    for start, db, slope in _FADER_SEGMENTS:
+        if value >= start:
+            return db + (min(value, 1.0) - start) * slope
+
+
+def db_to_fader(db):
+    """Return X-AIR fader float value for level in dB (0.0 for -90 dB and below)."""
+    if db <= -90.0:
+        return 0.0
+
+    for start, segment_db, slope in _FADER_SEGMENTS:
+        if db >= segment_db:
+            return min(1.0, start + (db - segment_db) / slope)
+
+
+class LinearScale:
+    """Map control positions 0..steps linearly to OSC values from ``min`` to ``max``."""
+
+    typetag = 'f'
+
+    def __init__(self, min=0.0, max=1.0, step=None):
+        if max <= min:
+            raise ValueError("'max' (%s) must be greater than 'min' (%s)." % (max, min))
+
+        if step is not None and step <= 0:
+            raise ValueError("'step' must be greater than zero.")
+
+        self.min = min
+        self.max = max
+        self.step = (max - min) / 100 if step is None else step
+        self.steps = int(round((max - min) / self.step))
+
+    def to_osc(self, pos):
+        return self.min + min(self.steps, max(0, pos)) * self.step
+
+    def from_osc(self, value):
+        """Return the control position nearest to given OSC value."""
+        return min(self.steps, max(0, int(round((value - self.min) / self.step))))
+
+
+class DBScale(LinearScale):
+    """Map control positions 0..steps to levels from ``min`` to ``max`` dB in ``step`` dB steps.
+
+    OSC values are fader floats according to the X-AIR fader law. Position 0 is -inf dB, if
+    ``min`` is -90 dB or less.
+
+    """
+
+    def __init__(self, min=-90.0, max=10.0, step=0.5):
+        super().__init__(min, max, step)
+
+    def to_osc(self, pos):
+        return db_to_fader(super().to_osc(pos))
+
+    def from_osc(self, value):
+        return super().from_osc(max(self.min, fader_to_db(value)))
+
+
+SCALES = {
+    'linear': LinearScale,
+    'db': DBScale,
+}
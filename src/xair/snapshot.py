@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# snapshot.py
+#
+"""Save, load and compare snapshots of the mixer parameter state.
+
+A snapshot file starts with a header of eight bytes (``XAIRSNP`` and a version byte), followed by
+one OSC message per parameter, each preceded by its size as a big-endian 32-bit integer.
+
+"""
+
+import struct
+
+from .osc import OSCError, decode_message, encode_message
+
+
+MAGIC = b'XAIRSNP'
+VERSION = 1
+# Addresses of preferences, status and info, which are not part of the mixer state
+EXCLUDE_PREFIXES = ('/-', '/xinfo', '/info')
+
+_size = struct.Struct('>i')
+
+
+def is_state_address(address):
+    """Return True if address belongs to a parameter, which should be saved in a snapshot."""
+    return not address.startswith(EXCLUDE_PREFIXES)
+
+
+def write_snapshot(filename, messages):
+    """Write given `OSCMessage` instances to a snapshot file."""
+    with open(filename, 'wb') as fp:
+        fp.write(MAGIC + bytes([VERSION]))
+
+        for msg in messages:
+            data = encode_message(msg.path, *zip(msg.types, msg.args))
+            fp.write(_size.pack(len(data)))
+            fp.write(data)
+
+
+def read_snapshot(filename):
+    """Read snapshot file and return a list of `OSCMessage` instances."""
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+
+    if data[:len(MAGIC)] != MAGIC or len(data) <= len(MAGIC):
+        raise OSCError("Not a snapshot file: %s" % filename)
+
+    if data[len(MAGIC)] != VERSION:
+        raise OSCError("Unsupported snapshot file version: %i" % data[len(MAGIC)])
+
+    messages = []
+    pos = len(MAGIC) + 1
+
+    while pos < len(data):
+        size = _size.unpack_from(data, pos)[0]
+        pos += 4
+        messages.append(decode_message(data[pos:pos + size]))
+        pos += size
+
+    return messages
+
+
+def diff_state(saved, live):
+    """Return messages from ``saved``, whose arguments differ from those in ``live``.
+
+    ``live`` maps addresses to `OSCMessage` instances or to None, if the current value of a
+    parameter is unknown, in which case the saved message is always included.
+
+    """
+    changed = []
+
+    for msg in saved:
+        current = live.get(msg.path)
+
+        if current is None or current.types != msg.types or current.args != msg.args:
+            changed.append(msg)
+
+    return changed
+
+
+async def restore_snapshot(client, saved, timeout=None, retries=2, probe_bundles=False):
+    """Send the messages of a snapshot, whose values differ from the current mixer state.
+
+    The current values are queried with ``client`` (an `xair.client.XAirClient`) first and the
+    changed values are sent through its bundler. If ``probe_bundles`` is true, the mixer's support
+    for OSC bundles is probed before the first changed value is sent. Nothing is sent, if no value
+    changed.
+
+    Returns the list of changed messages and the number of UDP packets sent for them.
+
+    """
+    live = await client.query_many([msg.path for msg in saved], timeout=timeout,
+                                   retries=retries)
+    changed = diff_state(saved, live)
+
+    if not changed:
+        return changed, 0
+
+    if probe_bundles:
+        client.bundler.use_bundles = await client.probe_bundles(timeout)
+
+    for msg in changed:
+        client.bundler.send(msg.path, *zip(msg.types, msg.args))
+
+    return changed, client.bundler.flush()
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# surface.py
+#
+"""Control X-AIR mixer parameters with rotary encoders and push buttons.
+
+The YAML configuration maps encoders and buttons to OSC addresses::
+
+    backend: gpiod          # chip, gpiod or sim (default: chip)
+    chip: /dev/gpiochip0    # GPIO chip device (gpiod backend only)
+    pullup: up              # bias of encoder pins: up, down or off (default: leave as is)
+    encoders:
+      - name: Main fader
+        pins: [XIO-P2, XIO-P4]    # DT, CLK
+        osc: /lr/mix/fader
+        scale: db                 # db or linear
+        min: -90
+        max: 10
+        step: 0.5
+        accel: 1
+    buttons:
+      - name: Main on
+        pin: XIO-P6
+        osc: /lr/mix/on
+        mode: toggle              # toggle or momentary
+        values: [0, 1]            # values sent for off / on resp. released / pressed
+        active_low: true          # pressed button pulls pin low (default)
+        pullup: up                # default: up if active_low, else down
+
+Encoders with the ``db`` scale move in steps of ``step`` dB between ``min`` and ``max`` and send
+fader values according to the X-AIR fader law. This is the default for addresses ending in
+``/fader`` or ``/level``. With the ``linear`` scale, values from ``min`` (default 0.0) to ``max``
+(default 1.0) in ``step`` increments (default: 1/100 of the range) are sent.
+
+Encoder and button changes are dispatched as events to the asyncio event loop, which converts
+them to OSC messages and passes them to a rate-limited output queue. Messages are only sent if
+the value differs from the last value sent or received from the mixer. The latency from the
+input edge to handing the UDP packet to the OS is recorded in a histogram.
+
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import sys
+import time
+
+from os.path import exists
+
+import yaml
+
+from .client import XAirClient
+from .latency import LatencyHistogram
+from .oscqueue import OSCOutputQueue
+from .rotary import (Button, CHIPBackend, GpiodBackend, RotaryEncoder, SimulatedBackend,
+                     quadrature_edges)
+from .scaling import SCALES
+
+
+log = logging.getLogger('xair-surface')
+BACKENDS = ('chip', 'gpiod', 'sim')
+DB_SCALE_PARAMS = ('fader', 'level')
+
+
+class EncoderControl:
+    """Mapping of a rotary encoder to an OSC parameter."""
+
+    def __init__(self, name='', pins=None, osc=None, scale=None, min=None, max=None, step=None,
+                 accel=0, clicks=1, reverse=False, description=''):
+        if not osc or not osc.startswith('/'):
+            raise ValueError("OSC address must start with a slash: %s" % osc)
+
+        if not isinstance(pins, (list, tuple)) or len(pins) != 2:
+            raise ValueError("'pins' must be a list of two pins (DT, CLK).")
+
+        if scale is None:
+            scale = 'db' if osc.rsplit('/', 1)[-1] in DB_SCALE_PARAMS else 'linear'
+
+        try:
+            scale_cls = SCALES[scale]
+        except KeyError:
+            raise ValueError("Unknown scale: %s" % scale)
+
+        self.name = name or osc
+        self.description = description
+        self.pins = tuple(pins)
+        self.osc = osc
+
+        try:
+            self.scale = scale_cls(**{key: value for key, value in
+                                      (('min', min), ('max', max), ('step', step))
+                                      if value is not None})
+        except ValueError as exc:
+            raise ValueError("Encoder '%s': %s" % (self.name, exc))
+
+        self.accel = accel
+        self.clicks = clicks
+        self.reverse = reverse
+
+
+class ButtonControl:
+    """Mapping of a push button to an OSC parameter."""
+
+    def __init__(self, name='', pin=None, osc=None, mode='toggle', values=(0, 1),
+                 active_low=True, pullup=None, description=''):
+        if not osc or not osc.startswith('/'):
+            raise ValueError("OSC address must start with a slash: %s" % osc)
+
+        if pin is None:
+            raise ValueError("Button needs a 'pin'.")
+
+        if mode not in ('toggle', 'momentary'):
+            raise ValueError("Unknown button mode: %s" % mode)
+
+        if len(values) != 2:
+            raise ValueError("'values' must be a list of two values.")
+
+        self.name = name or osc
+        self.description = description
+        self.pin = pin
+        self.osc = osc
+        self.mode = mode
+        self.values = tuple(int(value) for value in values)
+        self.active_low = active_low
+        self.pullup = pullup or ('up' if active_low else 'down')
+
+
+def load_config(filename):
+    """Read YAML configuration and return a dict with the options and lists of controls."""
+    if not exists(filename):
+        raise IOError("Config file not found: %s" % filename)
+
+    with open(filename) as fp:
+        data = yaml.safe_load(fp) or {}
+
+    try:
+        config = dict(data)
+        config['encoders'] = [EncoderControl(**spec) for spec in data.get('encoders') or ()]
+        config['buttons'] = [ButtonControl(**spec) for spec in data.get('buttons') or ()]
+    except (TypeError, ValueError) as exc:
+        raise IOError("Invalid control specification: %s" % exc)
+
+    return config
+
+
+class LatencySender:
+    """Wrap an OSC sender and record the time from input to packet for each message sent."""
+
+    def __init__(self, sender, clock=time.monotonic):
+        self.sender = sender
+        self.clock = clock
+        self.histogram = LatencyHistogram()
+        self._pending = {}
+        self._batch = []
+
+    def mark(self, path, timestamp):
+        """Remember input time of the oldest change of the parameter not sent yet."""
+        if timestamp is not None:
+            self._pending.setdefault(path, timestamp)
+
+    def send(self, path, *args):
+        self.sender.send(path, *args)
+        self._batch.append(path)
+
+    def flush(self):
+        self.sender.flush()
+        now = self.clock()
+
+        for path in self._batch:
+            timestamp = self._pending.pop(path, None)
+
+            if timestamp is not None:
+                self.histogram.add(now - timestamp)
+
+        self._batch.clear()
+
+
+class ControlSurface:
+    """Create encoders and buttons for the configured controls and send their changes via OSC.
+
+    ``make_backend`` is called to create the input backend for each control, for buttons with the
+    pull-up setting of the button as argument.
+    ``schedule`` is used by the controls to pass events to the event loop thread.
+
+    """
+
+    def __init__(self, config, osc, make_backend, schedule=None):
+        self.osc = osc
+        self.sent = {}
+        self.encoders = {}
+        self.buttons = {}
+
+        for ctrl in config['encoders']:
+            encoder = RotaryEncoder(*ctrl.pins, clicks=ctrl.clicks, min_val=0,
+                                    max_val=ctrl.scale.steps, accel=ctrl.accel,
+                                    reverse=ctrl.reverse, backend=make_backend(),
+                                    schedule=schedule, name=ctrl.name)
+            encoder.push_handlers(encoder_change=self.on_encoder)
+            self.encoders[encoder] = ctrl
+
+        for ctrl in config['buttons']:
+            button = Button(ctrl.pin, active_low=ctrl.active_low,
+                            backend=make_backend(ctrl.pullup), schedule=schedule, name=ctrl.name)
+            button.push_handlers(button_change=self.on_button)
+            button.state = 0
+            self.buttons[button] = ctrl
+
+    def close(self):
+        for control in list(self.encoders) + list(self.buttons):
+            control.close()
+
+    def send(self, path, arg, timestamp=None):
+        if self.sent.get(path) == arg:
+            return
+
+        self.sent[path] = arg
+
+        if hasattr(self.osc.sender, 'mark'):
+            self.osc.sender.mark(path, timestamp)
+
+        self.osc.send(path, arg)
+
+    def on_encoder(self, event):
+        ctrl = self.encoders[event.encoder]
+        self.send(ctrl.osc, (ctrl.scale.typetag, ctrl.scale.to_osc(event.value)), event.timestamp)
+
+    def on_button(self, event):
+        button = event.button
+        ctrl = self.buttons[button]
+
+        if ctrl.mode == 'toggle':
+            if not event.pressed:
+                return
+
+            button.state = 1 - button.state
+        else:
+            button.state = int(event.pressed)
+
+        self.send(ctrl.osc, ('i', ctrl.values[button.state]), event.timestamp)
+
+    def on_mixer_change(self, msg):
+        """Follow parameter changes made on the mixer or by other clients."""
+        if not msg.args:
+            return
+
+        for encoder, ctrl in self.encoders.items():
+            if ctrl.osc == msg.path:
+                encoder.set_value(ctrl.scale.from_osc(msg.args[0]))
+                self.sent[msg.path] = (msg.types[0], msg.args[0])
+
+        for button, ctrl in self.buttons.items():
+            if ctrl.osc == msg.path and ctrl.mode == 'toggle':
+                button.state = int(msg.args[0] == ctrl.values[1])
+                self.sent[msg.path] = (msg.types[0], msg.args[0])
+
+    async def sync(self, client):
+        """Query the current values of all mapped parameters from the mixer."""
+        paths = {ctrl.osc for ctrl in list(self.encoders.values()) + list(self.buttons.values())}
+        replies = await client.query_many(sorted(paths))
+
+        for path, msg in replies.items():
+            if msg is None:
+                log.warning("No reply to query of %s.", path)
+            else:
+                self.on_mixer_change(msg)
+
+
+def simulate_input(surface, duration, seed=None):
+    """Turn all encoders and press all buttons with simulated backends randomly for a while.
+
+    Blocks until done, so it should be run in a separate thread.
+
+    """
+    rnd = random.Random(seed)
+    sequences = []
+
+    for encoder in surface.encoders:
+        edges = []
+        timestamp = 0.0
+        levels = encoder.backend.levels
+
+        while timestamp < duration:
+            count = rnd.choice((-1, 1)) * rnd.randint(4, 48)
+            interval = rnd.uniform(0.0005, 0.005)
+            edges.extend(quadrature_edges(count, interval, timestamp, levels))
+            levels = edges[-1][1]
+            timestamp = edges[-1][0] + rnd.uniform(0.05, 0.3)
+
+        sequences.append((encoder.backend, edges))
+
+    for button in surface.buttons:
+        edges = []
+        timestamp = rnd.uniform(0.1, 0.5)
+
+        while timestamp < duration:
+            edges.extend([(timestamp, 0), (timestamp + rnd.uniform(0.05, 0.2), 1)])
+            timestamp += rnd.uniform(0.3, 1.0)
+
+        sequences.append((button.backend, edges))
+
+    # merge into one time-ordered sequence, so all inputs are replayed concurrently
+    merged = sorted(((timestamp, i, levels) for i, (_, edges) in enumerate(sequences)
+                     for timestamp, levels in edges))
+    backends = [backend for backend, _ in sequences]
+    clock = time.monotonic
+    start = clock()
+
+    for timestamp, i, levels in merged:
+        delay = start + timestamp - clock()
+
+        if delay > 0:
+            time.sleep(delay)
+
+        backends[i].feed(levels)
+
+
+def make_backend_factory(name, chip='/dev/gpiochip0', pullup=None):
+    """Return a function, which creates an input backend with the given or default pull-up."""
+    if name == 'chip':
+        return lambda bias=pullup: CHIPBackend(bias)
+    elif name == 'gpiod':
+        return lambda bias=pullup: GpiodBackend(chip, bias)
+    elif name == 'sim':
+        return lambda bias=None: SimulatedBackend(levels=0b00)
+
+    raise ValueError("Unknown input backend: %s" % name)
+
+
+async def run_surface(config, args):
+    """Run the control surface until cancelled or until the input simulation is done."""
+    loop = asyncio.get_running_loop()
+    mixer_transport = None
+    server, port = args.server, args.oscport
+
+    if args.fake_mixer:
+        from .fakemixer import catalog_state, start_fake_mixer
+
+        mixer_transport, _ = await start_fake_mixer('127.0.0.1', 0, state=catalog_state())
+        server, port = mixer_transport.get_extra_info('sockname')[:2]
+        log.info("Started fake mixer on %s:%i.", server, port)
+
+    try:
+        client = await XAirClient(server, port).connect()
+    except OSError as exc:
+        return "Invalid OSC destination: %s" % exc
+
+    if args.no_bundles:
+        client.bundler.use_bundles = False
+    elif not await client.probe_bundles():
+        log.warning("No reply to bundled OSC query from %s:%i. Not using OSC bundles.",
+                    server, port)
+        client.bundler.use_bundles = False
+
+    sender = LatencySender(client.bundler)
+    osc = OSCOutputQueue(sender, rate=args.rate, address_rate=args.address_rate)
+    backend = args.backend or config.get('backend', 'chip')
+
+    try:
+        surface = ControlSurface(config, osc,
+                                 make_backend_factory(backend,
+                                                      config.get('chip', '/dev/gpiochip0'),
+                                                      config.get('pullup')),
+                                 schedule=loop.call_soon_threadsafe)
+    except (ImportError, OSError, ValueError) as exc:
+        client.close()
+        return "Could not set up inputs: %s" % exc
+
+    client.add_handler(surface.on_mixer_change)
+    client.start_keepalive()
+    await surface.sync(client)
+    tasks = [asyncio.ensure_future(osc.run())]
+
+    if args.report_interval:
+        tasks.append(asyncio.ensure_future(report(sender.histogram, args.report_interval)))
+
+    try:
+        if args.simulate:
+            await loop.run_in_executor(None, simulate_input, surface, args.simulate)
+            # let the output queue send the last changes
+            await asyncio.sleep(0.1)
+        else:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        surface.close()
+        osc.drain()
+        client.close()
+
+        if mixer_transport is not None:
+            mixer_transport.close()
+
+        log.info("OSC messages sent: %(sent)i, coalesced: %(coalesced)i", osc.stats())
+        log.info("Input to packet latency: %s", sender.histogram.format())
+
+
+async def report(histogram, interval):
+    while True:
+        await asyncio.sleep(interval)
+        log.info("Input to packet latency: %s", histogram.summary())
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('-b', '--backend', choices=BACKENDS,
+                    help="Input backend (default: from config or 'chip')")
+    ap.add_argument('-s', '--server', default='192.168.1.1',
+                    help="Hostname or IP address of X-AIR's UDP server (default: %(default)s)")
+    ap.add_argument('-o', '--oscport', type=int, default=10024,
+                    help="UDP destination port of the X-AIR's server (default: %(default)s)")
+    ap.add_argument('-r', '--rate', type=float, default=500.0,
+                    help="Max. number of OSC messages sent per second (default: %(default)s)")
+    ap.add_argument('-a', '--address-rate', type=float, default=50.0,
+                    help="Max. number of messages per second sent to the same address of a "
+                         "continuous parameter (default: %(default)s)")
+    ap.add_argument('-n', '--no-bundles', action="store_true",
+                    help="Send each OSC message in a packet of its own")
+    ap.add_argument('-i', '--report-interval', type=float, default=0,
+                    help="Log latency summary every N seconds (default: only on exit)")
+    ap.add_argument('-f', '--fake-mixer', action="store_true",
+                    help="Start a local fake mixer and send to it instead of --server")
+    ap.add_argument('--simulate', type=float, metavar="SECONDS",
+                    help="Use simulated inputs, operate them randomly for given time and exit")
+    ap.add_argument('-v', '--verbose', action="store_true",
+                    help="Be verbose")
+    ap.add_argument('config', metavar="CONFIG",
+                    help="Configuration file in YAML syntax")
+
+    args = ap.parse_args(args if args is not None else sys.argv[1:])
+
+    logging.basicConfig(format="%(name)s: %(levelname)s - %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    if args.simulate:
+        args.backend = 'sim'
+
+    try:
+        config = load_config(args.config)
+    except IOError as exc:
+        return "Could not load configuration: %s" % exc
+
+    try:
+        return asyncio.run(run_surface(config, args))
+    except KeyboardInterrupt:
+        print('')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]) or 0)
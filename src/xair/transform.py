@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#
+# transform.py
+#
+"""Value transforms for MIDI to OSC mappings.
+
+A `Transform` maps raw MIDI values, either 7-bit (0..127) or 14-bit (0..16383), to parameter
+values with a curve:
+
+``linear``
+    from ``min`` to ``max`` (default: 0.0 to 1.0)
+``log``
+    logarithmically from ``min`` to ``max``, which must be positive, e.g. frequencies
+``db``
+    linearly in dB from ``min`` to ``max`` (default: -90 to +10 dB), converted to X-AIR fader
+    values with the mixer's fader law (see `xair.scaling`)
+``table``
+    piecewise-linearly interpolated between ``points``, a list of ``[raw value, output value]``
+    pairs
+
+The curve is evaluated for all raw values once, when the transform is created, so converting a
+value is a single table lookup.
+
+14-bit values are sent as two controller changes, the MSB and the LSB. `MSBLSBMerger` combines
+them and `NRPNDecoder` decodes non-registered parameter numbers (NRPN) and their data entry
+controllers.
+
+"""
+
+import bisect
+
+from array import array
+
+from .scaling import db_to_fader
+
+
+CURVES = ('linear', 'log', 'db', 'table')
+MODES = ('7bit', '14bit', 'nrpn')
+# Max. time to wait for the LSB after the MSB of a 14-bit value
+LSB_TIMEOUT = 0.02
+
+NRPN_MSB = 99
+NRPN_LSB = 98
+RPN_MSB = 101
+RPN_LSB = 100
+DATA_ENTRY_MSB = 6
+DATA_ENTRY_LSB = 38
+DATA_INCREMENT = 96
+DATA_DECREMENT = 97
+NRPN_CONTROLLERS = frozenset((NRPN_MSB, NRPN_LSB, RPN_MSB, RPN_LSB, DATA_ENTRY_MSB,
+                              DATA_ENTRY_LSB, DATA_INCREMENT, DATA_DECREMENT))
+
+
+def make_curve(curve='linear', min=None, max=None, points=None, resolution=128):
+    """Return a function mapping raw values 0..resolution-1 to output values with given curve.
+
+    :raises ValueError: if the curve name or its parameters are invalid.
+
+    """
+    top = resolution - 1
+
+    if curve == 'linear':
+        lo = 0.0 if min is None else float(min)
+        hi = 1.0 if max is None else float(max)
+        return lambda raw: lo + (hi - lo) * raw / top
+    elif curve == 'log':
+        if min is None or max is None or min <= 0 or max <= 0:
+            raise ValueError("Curve 'log' requires positive 'min' and 'max' values.")
+
+        ratio = float(max) / min
+        return lambda raw: min * ratio ** (raw / top)
+    elif curve == 'db':
+        lo = -90.0 if min is None else float(min)
+        hi = 10.0 if max is None else float(max)
+        return lambda raw: db_to_fader(lo + (hi - lo) * raw / top)
+    elif curve == 'table':
+        try:
+            points = sorted((float(x), float(y)) for x, y in points)
+        except (TypeError, ValueError):
+            raise ValueError("Curve 'table' requires a list of [raw value, output value] pairs.")
+
+        if not points:
+            raise ValueError("Curve 'table' requires at least one point.")
+
+        xs = [x for x, _ in points]
+
+        def interpolate(raw):
+            pos = bisect.bisect_right(xs, raw)
+
+            if pos == 0:
+                return points[0][1]
+            elif pos == len(points):
+                return points[-1][1]
+
+            (x0, y0), (x1, y1) = points[pos - 1], points[pos]
+            return y0 + (y1 - y0) * (raw - x0) / (x1 - x0)
+
+        return interpolate
+
+    raise ValueError("Unknown curve '%s', must be one of: %s" % (curve, ", ".join(CURVES)))
+
+
+class Transform:
+    """Map raw MIDI values to output values through a lookup table computed from a curve.
+
+    ``mode`` is ``7bit`` for values from a single data byte, given by ``source`` (``data1`` or
+    ``data2``), ``14bit`` for values combined from an MSB and an LSB controller (``lsb``, by
+    default the MSB controller + 32) or from the data bytes of a pitch bend message, or ``nrpn``
+    for the 14-bit values of the non-registered parameter ``nrpn``.
+
+    :raises ValueError: if any of the parameters is invalid.
+
+    """
+
+    def __init__(self, curve='linear', min=None, max=None, points=None, mode='7bit',
+                 source='data2', lsb=None, nrpn=None, timeout=LSB_TIMEOUT):
+        if mode not in MODES:
+            raise ValueError("Unknown transform mode '%s', must be one of: %s" %
+                             (mode, ", ".join(MODES)))
+
+        if source not in ('data1', 'data2'):
+            raise ValueError("Transform source must be 'data1' or 'data2'.")
+
+        if mode == 'nrpn' and not (isinstance(nrpn, int) and 0 <= nrpn < 16384):
+            raise ValueError("Transform mode 'nrpn' requires a parameter number 'nrpn' "
+                             "(0..16383).")
+
+        self.curve = curve
+        self.mode = mode
+        self.source = source
+        self.lsb = lsb
+        self.nrpn = nrpn
+        self.timeout = float(timeout)
+        self.resolution = 128 if mode == '7bit' else 16384
+        func = make_curve(curve, min, max, points, self.resolution)
+        self.table = array('d', (func(raw) for raw in range(self.resolution)))
+        self._inverse = None
+
+    def table_for(self, typetag):
+        """Return the lookup table with output values converted for given OSC type tag."""
+        if typetag == 'i':
+            return array('i', (int(round(value)) for value in self.table))
+        elif typetag == 's':
+            return tuple(str(value) for value in self.table)
+
+        return self.table
+
+    def inverse(self, value):
+        """Return the raw value, whose output value is nearest to given value."""
+        if self._inverse is None:
+            self._inverse = sorted((output, raw) for raw, output in enumerate(self.table))
+
+        pos = bisect.bisect_left(self._inverse, (value, -1))
+        candidates = self._inverse[max(0, pos - 1):pos + 1]
+        return min(candidates, key=lambda item: abs(item[0] - value))[1]
+
+
+class MSBLSBMerger:
+    """Combine 14-bit values sent as separate MSB and LSB controller values.
+
+    Like specified for MIDI controllers, an MSB resets the LSB to zero. The value is passed to
+    ``callback`` when the LSB following the MSB arrives or, if there is none within ``timeout``
+    seconds, with the LSB set to zero. An LSB without a new MSB changes the value immediately.
+
+    ``call_later(delay, func)`` is used to schedule the timeout, e.g. ``loop.call_later``. Without
+    it, an MSB is passed on immediately.
+
+    """
+
+    def __init__(self, callback, timeout=LSB_TIMEOUT, call_later=None):
+        self.callback = callback
+        self.timeout = timeout
+        self.call_later = call_later
+        self.msb = None
+        self._pending = False
+        self._timer = None
+
+    def msb_received(self, msb):
+        self.flush()
+        self.msb = msb
+        self._pending = True
+
+        if self.call_later is None:
+            self.flush()
+        else:
+            self._timer = self.call_later(self.timeout, self.flush)
+
+    def lsb_received(self, lsb):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self.msb is not None:
+            self._pending = False
+            self.callback(self.msb << 7 | lsb)
+
+    def flush(self):
+        """Pass on a held MSB with the LSB set to zero."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self._pending:
+            self._pending = False
+            self.callback(self.msb << 7)
+
+    def reset(self):
+        self.flush()
+        self.msb = None
+
+    def discard(self):
+        """Forget a held MSB without passing it on and return True, if there was one."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending = self._pending
+        self._pending = False
+        self.msb = None
+        return pending
+
+
+class NRPNDecoder:
+    """Decode NRPN messages from the controller changes on one MIDI channel.
+
+    `feed` must be called with all NRPN-related controller changes (see ``NRPN_CONTROLLERS``).
+    Each new value of the selected parameter is passed to ``callback(param, value)``. Data entry
+    for registered parameters (RPN) is ignored.
+
+    """
+
+    def __init__(self, callback, timeout=LSB_TIMEOUT, call_later=None):
+        self.callback = callback
+        self.param = None
+        self.values = {}
+        self._param_msb = 0
+        self._merger = MSBLSBMerger(self._value, timeout, call_later)
+
+    def feed(self, controller, value):
+        if controller == NRPN_MSB:
+            self._merger.reset()
+            self._param_msb = value
+            self.param = None
+        elif controller == NRPN_LSB:
+            self._merger.reset()
+            self.param = self._param_msb << 7 | value
+        elif controller == RPN_MSB or controller == RPN_LSB:
+            self._merger.reset()
+            self.param = None
+        elif self.param is None:
+            return
+        elif controller == DATA_ENTRY_MSB:
+            self._merger.msb_received(value)
+        elif controller == DATA_ENTRY_LSB:
+            self._merger.lsb_received(value)
+        elif controller == DATA_INCREMENT or controller == DATA_DECREMENT:
+            self._merger.flush()
+            step = 1 if controller == DATA_INCREMENT else -1
+            self._value(max(0, min(16383, self.values.get(self.param, 0) + step)))
+
+    def discard(self):
+        """Forget a held data entry MSB without passing it on and return True, if there was one."""
+        return self._merger.discard()
+
+    def _value(self, value):
+        self.values[self.param] = value
+        self.callback(self.param, value)
+
+
+def _test():
+    for curve, kwargs in (('linear', {}), ('log', dict(min=20, max=20000)), ('db', {}),
+                          ('table', dict(points=[[0, 0.0], [64, 0.75], [127, 1.0]]))):
+        transform = Transform(curve, **kwargs)
+        print("%-6s %s" % (curve, " ".join("%.3f" % transform.table[raw]
+                                           for raw in (0, 32, 64, 96, 127))))
+
+    decoder = NRPNDecoder(lambda param, value: print("NRPN %i = %i" % (param, value)))
+
+    for controller, value in ((99, 1), (98, 2), (6, 64), (38, 10), (96, 0), (6, 3)):
+        decoder.feed(controller, value)
+
+
+if __name__ == '__main__':
+    _test()
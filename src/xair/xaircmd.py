@@ -3,46 +3,55 @@
 #
 # xaircmd.py
 #
-"""Simple X-AIR mixer debugging REPL."""
+"""Simple X-AIR mixer debugging REPL.
+
+With ``--record FILE``, no REPL is started. Instead, all parameter changes and meter frames
+received from the mixer are recorded to a binary recording file (see `xair.recorder`), until
+interrupted with Control-C.
+
+"""
 
 from __future__ import division, print_function, unicode_literals
 
 import argparse
 import ast
-import csv
+import asyncio
 import logging
-import queue
 import shlex
 import sys
+import threading
+import time
 
-from collections import namedtuple
-from os.path import dirname, expanduser, join
+from os.path import expanduser, join
 
 import cmd2 as cmd
 from colorama import Fore
-from liblo import ServerThread
+
+from .catalog import XAirCommand, load_catalog, parse_commands  # noqa:F401
+from .client import XAirClient
+from .meters import Meters
+from .mirror import StateMirror
+from .osc import OSCError
+from .recorder import Recorder
+from .snapshot import is_state_address, read_snapshot, restore_snapshot, write_snapshot
 
 
 log = logging.getLogger('xaircmd')
 
-XAirCommand = namedtuple('XAirCommand', 'address,types,range,values,description'.split(','))
+# Addresses, which trigger an action when sent without arguments
+ACTION_ADDRESSES = ('/-action/', '/-snap/delete', '/-snap/load', '/-snap/save')
 
 
-def parse_commands(filename='xair-cmdlist.csv'):
-    commands = dict()
-    with open(join(dirname(__file__), filename), newline='') as csvfile:
-        reader = csv.reader(csvfile, delimiter=',', strict=True)
-        try:
-            for i, row in enumerate(reader):
-                if i == 0 and tuple(row) == XAirCommand._fields:
-                    continue
-                try:
-                    commands[row[0]] = XAirCommand(*row)
-                except TypeError:
-                    log.warn("Invalid command in '%s', line %i: %r", filename, i, row)
-        except csv.Error as exc:
-            log.error("Error in command file '%s', line %i: %s", filename, i, exc)
-    return commands
+OSC_TYPES = {
+    'f': float,
+    'i': int,
+    's': str,
+}
+
+
+def is_queryable(address):
+    """Return True if the given address can be safely queried by sending it without arguments."""
+    return not address.startswith(ACTION_ADDRESSES)
 
 
 class XAirCmdApp(cmd.Cmd):
@@ -55,6 +64,8 @@ class XAirCmdApp(cmd.Cmd):
     def __init__(self, server, destport=10024, srcport=11111, debug=False, **kwargs):
         """Class initialiser."""
         self.timeout = self.settable['timeout'] = 500
+        self.retries = self.settable['retries'] = 2
+        self.cache_age = self.settable['cache_age'] = 5000
         self.server = self.settable['server'] = server
         self.destport = self.settable['destport'] = destport
         # add built-in custom command shortcuts
@@ -71,21 +82,28 @@ class XAirCmdApp(cmd.Cmd):
         })
         self.srcport = srcport
         self.debug = debug
-        self.osc_commands = parse_commands()
-        self.osc_command_names = sorted([cmd.address.lstrip('/')
-                                         for cmd in self.osc_commands.values()])
-        self.queue = queue.Queue()
-        self.osc = ServerThread(self.srcport)
-        self.osc.add_method(None, None, self.osc_recv)
+        self._catalog = None
+        self.client = None
+        self.mirror = None
+        self._bundles = None
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = None
 
         # hooks
         self.register_preloop_hook(self.start_osc_server)
         self.register_postloop_hook(self.stop_osc_server)
 
-    def osc_recv(self, path, args, types, addr):
-        log.debug("OSC RECV (%s, %s): %s %s [%s]", addr.hostname, addr.port, path,
-                  types, ", ".join(repr(arg) for arg in args))
-        self.queue.put((path, args, types, addr))
+    @property
+    def catalog(self):
+        """The command catalog trie, loaded from the binary cache on first use."""
+        if self._catalog is None:
+            self._catalog = load_catalog()
+
+        return self._catalog
+
+    def run_async(self, coro):
+        """Run coroutine in the OSC client's event loop thread and return its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
 
     def do_osc(self, line):
         if not line:
@@ -110,19 +128,132 @@ class XAirCmdApp(cmd.Cmd):
                 except:  # noqa:E722
                     oscargs.append(arg)
 
-        log.debug("OSC SEND -> (%s, %s): %s %s", self.server, self.destport, oscaddr,
-                  "".join("%r" % arg for arg in oscargs))
-        self.osc.send((self.server, self.destport), oscaddr, *oscargs)
+        if oscaddr not in self.catalog:
+            self.p_warn("Unknown OSC address: {}".format(oscaddr))
+        else:
+            oscargs = self.coerce_args(oscaddr, oscargs)
+
+        if oscargs:
+            query = self.client.query(oscaddr, *oscargs, timeout=self.timeout / 1000)
+
+            if oscaddr in self.catalog:
+                self.loop.call_soon_threadsafe(self.mirror.set, oscaddr, *oscargs)
+        elif self.cache_age > 0 and is_queryable(oscaddr):
+            query = self.mirror.read(oscaddr, max_age=self.cache_age / 1000,
+                                     timeout=self.timeout / 1000)
+        else:
+            query = self.client.query(oscaddr, timeout=self.timeout / 1000)
 
         try:
-            path, args, types, addr = self.queue.get(timeout=self.timeout / 1000)
-        except queue.Empty:
+            msg = self.run_async(query)
+        except asyncio.TimeoutError:
             self.p_warn("No reply within timeout ({:d} msec).".format(self.timeout))
+        except OSCError as exc:
+            self.perror("Could not send OSC message: {}".format(exc))
         else:
-            self.p_ok("{} {} [{}]".format(path, types, ", ".join(repr(arg) for arg in args)))
+            self.p_ok("{} {} [{}]".format(msg.path, msg.types,
+                                          ", ".join(repr(arg) for arg in msg.args)))
+
+    def coerce_args(self, oscaddr, oscargs):
+        """Convert arguments to the OSC types of the parameter given in the catalog, if possible."""
+        types = self.catalog.types(oscaddr)
+
+        if len(types) != len(oscargs):
+            return oscargs
+
+        coerced = []
+        for tag, arg in zip(types, oscargs):
+            try:
+                coerced.append((tag, OSC_TYPES[tag](arg)) if tag in OSC_TYPES else arg)
+            except (TypeError, ValueError):
+                coerced.append(arg)
+
+        return coerced
 
     def help_osc(self):
         self.poutput("osc ADDR [arg1 [arg2] ... [argn]]")
+        self.poutput("Without arguments, the value is read from the local state mirror if it was "
+                     "received less than 'cache_age' msec ago.")
+
+    def do_get(self, line):
+        """Query all known parameters, optionally only those starting with given prefixes.
+
+        All queries are sent back to back and replies are matched to them by address.
+
+        """
+        prefixes = tuple('/' + prefix.lstrip('/') for prefix in line.split()) or ('/',)
+        addresses = [address for address in self.catalog
+                     if address.startswith(prefixes) and is_queryable(address)]
+
+        start = time.perf_counter()
+        replies = self.run_async(self.client.query_many(addresses, timeout=self.timeout / 1000,
+                                                        retries=self.retries))
+        elapsed = (time.perf_counter() - start) * 1000
+        missing = 0
+
+        for address, msg in replies.items():
+            if msg is None:
+                missing += 1
+                self.p_warn("{} - no reply".format(address))
+            else:
+                self.p_ok("{} {} [{}]".format(msg.path, msg.types,
+                                              ", ".join(repr(arg) for arg in msg.args)))
+
+        self.poutput("{:d} queries, {:d} without reply, {:.1f} msec.".format(
+            len(replies), missing, elapsed))
+
+    def complete_get(self, text, line, begidx, endidx):
+        return self.complete_osc(text, line, begidx, endidx)
+
+    def do_dump(self, line):
+        """Save the state of all mixer parameters to a snapshot file."""
+        if not line.strip():
+            return self.perror("Usage: dump FILENAME")
+
+        addresses = [address for address in self.catalog
+                     if is_state_address(address) and is_queryable(address)]
+        start = time.perf_counter()
+        replies = self.run_async(self.client.query_many(addresses, timeout=self.timeout / 1000,
+                                                        retries=self.retries))
+        elapsed = (time.perf_counter() - start) * 1000
+        messages = [msg for msg in replies.values() if msg is not None]
+
+        try:
+            write_snapshot(line.strip(), messages)
+        except OSError as exc:
+            return self.perror("Could not write snapshot: {}".format(exc))
+
+        self.p_ok("Saved {:d} of {:d} parameters in {:.1f} msec.".format(
+            len(messages), len(addresses), elapsed))
+
+    def do_restore(self, line):
+        """Restore mixer parameters from a snapshot file, sending only changed values."""
+        if not line.strip():
+            return self.perror("Usage: restore FILENAME")
+
+        try:
+            saved = read_snapshot(line.strip())
+        except (OSError, OSCError) as exc:
+            return self.perror("Could not read snapshot: {}".format(exc))
+
+        start = time.perf_counter()
+        changed, packets = self.run_async(self._restore(saved))
+        elapsed = (time.perf_counter() - start) * 1000
+        self.p_ok("Restored {:d} of {:d} parameters in {:d} packets in {:.1f} msec.".format(
+            len(changed), len(saved), packets, elapsed))
+
+    async def _restore(self, saved):
+        changed, packets = await restore_snapshot(self.client, saved, self.timeout / 1000,
+                                                  self.retries,
+                                                  probe_bundles=self._bundles is None)
+
+        if changed:
+            self._bundles = self.client.bundler.use_bundles
+
+        for msg in changed:
+            self.mirror.update(msg)
+
+        return changed, packets
 
     def complete_osc(self, text, line, begidx, endidx):
         log.debug((text, line, begidx, endidx))
@@ -130,7 +261,12 @@ class XAirCmdApp(cmd.Cmd):
         #if not text.startswith('/'):
         #    text = '/' + text
 
-        return self.delimiter_complete(text, line, begidx, endidx, self.osc_command_names, '/')
+        matches = self.catalog.complete(text)
+
+        if len(matches) == 1 and matches[0].endswith('/'):
+            self.allow_appended_space = False
+
+        return matches
 
     def p_ok(self, msg):
         self.poutput(msg, color=Fore.GREEN)
@@ -139,10 +275,19 @@ class XAirCmdApp(cmd.Cmd):
         self.poutput(msg, color=Fore.YELLOW)
 
     def start_osc_server(self) -> None:
-        self.osc.start()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name='xair-client',
+                                             daemon=True)
+        self._loop_thread.start()
+        self.client = self.run_async(
+            XAirClient(self.server, self.destport, self.srcport).connect())
+        self.mirror = StateMirror(self.client)
+        self.loop.call_soon_threadsafe(self.mirror.start)
 
     def stop_osc_server(self) -> None:
-        self.osc.stop()
+        self.loop.call_soon_threadsafe(self.mirror.stop)
+        self.loop.call_soon_threadsafe(self.client.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
         self.poutput('')
 
     def postparse(self, parse_result) -> None:
@@ -150,6 +295,42 @@ class XAirCmdApp(cmd.Cmd):
         return parse_result
 
 
+def record(filename, server, destport=10024, srcport=11111, banks=(), duration=None):
+    """Record all messages and meter frames received from the mixer to given file.
+
+    Runs until the given duration in seconds has passed or until interrupted.
+
+    """
+    recorder = Recorder(filename)
+
+    async def run():
+        async with XAirClient(server, destport, srcport) as client:
+            client.add_monitor(recorder.packet_received)
+            client.start_keepalive()
+            meters = Meters(client, banks)
+            meters.start()
+
+            try:
+                if duration is None:
+                    await asyncio.get_running_loop().create_future()
+                else:
+                    await asyncio.sleep(duration)
+            finally:
+                meters.stop()
+
+    print("Recording to '{}' (Control-C to stop)...".format(filename))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+
+    stats = recorder.stats()
+    print("Recorded {records:d} messages in {blocks:d} blocks, {bytes:d} bytes.".format(**stats))
+
+
 def main(args=None):
     ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
     ap.add_argument('-v', '--verbose', action="store_true",
@@ -158,6 +339,12 @@ def main(args=None):
                     help="UDP source port of the client (default: %(default)s)")
     ap.add_argument('-p', '--destport', type=int, default=10024,
                     help="UDP destination port of the server (default: %(default)s)")
+    ap.add_argument('-r', '--record', metavar="FILE",
+                    help="Record received messages and meters to FILE instead of starting the REPL")
+    ap.add_argument('-m', '--meters', default='0,1,2,3,4,5',
+                    help="Comma-separated meter banks to record (default: %(default)s)")
+    ap.add_argument('-d', '--duration', type=float,
+                    help="Stop recording after given number of seconds")
     ap.add_argument('server', metavar="ADDRESS", nargs='?', default="192.168.1.1",
                     help="Hostname or IP address of X-AIR's UDP server (default: %(default)s)")
 
@@ -166,6 +353,11 @@ def main(args=None):
     logging.basicConfig(format="%(levelname)s - %(message)s", filename="xaircmd.log",
                         level=logging.DEBUG if args.verbose else logging.INFO)
 
+    if args.record:
+        banks = [int(bank) for bank in args.meters.split(',') if bank.strip()]
+        return record(args.record, args.server, args.destport, args.srcport, banks,
+                      args.duration)
+
     app = XAirCmdApp(args.server, args.destport, args.srcport, args.verbose,
                      persistent_history_file=join(expanduser("~"), ".xaircmd_history"))
     return app.cmdloop()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+#
+# conftest.py
+#
+"""Make the package importable from the source tree when running the tests."""
+
+import sys
+
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'src'))
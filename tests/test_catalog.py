@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# test_catalog.py
+#
+"""Tests for the binary cache of the command catalog."""
+
+import os
+
+import pytest
+
+from xair import catalog
+from xair.catalog import CACHE_MAGIC, CACHE_VERSION, CommandTrie, load_catalog
+
+
+CSV = """\
+address,types,range,values,description
+/ch/{01..02}/mix/fader,f,,,"Fader"
+/lr/mix/on,i,,,"Main on"
+"""
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """Return paths of a small CSV catalog, a cache next to it and in the user cache dir."""
+    csvpath = str(tmp_path / 'cmdlist.csv')
+    cachepaths = (csvpath + '.cache', str(tmp_path / 'user' / 'cmdlist.csv.cache'))
+
+    with open(csvpath, 'w') as fp:
+        fp.write(CSV)
+
+    monkeypatch.setattr(catalog, '_cache_filenames', lambda filename: (csvpath, cachepaths))
+    return csvpath, cachepaths
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Count how often the CSV file is parsed."""
+    calls = []
+    from_catalog = CommandTrie.from_catalog.__func__
+
+    def counting(cls, filename='xair-cmdlist.csv'):
+        calls.append(filename)
+        return from_catalog(cls, filename)
+
+    monkeypatch.setattr(CommandTrie, 'from_catalog', classmethod(counting))
+    return calls
+
+
+def header(cachepath):
+    with open(cachepath, 'rb') as fp:
+        return catalog._cache_header.unpack(fp.read(catalog._cache_header.size))
+
+
+def test_cache_hit(files, parses):
+    csvpath, (cachepath, _) = files
+    trie = load_catalog(csvpath)
+    assert sorted(trie) == ['/ch/01/mix/fader', '/ch/02/mix/fader', '/lr/mix/on']
+    assert os.path.exists(cachepath)
+    cached = load_catalog(csvpath)
+    assert len(parses) == 1
+    assert sorted(cached) == sorted(trie)
+    assert cached.types('/lr/mix/on') == 'i'
+
+
+def test_touched_csv_updates_cache_header(files, parses, monkeypatch):
+    csvpath, (cachepath, _) = files
+    load_catalog(csvpath)
+    stat = os.stat(csvpath)
+    os.utime(csvpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert sorted(load_catalog(csvpath))[-1] == '/lr/mix/on'
+    assert len(parses) == 1
+    assert header(cachepath)[2] == stat.st_mtime_ns + 10 ** 9
+
+    # the next start does not hash the CSV file anymore
+    def no_hash(*args):
+        raise AssertionError("CSV file hashed")
+
+    monkeypatch.setattr('hashlib.sha1', no_hash)
+    load_catalog(csvpath)
+    assert len(parses) == 1
+
+
+def test_stale_cache(files, parses):
+    csvpath, _ = files
+    load_catalog(csvpath)
+
+    with open(csvpath, 'a') as fp:
+        fp.write('/lr/mix/fader,f,,,"Main fader"\n')
+
+    assert '/lr/mix/fader' in load_catalog(csvpath)
+    assert len(parses) == 2
+    assert '/lr/mix/fader' in load_catalog(csvpath)
+    assert len(parses) == 2
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'XAIRCAT',
+    b'NOTACAT\0' + bytes(50),
+    catalog._cache_header.pack(CACHE_MAGIC, CACHE_VERSION + 1, 0, 0, bytes(20)),
+    None,
+])
+def test_invalid_cache_is_rebuilt(files, parses, data):
+    csvpath, (cachepath, _) = files
+    load_catalog(csvpath)
+
+    if data is None:
+        # valid header, corrupt data
+        with open(cachepath, 'r+b') as fp:
+            fp.seek(catalog._cache_header.size)
+            fp.write(b'\xff' * 8)
+            fp.truncate()
+    else:
+        with open(cachepath, 'wb') as fp:
+            fp.write(data)
+
+    assert '/ch/02/mix/fader' in load_catalog(csvpath)
+    assert len(parses) == 2
+    assert header(cachepath)[:2] == (CACHE_MAGIC, CACHE_VERSION)
+
+
+def test_unwritable_directory_falls_back_to_user_cache(tmp_path, monkeypatch, parses):
+    csvpath = str(tmp_path / 'cmdlist.csv')
+
+    with open(csvpath, 'w') as fp:
+        fp.write(CSV)
+
+    # a cache directory, which can not be created, because a file is in the way
+    blocked = tmp_path / 'blocked'
+    blocked.write_text('')
+    cachepaths = (str(blocked / 'cmdlist.csv.cache'), str(tmp_path / 'user' / 'cmdlist.cache'))
+    monkeypatch.setattr(catalog, '_cache_filenames', lambda filename: (csvpath, cachepaths))
+    load_catalog(csvpath)
+    assert os.path.exists(cachepaths[1])
+    assert '/lr/mix/on' in load_catalog(csvpath)
+    assert len(parses) == 1
+
+
+def test_without_cache(files, parses):
+    csvpath, (cachepath, _) = files
+    assert len(load_catalog(csvpath, use_cache=False)) == 3
+    assert not os.path.exists(cachepath)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# test_client.py
+#
+"""Tests for XAirClient against a fake mixer on the loopback interface."""
+
+import asyncio
+
+from xair.client import XAirClient
+from xair.fakemixer import FakeMixer
+
+
+TIMEOUT = 0.2
+
+
+class DroppingMixer(FakeMixer):
+    """Fake mixer, which ignores the first query for each address."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.dropped = set()
+        self.queries = 0
+
+    def handle_message(self, msg, addr):
+        if not msg.args and msg.path.startswith('/ch/'):
+            self.queries += 1
+
+            if msg.path not in self.dropped:
+                self.dropped.add(msg.path)
+                return
+
+        super().handle_message(msg, addr)
+
+
+def run_with_mixer(test, mixer_class=FakeMixer, **kwargs):
+    """Start a fake mixer on a free loopback port and run ``test(port, mixer)`` against it."""
+
+    async def main():
+        transport, mixer = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: mixer_class(**kwargs), local_addr=('127.0.0.1', 0))
+
+        try:
+            return await test(transport.get_extra_info('sockname')[1], mixer)
+        finally:
+            transport.close()
+
+    return asyncio.run(main())
+
+
+def test_query_correlates_replies_by_address():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            client.send('/ch/03/mix/fader', 0.25)
+            client.send('/ch/05/mix/fader', 0.75)
+            replies = await asyncio.gather(*(client.query('/ch/%02i/mix/fader' % ch)
+                                             for ch in (5, 1, 3)))
+
+        return [(msg.path, msg.args[0]) for msg in replies]
+
+    assert run_with_mixer(test) == [('/ch/05/mix/fader', 0.75), ('/ch/01/mix/fader', 0.0),
+                                    ('/ch/03/mix/fader', 0.25)]
+
+
+def test_query_times_out_without_reply():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            try:
+                await client.query('/no/such/parameter')
+            except asyncio.TimeoutError:
+                return client._waiters
+
+    assert run_with_mixer(test) == {}
+
+
+def test_query_retry_resends_lost_query():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            reply = await client.query_retry('/ch/02/mix/on', retries=2)
+
+        return reply.args, mixer.queries
+
+    assert run_with_mixer(test, DroppingMixer) == ([1], 2)
+
+
+def test_query_retry_without_retries_raises():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            try:
+                await client.query_retry('/ch/02/mix/on', retries=0)
+            except asyncio.TimeoutError:
+                return True
+
+    assert run_with_mixer(test, DroppingMixer)
+
+
+def test_query_many_returns_replies_in_order():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            queries = ['/ch/%02i/mix/on' % ch for ch in range(16, 0, -1)]
+            replies = await client.query_many(queries + ['/no/such/parameter'], retries=1,
+                                              window=4)
+
+        return queries, replies
+
+    queries, replies = run_with_mixer(test)
+    assert list(replies) == queries + ['/no/such/parameter']
+    assert all(replies[path].args == [1] for path in queries)
+    assert replies['/no/such/parameter'] is None
+
+
+def test_probe_bundles():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            return await client.probe_bundles()
+
+    assert run_with_mixer(test) is True
+    assert run_with_mixer(test, accept_bundles=False) is False
+
+
+def test_bundle_fallback_sends_plain_messages():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            client.bundler.use_bundles = await client.probe_bundles()
+
+            for ch in range(1, 9):
+                client.bundler.send('/ch/%02i/mix/fader' % ch, ('f', ch / 8))
+
+            packets = client.bundler.flush()
+            replies = await client.query_many('/ch/%02i/mix/fader' % ch for ch in range(1, 9))
+
+        return packets, [msg.args[0] for msg in replies.values()]
+
+    packets, values = run_with_mixer(test, accept_bundles=False)
+    assert packets == 8
+    assert values == [ch / 8 for ch in range(1, 9)]
+
+
+def test_keepalive_receives_notifications():
+    async def test(port, mixer):
+        received = []
+
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as listener, \
+                XAirClient('127.0.0.1', port, timeout=TIMEOUT) as other:
+            listener.add_handler(received.append, '/ch/01/mix/fader')
+            listener.start_keepalive(interval=0.05)
+            await listener.query('/xinfo')
+            other.send('/ch/01/mix/fader', 0.5)
+            other.send('/ch/02/mix/fader', 0.5)
+            await asyncio.sleep(0.1)
+            listener.stop_keepalive()
+
+        return [(msg.path, msg.args) for msg in received]
+
+    assert run_with_mixer(test) == [('/ch/01/mix/fader', [0.5])]
+
+
+def test_no_notifications_without_xremote():
+    async def test(port, mixer):
+        received = []
+
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as listener, \
+                XAirClient('127.0.0.1', port, timeout=TIMEOUT) as other:
+            await listener.query('/xinfo')
+            listener.add_handler(received.append)
+            other.send('/ch/01/mix/fader', 0.5)
+            await asyncio.sleep(0.1)
+
+        return received
+
+    assert run_with_mixer(test) == []
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# test_eventqueue.py
+#
+"""Tests for the queued event dispatcher in asyncio and worker thread mode."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from xair.eventqueue import (COALESCE, DROP_NEWEST, DROP_OLDEST, QueuedEventDispatcher,
+                             offload)
+from xair.events import Event
+
+
+def fader(channel, value):
+    return Event(type='fader', channel=channel, value=value)
+
+
+def collect(dispatcher, *types):
+    """Push handlers, which append (type, value) of each event to the returned list."""
+    received = []
+    dispatcher.push_handlers(**{type_: lambda event: received.append((event.type, event.value))
+                                for type_ in types})
+    return received
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        QueuedEventDispatcher(policy='drop-all')
+
+
+def test_drop_oldest():
+    dispatcher = QueuedEventDispatcher(maxsize=3, policy=DROP_OLDEST)
+    received = collect(dispatcher, 'fader')
+    dispatcher.dispatch(*(fader(1, n) for n in range(5)))
+    dispatcher.drain()
+    assert received == [('fader', 2), ('fader', 3), ('fader', 4)]
+    stats = dispatcher.stats()
+    assert (stats['queued'], stats['dropped'], stats['dispatched']) == (5, 2, 3)
+    assert (stats['depth'], stats['max_depth']) == (0, 3)
+
+
+def test_drop_oldest_from_longest_lane():
+    dispatcher = QueuedEventDispatcher(maxsize=3, policy=DROP_OLDEST)
+    received = collect(dispatcher, 'fader', 'mute')
+    dispatcher.dispatch(fader(1, 0), fader(1, 1), fader(1, 2),
+                        Event(type='mute', channel=1, value=1))
+    assert dispatcher.stats()['lanes'] == {'fader': 2, 'mute': 1}
+    dispatcher.drain()
+    assert received == [('fader', 1), ('fader', 2), ('mute', 1)]
+
+
+def test_drop_newest():
+    dispatcher = QueuedEventDispatcher(maxsize=3, policy=DROP_NEWEST)
+    received = collect(dispatcher, 'fader')
+    dispatcher.dispatch(*(fader(1, n) for n in range(5)))
+    dispatcher.drain()
+    assert received == [('fader', 0), ('fader', 1), ('fader', 2)]
+    assert dispatcher.stats()['dropped'] == 2
+
+
+def test_coalesce_by_key():
+    dispatcher = QueuedEventDispatcher(maxsize=8, policy=COALESCE, key=lambda e: e.channel)
+    received = []
+    dispatcher.push_handlers(fader=lambda event: received.append((event.channel, event.value)))
+    dispatcher.dispatch(*(fader(n % 2, n) for n in range(10)))
+    dispatcher.drain()
+    # each queued event keeps its position and gets the latest value
+    assert received == [(0, 8), (1, 9)]
+    stats = dispatcher.stats()
+    assert (stats['queued'], stats['coalesced'], stats['dropped']) == (2, 8, 0)
+
+
+def test_coalesce_full_queue_drops_oldest():
+    dispatcher = QueuedEventDispatcher(maxsize=2, policy=COALESCE, key=lambda e: e.channel)
+    received = collect(dispatcher, 'fader')
+    dispatcher.dispatch(fader(1, 1), fader(2, 2), fader(3, 3), fader(2, 4))
+    dispatcher.drain()
+    assert received == [('fader', 4), ('fader', 3)]
+    assert dispatcher.stats()['dropped'] == 1
+
+
+def test_coalesce_does_not_cross_types():
+    dispatcher = QueuedEventDispatcher(policy=COALESCE, key=lambda e: e.channel)
+    received = collect(dispatcher, 'fader', 'mute')
+    dispatcher.dispatch(fader(1, 0.5), Event(type='mute', channel=1, value=1), fader(1, 0.75))
+    assert dispatcher.stats()['lanes'] == {'fader': 1, 'mute': 1}
+    dispatcher.drain()
+    assert sorted(received) == [('fader', 0.75), ('mute', 1)]
+
+
+def test_run_keeps_order_per_type():
+    dispatcher = QueuedEventDispatcher()
+    received = []
+
+    async def on_fader(event):
+        # later events of the same type must wait for this one
+        await asyncio.sleep(0.001 * (5 - event.value % 5))
+        received.append(('fader', event.value))
+
+    @offload
+    def on_meter(event):
+        time.sleep(0.001)
+        received.append(('meter', event.value))
+
+    dispatcher.push_handlers(fader=on_fader, meter=on_meter)
+
+    async def main():
+        runner = asyncio.ensure_future(dispatcher.run())
+
+        for n in range(10):
+            dispatcher.dispatch(fader(1, n), Event(type='meter', value=n))
+
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+
+            if dispatcher.stats()['dispatched'] == 20:
+                break
+
+        runner.cancel()
+
+    asyncio.run(main())
+    assert [value for type_, value in received if type_ == 'fader'] == list(range(10))
+    assert [value for type_, value in received if type_ == 'meter'] == list(range(10))
+    stats = dispatcher.stats()
+    assert (stats['queued'], stats['dispatched'], stats['depth']) == (20, 20, 0)
+
+
+def test_workers_keep_order_per_type():
+    dispatcher = QueuedEventDispatcher(maxsize=10000)
+    received = {}
+    lock = threading.Lock()
+
+    def handler(event):
+        with lock:
+            received.setdefault(event.type, []).append(event.value)
+
+    dispatcher.push_handlers(a=handler, b=handler, c=handler)
+    dispatcher.start(workers=3)
+
+    for n in range(300):
+        dispatcher.dispatch(*(Event(type=type_, value=n) for type_ in 'abc'))
+
+    dispatcher.stop()
+    assert received == {type_: list(range(300)) for type_ in 'abc'}
+    stats = dispatcher.stats()
+    assert (stats['queued'], stats['dispatched'], stats['dropped']) == (900, 900, 0)
+
+
+def test_stop_without_flush_keeps_events():
+    dispatcher = QueuedEventDispatcher()
+    started = threading.Event()
+    release = threading.Event()
+    received = []
+
+    def handler(event):
+        started.set()
+        release.wait(1.0)
+        received.append(event.value)
+
+    dispatcher.push_handlers(fader=handler)
+    dispatcher.start()
+    dispatcher.dispatch(*(fader(1, n) for n in range(3)))
+    assert started.wait(1.0)
+    stopper = threading.Thread(target=dispatcher.stop, kwargs=dict(flush=False))
+    stopper.start()
+
+    while dispatcher._running:
+        time.sleep(0.001)
+
+    release.set()
+    stopper.join()
+    assert received == [0]
+    assert dispatcher.stats()['depth'] == 2
+    dispatcher.drain()
+    assert received == [0, 1, 2]
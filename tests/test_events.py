@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# test_events.py
+#
+"""Tests for events, the event dispatcher and the event pool.
+
+The dispatcher tests run against `xair.events`, the `xair.uevents` compatibility module and a
+copy of `xair.events` loaded with `inspect` and `weakref` blocked, like on MicroPython.
+
+"""
+
+import gc
+import importlib
+import sys
+
+from importlib.util import module_from_spec, spec_from_file_location
+
+import pytest
+
+from xair.events import EventPool, SlotEvent
+
+
+class PoolTestEvent(SlotEvent):
+    type = 'pool_test'
+    __slots__ = ('channel', 'value')
+
+
+class NoAttrHandler:
+    """A callable, on which no attributes can be set, like functions on MicroPython."""
+    __slots__ = ('received', '__weakref__')
+
+    def __init__(self, received):
+        self.received = received
+
+    def __call__(self, event):
+        self.received.append(('callable', event.key))
+
+
+def load_restricted(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'inspect', None)
+    monkeypatch.setitem(sys.modules, 'weakref', None)
+    spec = spec_from_file_location('xair_events_restricted',
+                                   importlib.import_module('xair.events').__file__)
+    module = module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, spec.name, module)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(params=['xair.events', 'xair.uevents', 'restricted'])
+def events(request, monkeypatch):
+    if request.param == 'restricted':
+        return load_restricted(monkeypatch)
+
+    return importlib.import_module(request.param)
+
+
+def make_handler(events, received):
+    class Handler:
+        @events.on_event('fader')
+        def on_fader(self, event):
+            received.append(('method', event.channel))
+
+        @events.on_event('key')
+        def on_key(self, event):
+            received.append(('method', event.key))
+            return True
+
+    return Handler()
+
+
+def test_restricted_fallbacks(monkeypatch):
+    events = load_restricted(monkeypatch)
+    assert events.isclass.__module__ == events.__name__
+    assert events.WeakKeyDictionary is dict
+
+
+def test_no_metaclass_or_init_subclass(events):
+    # not supported by many MicroPython ports
+    events = sys.modules[events.on_event.__module__]
+
+    for cls in (events.Event, events.SlotEvent):
+        assert type(cls) is type
+        assert '__init_subclass__' not in vars(cls)
+
+
+def test_event_types(events):
+    events = sys.modules[events.on_event.__module__]
+
+    class KeyEvent(events.Event):
+        type = 'test_types_key'
+
+    class MeterEvent(events.SlotEvent):
+        type = 'test_types_meter'
+        __slots__ = ('values',)
+
+    class SubMeterEvent(MeterEvent):
+        type = 'test_types_submeter'
+
+    @events.register_event
+    class Registered:
+        type = 'test_types_registered'
+
+    types = events.Event.event_types()
+    assert {'test_types_key', 'test_types_meter', 'test_types_submeter',
+            'test_types_registered'} <= set(types)
+    assert set(events.SlotEvent.event_types()) == set(types)
+
+
+def test_slot_fields_inherited(events):
+    events = sys.modules[events.on_event.__module__]
+
+    class MeterEvent(events.SlotEvent):
+        type = 'test_fields_meter'
+        __slots__ = ('bank', 'values')
+
+    class TimedMeterEvent(MeterEvent):
+        __slots__ = 'timestamp'
+
+    class PlainMeterEvent(TimedMeterEvent):
+        pass
+
+    event = PlainMeterEvent(2, [0, 1], 1.5)
+    assert event._fields == ('bank', 'values', 'timestamp')
+    assert (event.bank, event.values, event.timestamp) == (2, [0, 1], 1.5)
+    assert repr(MeterEvent(1)) == "MeterEvent(bank=1, values=None)"
+
+
+def test_dispatch_order_and_stop(events):
+    received = []
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers(events.on_event('key')(NoAttrHandler(received)))
+    dispatcher.push_handlers(make_handler(events, received))
+    dispatcher.dispatch(events.Event(type='fader', channel=1), events.Event(type='key', key='a'))
+    dispatcher.pop_handlers()
+    dispatcher.dispatch(events.Event(type='key', key='b'))
+    assert received == [('method', 1), ('method', 'a'), ('callable', 'b')]
+
+
+def test_keyword_handlers(events):
+    received = []
+
+    class KeyEvent(events.Event):
+        type = 'test_keyword_key'
+
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers(test_keyword_key=received.append)
+    dispatcher.push_handlers(test_keyword_key=lambda event: received.append('top') or True)
+    dispatcher.dispatch(KeyEvent(key='a'))
+    assert received == ['top']
+    dispatcher.pop_handlers()
+    dispatcher.dispatch(KeyEvent(key='b'))
+    assert received == ['top', KeyEvent(key='b')]
+
+
+def test_is_event(events):
+    class KeyEvent(events.Event):
+        type = 'test_is_event_key'
+
+    assert events.is_event(KeyEvent)
+    assert events.is_event(events.Event(type='key'))
+    assert not events.is_event('key')
+
+
+def test_pop_empty_stack(events):
+    with pytest.raises(IndexError):
+        events.EventDispatcher().pop_handlers()
+
+
+def test_remove_handlers(events):
+    received = []
+    dispatcher = events.EventDispatcher()
+    handler = make_handler(events, received)
+    dispatcher.push_handlers(handler)
+    dispatcher.push_handlers(key=received.append)
+    dispatcher.remove_handlers(handler)
+    dispatcher.dispatch(events.Event(type='fader', channel=1))
+    assert received == []
+    assert len(dispatcher._handler_stack) == 1
+
+
+def test_marked_handlers_not_kept_alive(events):
+    # xair.uevents does not re-export the internals
+    events = sys.modules[events.on_event.__module__]
+    received = []
+    handler = events.on_event('key')(NoAttrHandler(received))
+    assert events.handler_event(handler) == 'key'
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers(handler)
+    dispatcher.pop_handlers()
+
+    if events.WeakKeyDictionary is dict:
+        # documented limitation without weakref: handler must be forgotten explicitly
+        assert handler in events._handler_to_event
+        events.forget_handler(handler)
+
+    del handler
+    gc.collect()
+    assert not events._handler_to_event
+
+
+def test_pool_reuses_released_events():
+    pool = EventPool(PoolTestEvent)
+    event = pool.acquire(1, 0.5)
+    pool.release(event)
+    assert pool.acquire(2, 0.25) is event
+    assert (event.channel, event.value) == (2, 0.25)
+
+
+def test_pool_resets_released_events():
+    pool = EventPool(PoolTestEvent)
+    event = pool.acquire(1, value=0.5)
+    pool.release(event)
+    event = pool.acquire(channel=2)
+    assert event.channel == 2
+
+    with pytest.raises(AttributeError):
+        event.value
+
+
+def test_pool_maxsize():
+    pool = EventPool(PoolTestEvent, maxsize=1)
+    first, second = pool.acquire(1, 0.0), pool.acquire(2, 0.0)
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire(3, 0.0) is first
+    assert pool.acquire(4, 0.0) is not second
+
+
+def test_remove_handlers_removes_emptied_layer(events):
+    received = []
+    dispatcher = events.EventDispatcher()
+    dispatcher.push_handlers()
+    bottom = dispatcher._handler_stack[0]
+    dispatcher.push_handlers(key=received.append)
+    dispatcher.remove_handlers(key=received.append)
+    # the empty layer below equals the emptied one, but must stay
+    assert len(dispatcher._handler_stack) == 1
+    assert dispatcher._handler_stack[0] is bottom
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# test_loadtest.py
+#
+"""Tests for the loopback load test harness."""
+
+import asyncio
+
+import pytest
+
+from xair.loadtest import LoadTest, generate_events, read_session, write_session
+from xair.osc import OSCMessage
+from xair.recorder import Recorder
+
+
+CONFIG = """\
+- name: Channel {ch} fader
+  status: controllerchange
+  channel: 1
+  data: {ch}
+  osc: /ch/{ch:02}/mix/fader
+  args: ['f:value']
+- name: Channel {ch} mute
+  status: noteon
+  channel: 1
+  data: {ch}
+  osc: /ch/{ch:02}/mix/on
+  args: ['i:data2']
+"""
+
+
+def run(test, midi_events=(), messages=()):
+    async def main():
+        async with test:
+            await test.run(midi_events, messages)
+
+    asyncio.run(main())
+    return test.stats()
+
+
+def check_result(result):
+    latency = result['latency']
+    assert result['lost'] == 0
+    assert result['received'] > 0 and latency.count == result['received']
+    assert 0.0 < latency.percentile(50) <= latency.percentile(99) <= latency.max < 500.0
+    return result
+
+
+def test_replay_osc_messages():
+    messages = [(n / 500, OSCMessage('/ch/%02i/mix/fader' % (n % 4 + 1), 'f', [n / 100]))
+                for n in range(100)]
+    result = check_result(run(LoadTest(state={}), (), messages)['osc'])
+    assert result['sent'] == result['received'] == 100
+
+
+def test_midi_events(tmp_path):
+    pytest.importorskip('rtmidi')
+    config = str(tmp_path / 'config.yaml')
+
+    with open(config, 'w') as fp:
+        fp.write("".join(CONFIG.format(ch=ch) for ch in range(1, 5)))
+
+    test = LoadTest(config, state={})
+    events = list(generate_events('sweep', test.controllers(), 200.0, 0.5))
+    result = check_result(run(test, events)['midi'])
+    assert result['events'] == result['handled'] == len(events)
+    assert result['sent'] + result['coalesced'] == result['messages']
+
+
+def test_session_round_trip(tmp_path):
+    filename = str(tmp_path / 'session.xrec')
+    midi_events = [(0.0, [0xB0, 7, 100]), (0.25, [0xC0, 5]), (0.5, [0x90, 60, 127])]
+    assert write_session(filename, midi_events, start=1000.0) == 3
+
+    # a parameter change on the mixer, recorded along with the MIDI events
+    with Recorder(filename) as recorder:
+        recorder.write('/ch/01/mix/fader', 'f', [0.5], 1000.75)
+
+    events, messages = read_session(filename)
+    assert events == midi_events
+    assert [(offset, msg.path, msg.args) for offset, msg in messages] == [
+        (0.75, '/ch/01/mix/fader', [0.5])]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# test_meters.py
+#
+"""Tests for encoding and decoding of meters packets."""
+
+import struct
+import sys
+
+from array import array
+
+import pytest
+
+from xair import meters
+from xair.meters import decode_meters, encode_meters, to_db
+from xair.osc import OSCError, encode_message
+
+
+VALUES = [0, 1, -1, 256, -256, 32767, -32768, 0x1234]
+
+
+def blob_of(packet):
+    """Return the blob of an encoded ``/meters/N`` message (without its size field)."""
+    pos = packet.index(b',b\0\0') + 4
+    size = struct.unpack_from('>i', packet, pos)[0]
+    return packet[pos + 4:pos + 4 + size]
+
+
+def test_round_trip():
+    packet = encode_meters(4, VALUES)
+    bank, values = decode_meters(packet)
+    assert bank == 4
+    assert values.format == 'h'
+    assert values.tolist() == VALUES
+
+
+def test_blob_is_little_endian():
+    blob = blob_of(encode_meters(2, VALUES))
+    assert blob == struct.pack('<I%ih' % len(VALUES), len(VALUES), *VALUES)
+
+
+@pytest.mark.skipif(sys.byteorder == 'big', reason="values are copied on big-endian hosts")
+def test_decode_does_not_copy():
+    packet = bytearray(encode_meters(1, [1, 2]))
+    _, values = decode_meters(packet)
+    packet[-4:-2] = struct.pack('<h', 7)
+    assert values.tolist() == [7, 2]
+
+
+def test_big_endian_host_path(monkeypatch):
+    # Pretend the native byte order is the opposite of the wire format: both directions must
+    # byte-swap exactly once and decoding must copy instead of casting the packet data.
+    monkeypatch.setattr(meters, '_BIG_ENDIAN', True)
+    swapped = array('h', VALUES)
+    swapped.byteswap()
+    packet = bytearray(encode_meters(3, VALUES))
+    assert blob_of(packet)[4:] == swapped.tobytes()
+
+    bank, values = decode_meters(packet)
+    assert (bank, values.tolist()) == (3, VALUES)
+    packet[-2:] = b'\0\0'
+    assert values.tolist() == VALUES
+
+
+def test_empty_bank():
+    assert decode_meters(encode_meters(0, []))[1].tolist() == []
+
+
+@pytest.mark.parametrize('packet', [
+    encode_message('/meters/1', ('i', 5)),
+    encode_meters(1, VALUES)[:-4],
+    b'/meters/x\0\0\0,b\0\0',
+    b'/meters/1',
+])
+def test_decode_invalid(packet):
+    with pytest.raises(OSCError):
+        decode_meters(packet)
+
+
+def test_to_db():
+    _, values = decode_meters(encode_meters(1, [0, 256, -512, 128]))
+    assert list(to_db(values)) == [0.0, 1.0, -2.0, 0.5]
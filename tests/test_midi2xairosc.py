@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+#
+# test_midi2xairosc.py
+#
+"""Tests for configuration changes and routing of the MIDI input handler and for MIDI feedback."""
+
+import argparse
+import asyncio
+
+import pytest
+
+pytest.importorskip('rtmidi')
+
+from xair.fakemixer import FakeMixer  # noqa:E402
+from xair.midi2xairosc import (Command, ConfigWatcher, MappingConfig, MidiFeedback,  # noqa:E402
+                               MidiInputHandler, build_feedback_table, build_parser, parse_mixer,
+                               run_bridge)
+from xair.osc import OSCMessage  # noqa:E402
+
+
+CONFIG = """\
+- name: Channel 1 fader
+  status: controllerchange
+  channel: 1
+  data: 7
+  osc: /ch/01/mix/fader
+  args: ['f:value']
+  transform: {curve: linear, mode: 14bit}
+- name: Channel 2 fader
+  status: controllerchange
+  channel: 2
+  osc: /ch/02/mix/fader
+  args: ['f:value']
+  transform: {curve: linear, mode: nrpn, nrpn: 300}
+"""
+
+
+class RecordingSender:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, path, *args):
+        self.sent.append((path, args))
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeTimers:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, func):
+        self.timers.append((delay, func))
+
+    def fire(self):
+        timers, self.timers = self.timers, []
+
+        for _, func in timers:
+            func()
+
+
+class ListOutput:
+    """Collect MIDI messages passed to the feedback output queue."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, controller, message, coalesce=None):
+        self.sent.append(message)
+
+    def stats(self):
+        return {}
+
+
+FADER = Command('fader', status='controllerchange', channel=1, data=7, osc='/ch/01/mix/fader',
+                args=['f:data2'])
+MUTE = Command('mute', status='noteon', channel=2, data=60, osc='/ch/02/mix/on',
+               args=['i:data2'])
+
+
+def feedback_commands():
+    return [
+        FADER,
+        MUTE,
+        Command('pan', status='controllerchange', channel=1, data=10, osc='/ch/01/mix/pan',
+                args=['f:value']),
+        Command('program', status='programchange', channel=3, osc='/-snap/load',
+                args=['i:data1']),
+        Command('bend', status='pitchbend', channel=4, osc='/ch/04/mix/fader',
+                args=['f:data2']),
+        Command('other mixer', status='controllerchange', channel=1, data=7,
+                osc='/ch/01/mix/fader', args=['f:data2'], mixer='b'),
+        # no feedback for these
+        Command('any channel', status='controllerchange', data=1, osc='/ch/05/mix/fader',
+                args=['f:data2']),
+        Command('any controller', status='controllerchange', channel=1, osc='/ch/06/mix/fader',
+                args=['f:data2']),
+        Command('two values', status='controllerchange', channel=1, data=2,
+                osc='/ch/07/mix/fader', args=['i:data1', 'f:data2']),
+        Command('literal', status='controllerchange', channel=1, data=3, osc='/ch/08/mix/on',
+                args=['i:1']),
+        Command('excluded', status='controllerchange', channel=1, data=4,
+                osc='/ch/09/mix/fader', args=['f:data2'], feedback=False),
+        Command('14 bit', status='controllerchange', channel=1, data=5, osc='/ch/10/mix/fader',
+                args=['f:value'], transform={'mode': '14bit'}),
+        Command('external', status='controllerchange', channel=1, data=6, command='true'),
+    ]
+
+
+def make_feedback(hold=0.5):
+    output, clock, timers = ListOutput(), FakeClock(), FakeTimers()
+    feedback = MidiFeedback(feedback_commands(), output, hold=hold, clock=clock,
+                            call_later=timers.call_later)
+    return feedback, output, clock, timers
+
+
+def fader(value, path='/ch/01/mix/fader'):
+    return OSCMessage(path, 'f', [value])
+
+
+def test_feedback_table():
+    table = build_feedback_table(feedback_commands())
+    assert {key: [mapping[:3] for mapping in mappings] for key, mappings in table.items()} == {
+        (None, '/ch/01/mix/fader'): [(0xB0, 7, 0)],
+        (None, '/ch/02/mix/on'): [(0x91, 60, 0)],
+        (None, '/ch/01/mix/pan'): [(0xB0, 10, 0)],
+        (None, '/-snap/load'): [(0xC2, None, 0)],
+        (None, '/ch/04/mix/fader'): [(0xE3, 0, 0)],
+        ('b', '/ch/01/mix/fader'): [(0xB0, 7, 0)],
+    }
+
+
+def test_feedback_converts_values():
+    feedback, output, _, _ = make_feedback()
+    pan = feedback_commands()[2]
+    feedback.osc_received(fader(1.0))
+    feedback.osc_received(OSCMessage('/ch/02/mix/on', 'i', [300]))
+    feedback.osc_received(OSCMessage('/ch/01/mix/pan', 'f', [pan.transform.table[100]]))
+    feedback.osc_received(OSCMessage('/-snap/load', 'i', [5]))
+    feedback.osc_received(fader(0.5, '/ch/04/mix/fader'))
+    feedback.osc_received(fader(0.0), mixer='b')
+    feedback.osc_received(fader(0.5, '/ch/05/mix/fader'))
+    assert output.sent == [[0xB0, 7, 127], [0x91, 60, 127], [0xB0, 10, 100], [0xC2, 5],
+                           [0xE3, 0, 64], [0xB0, 7, 0]]
+    assert feedback.addresses('b') == ['/ch/01/mix/fader']
+
+
+def test_feedback_suppressed_if_controller_shows_value():
+    feedback, output, clock, _ = make_feedback()
+    feedback.midi_received([0xB0, 7, 127])
+    clock.now += 1.0
+    feedback.osc_received(fader(1.0))
+    assert output.sent == []
+    feedback.osc_received(fader(0.0))
+    # the value last sent is shown by the controller, too
+    feedback.osc_received(fader(0.0))
+    assert output.sent == [[0xB0, 7, 0]]
+    assert feedback.stats()['suppressed'] == 2
+
+
+def test_feedback_held_after_midi_input():
+    feedback, output, clock, timers = make_feedback(hold=0.5)
+    feedback.midi_received([0xB0, 7, 10])
+    clock.now += 0.2
+    feedback.osc_received(fader(0.5))
+    feedback.osc_received(fader(1.0))
+    # other controllers are not held
+    feedback.osc_received(OSCMessage('/ch/02/mix/on', 'i', [1]))
+    assert output.sent == [[0x91, 60, 1]]
+    assert len(timers.timers) == 1
+    assert timers.timers[0][0] == pytest.approx(0.3)
+    assert feedback.stats()['held'] == 1
+
+    # only the newest held value is sent after the hold time
+    clock.now += 0.3
+    timers.fire()
+    assert output.sent[1:] == [[0xB0, 7, 127]]
+    assert feedback.stats()['held'] == 0
+
+
+def test_feedback_hold_extended_by_new_input():
+    feedback, output, clock, timers = make_feedback(hold=0.5)
+    feedback.midi_received([0xB0, 7, 10])
+    feedback.osc_received(fader(1.0))
+    clock.now += 0.4
+    feedback.midi_received([0xB0, 7, 20])
+    clock.now += 0.1
+    timers.fire()
+    assert output.sent == []
+    assert timers.timers[0][0] == pytest.approx(0.4)
+
+    clock.now += 0.4
+    timers.fire()
+    assert output.sent == [[0xB0, 7, 127]]
+
+
+def test_feedback_held_value_suppressed():
+    feedback, output, clock, timers = make_feedback(hold=0.5)
+    feedback.midi_received([0xB0, 7, 127])
+    feedback.osc_received(fader(1.0))
+    clock.now += 0.5
+    timers.fire()
+    assert output.sent == []
+    assert feedback.stats()['suppressed'] == 1
+
+
+def test_reload_drops_pending_values(tmp_path):
+    filename = str(tmp_path / 'config.yaml')
+
+    with open(filename, 'w') as fp:
+        fp.write(CONFIG)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        sender = RecordingSender()
+        handler = MidiInputHandler('test', filename, sender, call_later=loop.call_later)
+        watcher = ConfigWatcher(filename, [handler])
+
+        # MSB of a 14-bit controller and of an NRPN data entry, without LSB
+        for event in ([0xB0, 7, 64], [0xB1, 99, 2], [0xB1, 98, 44], [0xB1, 6, 10]):
+            handler((event, 0.0))
+
+        assert await watcher.reload()
+        assert not handler._mergers and not handler._nrpn_decoders
+        # timeout of the discarded values must not send them anymore
+        await asyncio.sleep(0.1)
+        assert sender.sent == []
+        assert watcher.stats()['dropped'] == 2
+        assert handler.stats()['dropped'] == 2
+
+    asyncio.run(main())
+
+
+ROUTING_CONFIG = """\
+- name: Keys fader
+  status: controllerchange
+  channel: 1
+  data: 7
+  osc: /ch/01/mix/fader
+  args: ['f:data2']
+  port: Keys
+- name: Pads fader
+  status: controllerchange
+  channel: 1
+  data: 7
+  osc: /ch/02/mix/fader
+  args: ['f:data2']
+  port: Pads
+  mixer: b
+- name: Mute on any port
+  status: noteon
+  channel: 1
+  data: 60
+  osc: /ch/03/mix/on
+  args: ['i:0']
+  mixer: b
+"""
+
+
+class RecordingMixer(FakeMixer):
+    """Fake mixer, which records all parameter changes it receives."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.changes = []
+
+    def handle_message(self, msg, addr):
+        if msg.args:
+            self.changes.append((msg.path, msg.args[0]))
+
+        super().handle_message(msg, addr)
+
+
+class StubMidiIn:
+    """Keep the callback set by `run_bridge`, like an rtmidi ``MidiIn`` instance would."""
+
+    def __init__(self):
+        self.callback = None
+
+    def set_callback(self, func, data=None):
+        self.callback = (func, data)
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def send(self, message):
+        func, data = self.callback
+        func((message, 0.0), data)
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('b=10.0.0.2:10023', ('b', '10.0.0.2', 10023)),
+    ('monitor=xr18.local', ('monitor', 'xr18.local', 10024)),
+])
+def test_parse_mixer(spec, expected):
+    assert parse_mixer(spec) == expected
+
+
+@pytest.mark.parametrize('spec', ['10.0.0.2', '=10.0.0.2', 'b=', 'b=10.0.0.2:port'])
+def test_parse_mixer_invalid(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mixer(spec)
+
+
+def test_parse_repeated_ports_and_mixers():
+    args = build_parser().parse_args(['-p', 'Keys', '--port', '2', '-m', 'b=10.0.0.2',
+                                      '--mixer', 'c=10.0.0.3:10023', 'config.yaml'])
+    assert args.port == ['Keys', '2']
+    assert args.mixer == [('b', '10.0.0.2', 10024), ('c', '10.0.0.3', 10023)]
+    assert args.config == 'config.yaml'
+
+    args = build_parser().parse_args(['config.yaml'])
+    assert (args.port, args.mixer) == (None, [])
+
+
+def test_parse_invalid_mixer_option(capsys):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(['-m', '10.0.0.2', 'config.yaml'])
+
+    assert 'NAME=HOST[:PORT]' in capsys.readouterr().err
+
+
+def test_config_for_port():
+    keys = Command('keys', osc='/ch/01/mix/fader', args=['f:data2'], port='Keys')
+    pads = Command('pads', osc='/ch/02/mix/fader', args=['f:data2'], port='Pads')
+    shared = Command('shared', osc='/ch/03/mix/fader', args=['f:data2'])
+    config = MappingConfig([keys, pads, shared], 'config.yaml')
+
+    # the port option is matched against part of the port name
+    assert config.for_port('Keys:Keys MIDI 1 24:0').commands == [keys, shared]
+    assert config.for_port('Pads').commands[0] is pads
+    assert config.for_port('Other').commands == [shared]
+    assert config.for_port('Keys').filename == 'config.yaml'
+
+    config = MappingConfig([shared])
+    assert config.for_port('Keys') is config
+
+
+def test_ports_routed_to_mixers(tmp_path):
+    filename = str(tmp_path / 'config.yaml')
+
+    with open(filename, 'w') as fp:
+        fp.write(ROUTING_CONFIG)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        endpoints = [await loop.create_datagram_endpoint(RecordingMixer,
+                                                         local_addr=('127.0.0.1', 0))
+                     for _ in range(2)]
+        (default, b) = [mixer for _, mixer in endpoints]
+        ports = [transport.get_extra_info('sockname')[1] for transport, _ in endpoints]
+        args = build_parser().parse_args(['-s', '127.0.0.1', '-o', str(ports[0]),
+                                          '-m', 'b=127.0.0.1:%i' % ports[1], filename])
+        keys, pads = StubMidiIn(), StubMidiIn()
+        bridge = asyncio.ensure_future(run_bridge([(keys, 'Keys 0'), (pads, 'Pads 1')], args))
+
+        try:
+            while keys.callback is None or pads.callback is None:
+                assert not bridge.done(), bridge.result()
+                await asyncio.sleep(0.01)
+
+            keys.send([0xB0, 7, 127])
+            pads.send([0xB0, 7, 0])
+            pads.send([0x90, 60, 127])
+            keys.send([0x90, 60, 127])
+
+            for _ in range(100):
+                if len(default.changes) + len(b.changes) >= 4:
+                    break
+
+                await asyncio.sleep(0.01)
+        finally:
+            bridge.cancel()
+
+            for transport, _ in endpoints:
+                transport.close()
+
+        assert default.changes == [('/ch/01/mix/fader', 1.0)]
+        # the output queue may send coalesced fader values after other messages
+        assert sorted(b.changes) == [('/ch/02/mix/fader', 0.0), ('/ch/03/mix/on', 0),
+                                     ('/ch/03/mix/on', 0)]
+
+    asyncio.run(main())
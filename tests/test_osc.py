@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# test_osc.py
+#
+"""Tests for OSC message and bundle encoding and the bundling sender."""
+
+import pytest
+
+from xair.osc import (BUNDLE_HEADER, DEFAULT_MTU, BundleSender, OSCError, decode_packet,
+                      encode_bundle, encode_message)
+
+
+def make_sender(**kwargs):
+    packets = []
+    return BundleSender(packets.append, **kwargs), packets
+
+
+def decoded(packets):
+    return [(msg.path, msg.args) for packet in packets for msg in decode_packet(packet)]
+
+
+def test_message_round_trip():
+    data = encode_message('/ch/01/config/name', 'Vox', 0.5, 3, ('b', b'\x01\x02\x03'))
+    assert len(data) % 4 == 0
+    msg, = decode_packet(data)
+    assert (msg.path, msg.types) == ('/ch/01/config/name', 'sfib')
+    assert msg.args == ['Vox', 0.5, 3, b'\x01\x02\x03']
+
+
+def test_bundle_round_trip():
+    messages = [encode_message('/ch/%02i/mix/fader' % ch, ch / 16) for ch in range(1, 5)]
+    nested = encode_bundle([encode_message('/lr/mix/on', 1)])
+    data = encode_bundle(messages + [nested])
+    assert data.startswith(BUNDLE_HEADER)
+    assert decoded([data]) == [('/ch/%02i/mix/fader' % ch, [ch / 16]) for ch in range(1, 5)] + [
+        ('/lr/mix/on', [1])]
+
+
+def test_malformed_packet():
+    with pytest.raises(OSCError):
+        decode_packet(encode_message('/lr/mix/on', 1)[:-2])
+
+
+def test_packing_respects_mtu():
+    sender, packets = make_sender(mtu=256)
+    sent = [('/ch/%02i/mix/fader' % (n % 16 + 1), [n / 100]) for n in range(100)]
+
+    for path, args in sent:
+        sender.send(path, *args)
+
+    assert sender.flush() == len(packets) > 1
+    assert all(len(packet) <= 256 for packet in packets)
+    assert all(packet.startswith(BUNDLE_HEADER) for packet in packets)
+    # all messages arrive in order, as floats are encoded with single precision
+    assert [(path, pytest.approx(args)) for path, args in decoded(packets)] == sent
+    assert (sender.messages_sent, sender.packets_sent) == (100, len(packets))
+
+
+def test_default_mtu_fits_many_messages():
+    sender, packets = make_sender()
+
+    for ch in range(1, 17):
+        sender.send('/ch/%02i/mix/on' % ch, 1)
+
+    assert sender.flush() == 1
+    assert len(packets[0]) <= DEFAULT_MTU
+
+
+def test_single_message_is_not_bundled():
+    sender, packets = make_sender()
+    sender.send('/lr/mix/on', 0)
+    assert sender.flush() == 1
+    assert packets == [encode_message('/lr/mix/on', 0)]
+    assert sender.flush() == 0
+
+
+def test_oversized_message_is_sent_as_is():
+    sender, packets = make_sender(mtu=128)
+    blob = encode_message('/big', ('b', bytes(200)))
+    sender.send('/ch/01/mix/on', 1)
+    sender.send_encoded(blob)
+    sender.send('/ch/02/mix/on', 0)
+    assert sender.flush() == 3
+    assert packets[1] == blob
+    assert decoded(packets) == [('/ch/01/mix/on', [1]), ('/big', [bytes(200)]),
+                                ('/ch/02/mix/on', [0])]
+
+
+def test_without_bundles():
+    sender, packets = make_sender(use_bundles=False)
+
+    for ch in range(1, 9):
+        sender.send('/ch/%02i/mix/on' % ch, 1)
+
+    assert sender.flush() == 8
+    assert not any(packet.startswith(BUNDLE_HEADER) for packet in packets)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# test_oscqueue.py
+#
+"""Tests for the rate-limited, coalescing OSC output queue with a fake clock."""
+
+import pytest
+
+from xair.oscqueue import OSCOutputQueue, is_continuous
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ListSender:
+    """Collect sent messages and count flushes."""
+
+    def __init__(self):
+        self.messages = []
+        self.flushes = 0
+
+    def send(self, path, *args):
+        self.messages.append((path,) + tuple(value for _, value in args))
+
+    def flush(self):
+        self.flushes += 1
+
+
+def make_queue(**kwargs):
+    clock = FakeClock()
+    sender = ListSender()
+    return OSCOutputQueue(sender, clock=clock, **kwargs), sender, clock
+
+
+@pytest.mark.parametrize('args, result', [
+    ((('f', 0.5),), True),
+    ((('f', 0.5), ('f', 0.25)), True),
+    ((('i', 1),), False),
+    ((('f', 0.5), ('i', 1)), False),
+    ((), False),
+])
+def test_is_continuous(args, result):
+    assert is_continuous(args) is result
+
+
+def test_token_bucket_limits_rate():
+    queue, sender, clock = make_queue(rate=8.0, burst=2)
+
+    for n in range(5):
+        queue.send('/ch/01/mix/on', ('i', n % 2))
+
+    assert queue.flush() == 0.125
+    assert len(sender.messages) == 2
+    clock.now += 0.125
+    queue.flush()
+    assert len(sender.messages) == 3
+    # tokens refill up to the burst size only
+    clock.now += 10.0
+    assert queue.flush() is None
+    assert len(sender.messages) == 5
+    # discrete messages are sent in order, without coalescing
+    assert sender.messages == [('/ch/01/mix/on', n % 2) for n in range(5)]
+    assert queue.stats() == dict(sent=5, coalesced=0, pending=0, discrete=0)
+
+
+def test_continuous_values_are_coalesced():
+    queue, sender, clock = make_queue()
+
+    for n in range(5):
+        queue.send('/ch/01/mix/fader', ('f', n / 10))
+
+    queue.send('/ch/01/mix/pan', ('f', 0.5))
+    # not all floats, so not coalesced
+    queue.send('/ch/01/eq/1', ('f', 0.5), ('i', 1))
+    queue.send('/ch/01/eq/1', ('f', 0.75), ('i', 1))
+    assert queue.stats() == dict(sent=0, coalesced=4, pending=2, discrete=2)
+    assert queue.flush() is None
+    assert sender.messages == [('/ch/01/eq/1', 0.5, 1), ('/ch/01/eq/1', 0.75, 1),
+                               ('/ch/01/mix/fader', 0.4), ('/ch/01/mix/pan', 0.5)]
+    assert sender.flushes == 1
+
+
+def test_explicit_coalesce_flag():
+    queue, sender, clock = make_queue()
+    queue.send('/ch/01/mix/on', ('i', 0), coalesce=True)
+    queue.send('/ch/01/mix/on', ('i', 1), coalesce=True)
+    queue.send('/ch/02/mix/fader', ('f', 0.1), coalesce=False)
+    queue.send('/ch/02/mix/fader', ('f', 0.2), coalesce=False)
+    queue.flush()
+    assert sender.messages == [('/ch/02/mix/fader', 0.1), ('/ch/02/mix/fader', 0.2),
+                               ('/ch/01/mix/on', 1)]
+
+
+def test_address_rate_limit():
+    queue, sender, clock = make_queue(address_rate=10.0)
+    queue.send('/ch/01/mix/fader', ('f', 0.1))
+    queue.flush()
+    clock.now += 0.05
+    queue.send('/ch/01/mix/fader', ('f', 0.2))
+    queue.send('/ch/02/mix/fader', ('f', 0.3))
+    # the second address is not limited by the first
+    assert queue.flush() == pytest.approx(0.05)
+    assert sender.messages == [('/ch/01/mix/fader', 0.1), ('/ch/02/mix/fader', 0.3)]
+    queue.send('/ch/01/mix/fader', ('f', 0.25))
+    clock.now += 0.04
+    queue.flush()
+    assert len(sender.messages) == 2
+    clock.now += 0.01
+    assert queue.flush() is None
+    assert sender.messages[-1] == ('/ch/01/mix/fader', 0.25)
+    assert queue.stats()['coalesced'] == 1
+
+
+def test_starved_continuous_messages_wait_for_tokens():
+    queue, sender, clock = make_queue(rate=100.0, burst=1, address_rate=0)
+    queue.send('/ch/01/mix/on', ('i', 1))
+    queue.send('/ch/01/mix/fader', ('f', 0.5))
+    assert queue.flush() == pytest.approx(0.01)
+    assert sender.messages == [('/ch/01/mix/on', 1)]
+    clock.now += 0.01
+    assert queue.flush() is None
+    assert sender.messages[-1] == ('/ch/01/mix/fader', 0.5)
+
+
+def test_drain_ignores_limits():
+    queue, sender, clock = make_queue(rate=1.0, burst=1, address_rate=1.0)
+
+    for ch in range(1, 5):
+        queue.send('/ch/%02i/mix/on' % ch, ('i', 1))
+        queue.send('/ch/%02i/mix/fader' % ch, ('f', ch / 10))
+
+    queue.drain()
+    assert len(sender.messages) == 8
+    assert queue.stats() == dict(sent=8, coalesced=0, pending=0, discrete=0)
+    assert queue.flush() is None
+
+
+def test_send_errors_are_logged(caplog):
+    class FailingSender:
+        def send(self, path, *args):
+            raise OSError("network unreachable")
+
+    queue = OSCOutputQueue(FailingSender(), clock=FakeClock())
+    queue.send('/ch/01/mix/on', ('i', 1))
+    queue.flush()
+    assert "network unreachable" in caplog.text
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# test_recorder.py
+#
+"""Tests for writing and reading recording files."""
+
+import os
+
+from xair.recorder import Recorder, RecordingReader
+
+
+def record(filename, start, count):
+    with Recorder(filename) as recorder:
+        for n in range(count):
+            recorder.write('/ch/%02i/mix/fader' % (n % 4 + 1), 'f', [n / count], start + n)
+            recorder.write('/ch/01/name', 's', ['Ch %i' % n], start + n)
+            recorder.flush()
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'test.xrec')
+    record(filename, 100.0, 3)
+
+    with RecordingReader(filename) as reader:
+        assert len(reader) == 6
+        assert len(reader.blocks) == 3
+        assert reader.data_end == os.path.getsize(filename)
+        records = [(timestamp, msg.path, msg.args) for timestamp, msg in reader]
+
+    assert records[:2] == [(100.0, '/ch/01/mix/fader', [0.0]), (100.0, '/ch/01/name', ['Ch 0'])]
+    assert records[-1] == (102.0, '/ch/01/name', ['Ch 2'])
+
+
+def test_append(tmp_path):
+    filename = str(tmp_path / 'test.xrec')
+    record(filename, 100.0, 2)
+    record(filename, 200.0, 2)
+
+    with RecordingReader(filename) as reader:
+        assert len(reader.blocks) == 4
+        assert [timestamp for timestamp, msg in reader][::2] == [100.0, 101.0, 200.0, 201.0]
+
+
+def test_append_after_incomplete_block(tmp_path):
+    filename = str(tmp_path / 'test.xrec')
+    record(filename, 100.0, 2)
+
+    # simulate a crash while writing the last block
+    with open(filename, 'r+b') as fp:
+        fp.truncate(os.path.getsize(filename) - 10)
+
+    record(filename, 200.0, 1)
+
+    with RecordingReader(filename) as reader:
+        assert reader.data_end == os.path.getsize(filename)
+        assert [(timestamp, msg.args) for timestamp, msg in reader] == [
+            (100.0, [0.0]), (100.0, ['Ch 0']), (200.0, [0.0]), (200.0, ['Ch 0'])]
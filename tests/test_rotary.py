@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# test_rotary.py
+#
+"""Tests for the rotary encoder decoder and the simulated input backend."""
+
+import pytest
+
+from xair.rotary import (Button, RotaryEncoder, SimulatedBackend, load_edges, quadrature_edges,
+                         save_edges)
+
+
+class CallbackBackend:
+    """Minimal backend, which only keeps the callback, like a hardware backend would."""
+
+    def setup(self, pin_dt, pin_clk, callback):
+        self.callback = callback
+
+    def close(self):
+        pass
+
+
+def make_encoder(backend=None, **kwargs):
+    kwargs.setdefault('min_val', -100)
+    kwargs.setdefault('max_val', 100)
+    encoder = RotaryEncoder('DT', 'CLK', backend=backend or SimulatedBackend(), **kwargs)
+    values = []
+    encoder.push_handlers(encoder_change=lambda event: values.append(event.value))
+    return encoder, values
+
+
+def test_quadrature_edges():
+    assert quadrature_edges(4, 0.01, 1.0) == [(1.0, 0b10), (1.01, 0b11), (1.02, 0b01),
+                                              (1.03, 0b00)]
+    assert [levels for _, levels in quadrature_edges(-3, levels=0b11)] == [0b10, 0b00, 0b01]
+    assert quadrature_edges(0) == []
+
+
+@pytest.mark.parametrize('count, reverse, value', [
+    (8, False, -8),
+    (-8, False, 8),
+    (8, True, 8),
+    (-6, True, -6),
+])
+def test_direction(count, reverse, value):
+    encoder, values = make_encoder(reverse=reverse)
+    encoder.backend.replay(quadrature_edges(count))
+    assert encoder.value == value
+    assert values == [n * value // abs(value) for n in range(1, abs(value) + 1)]
+
+
+def test_clicks():
+    encoder, values = make_encoder(clicks=4)
+    encoder.backend.replay(quadrature_edges(-10))
+    assert encoder.value == 2
+    assert values == [1, 2]
+
+
+def test_bounce_is_cancelled():
+    bounce = [(0.0, 0b10), (0.0001, 0b00), (0.0002, 0b10), (0.0003, 0b00), (0.0004, 0b10)]
+    encoder, values = make_encoder(reverse=True)
+    encoder.backend.replay(bounce + quadrature_edges(3, start=0.001, levels=0b10))
+    # the bouncing line only moves back and forth between two positions
+    assert encoder.value == 4
+    assert values[-1] == 4
+
+
+def test_turn_back_and_forth():
+    encoder, _ = make_encoder(reverse=True)
+    edges = quadrature_edges(10)
+    edges += quadrature_edges(-6, start=1.0, levels=edges[-1][1])
+    encoder.backend.replay(edges)
+    assert encoder.value == 4
+
+
+def test_decoding_is_backend_independent():
+    edges = (quadrature_edges(13) + quadrature_edges(-5, start=1.0, levels=0b10) +
+             [(2.0, 0b00), (2.001, 0b10), (2.002, 0b00)])
+    simulated, simulated_values = make_encoder(SimulatedBackend())
+    simulated.backend.replay(edges)
+    other, other_values = make_encoder(CallbackBackend())
+
+    for timestamp, levels in edges:
+        other.backend.callback(levels, timestamp)
+
+    assert simulated.value == other.value == -8
+    assert simulated_values == other_values
+
+
+def test_clamped_at_limits():
+    encoder, values = make_encoder(min_val=0, max_val=3, reverse=True)
+    encoder.backend.replay(quadrature_edges(8))
+    assert encoder.value == 3
+    encoder.backend.replay(quadrature_edges(-12, levels=encoder.backend.levels))
+    assert encoder.value == 0
+    assert values == [1, 2, 3, 2, 1, 0]
+
+
+def test_save_and_load_edges(tmp_path):
+    filename = str(tmp_path / 'edges.txt')
+    edges = quadrature_edges(-7, interval=0.0015, start=12.25)
+    save_edges(filename, edges)
+
+    with open(filename, 'a') as fp:
+        fp.write("\n# end of recording\n")
+
+    loaded = load_edges(filename)
+    assert [levels for _, levels in loaded] == [levels for _, levels in edges]
+    assert [timestamp for timestamp, _ in loaded] == pytest.approx(
+        [timestamp for timestamp, _ in edges], abs=1e-9)
+
+    first, _ = make_encoder()
+    first.backend.replay(edges)
+    second, _ = make_encoder()
+    second.backend.replay(loaded)
+    assert first.value == second.value == 7
+
+
+def test_button_debounce():
+    backend = SimulatedBackend(levels=1)
+    button = Button('P1', backend=backend, debounce=0.01)
+    received = []
+    button.push_handlers(button_change=lambda event: received.append(event.pressed))
+    backend.replay([(0.0, 0), (0.002, 1), (0.004, 0), (0.05, 1), (0.1, 0), (0.2, 1)])
+    assert received == [True, False, True, False]
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_accel_encoder(clock, **kwargs):
+    deltas = []
+    encoder = RotaryEncoder('DT', 'CLK', backend=SimulatedBackend(clock=clock), min_val=0,
+                            max_val=1000, accel=1, reverse=True, clock=clock, **kwargs)
+    encoder.push_handlers(encoder_change=lambda event: deltas.append(event.delta))
+    return encoder, deltas
+
+
+def feed(encoder, clock, count, interval):
+    """Turn the encoder by count edges, advancing the clock by interval before each."""
+    for _, levels in quadrature_edges(count, levels=encoder.backend.levels):
+        clock.now += interval
+        encoder.backend.feed(levels)
+
+
+def test_no_acceleration_when_turned_slowly():
+    clock = FakeClock()
+    encoder, deltas = make_accel_encoder(clock)
+    feed(encoder, clock, 40, 0.1)
+    assert encoder.value == 40
+    assert set(deltas) == {1}
+
+
+def test_acceleration_grows_with_turn_rate():
+    results = {}
+
+    for interval in (0.1, 0.01, 0.001):
+        clock = FakeClock()
+        encoder, deltas = make_accel_encoder(clock)
+        feed(encoder, clock, 40, interval)
+        assert deltas == sorted(deltas)
+        results[interval] = encoder.value
+
+    assert results[0.1] < results[0.01] < results[0.001]
+    assert results[0.001] > 2 * 40
+
+
+def test_acceleration_decays():
+    clock = FakeClock()
+    encoder, deltas = make_accel_encoder(clock, accel_decay=0.05)
+    feed(encoder, clock, 40, 0.0001)
+    accel = encoder.acceleration
+    assert deltas[-1] > 1
+    clock.now += 0.05
+    assert encoder.acceleration == pytest.approx(accel / 2)
+    clock.now += 1.0
+    assert encoder.acceleration < 1e-3
+    # the next step after the pause changes the value by one again
+    feed(encoder, clock, 1, 0.0)
+    assert deltas[-1] == 1
+
+
+def test_acceleration_clamped_at_limits():
+    clock = FakeClock()
+    encoder, _ = make_accel_encoder(clock)
+    feed(encoder, clock, 400, 0.0001)
+    assert encoder.value == 1000
+    feed(encoder, clock, -800, 0.0001)
+    assert encoder.value == 0
+
+
+def test_one_event_per_tick():
+    clock = FakeClock()
+    scheduled = []
+    encoder, deltas = make_accel_encoder(clock, schedule=scheduled.append)
+    encoder.accel = 0
+    feed(encoder, clock, 20, 0.001)
+    # all changes until the tick runs are coalesced into one event
+    assert len(scheduled) == 1 and deltas == []
+    scheduled.pop()()
+    assert deltas == [20]
+    feed(encoder, clock, -5, 0.001)
+    scheduled.pop()()
+    assert deltas == [20, -5]
+    # no event, if the value did not change since the last one
+    encoder.tick()
+    assert deltas == [20, -5]
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# test_rta.py
+#
+"""Tests for the RTA ring-buffer history, peak hold and stream."""
+
+import math
+
+import pytest
+
+from xair import rta
+from xair.meters import Meters, encode_meters
+from xair.rta import RTAHistory, RTAStream
+
+
+ADDR = ('127.0.0.1', 10024)
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StubClient:
+    """Record messages sent by `Meters` and `RTAStream`."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, path, *args):
+        self.sent.append((path,) + args)
+
+
+def flatten(views):
+    return [value for view in views for value in view.tolist()]
+
+
+def feed(history, frames):
+    for timestamp, values in frames:
+        history.append(values, timestamp)
+
+
+def test_ring_buffer_wraps():
+    history = RTAHistory(size=3, bands=2)
+    feed(history, [(float(i), [i, -i]) for i in range(5)])
+    assert len(history) == 3
+    assert history.frame().tolist() == [4, -4]
+    assert history.frame(2).tolist() == [2, -2]
+
+    with pytest.raises(IndexError):
+        history.frame(3)
+
+    # frames 2, 3, 4 wrap around the end of the buffer: two views, oldest first
+    assert len(history.last()) == 2
+    assert flatten(history.last()) == [2, -2, 3, -3, 4, -4]
+    assert flatten(history.last_timestamps()) == [2.0, 3.0, 4.0]
+    assert len(history.last(2)) == 1
+    assert flatten(history.last(2)) == [3, -3, 4, -4]
+    assert history.last(0) == []
+
+
+def test_ring_buffer_does_not_reallocate():
+    history = RTAHistory(size=2, bands=2)
+    frames, peaks = history.frames, history.peaks
+    feed(history, [(i * 0.05, [i, i]) for i in range(10)])
+    assert history.frames is frames
+    assert history.peaks is peaks
+    assert len(frames) == 4
+
+
+def test_append_wrong_band_count():
+    history = RTAHistory(size=2, bands=3)
+
+    with pytest.raises(ValueError):
+        history.append([1, 2], 0.0)
+
+    assert len(history) == 0
+
+
+def test_peak_hold_and_decay():
+    history = RTAHistory(size=8, bands=2, hold=1.0, decay=4.0)
+    assert history.peaks_db() == [-math.inf, -math.inf]
+    # 0 dB and -10 dB, then both bands drop to -20 dB
+    feed(history, [(0.0, [0, -2560]), (0.5, [-5120, -5120])])
+    assert history.peaks_db() == [0.0, -10.0]
+    # held for 1 s, then falling by 4 dB/s since the previous frame
+    feed(history, [(2.0, [-5120, -5120])])
+    assert history.peaks_db() == [-6.0, -16.0]
+    feed(history, [(2.5, [-5120, -5120])])
+    assert history.peaks_db() == [-8.0, -18.0]
+    # decay stops at the current level and a new maximum is taken at once
+    feed(history, [(4.0, [-5120, 256])])
+    assert history.peaks_db() == [-14.0, 1.0]
+    feed(history, [(6.0, [-5120, 256])])
+    assert history.peaks_db() == [-20.0, 1.0]
+
+
+def test_clear():
+    history = RTAHistory(size=2, bands=1)
+    feed(history, [(0.0, [1]), (1.0, [2])])
+    history.clear()
+    assert len(history) == 0
+    assert history.last() == []
+    assert history.peaks_db() == [-math.inf]
+
+
+def test_numpy_parity(monkeypatch):
+    pytest.importorskip('numpy')
+    frames = [(i * 0.3, [(i * 37 + band * 11) % 200 * 64 - 6400 for band in range(5)])
+              for i in range(30)]
+    vectorized = RTAHistory(size=4, bands=5, hold=0.5, decay=10.0)
+    feed(vectorized, frames)
+    monkeypatch.setattr(rta, 'numpy', None)
+    plain = RTAHistory(size=4, bands=5, hold=0.5, decay=10.0)
+    feed(plain, frames)
+    assert list(vectorized.peaks) == list(plain.peaks)
+    assert flatten(vectorized.last()) == flatten(plain.last())
+
+
+def test_stream():
+    client = StubClient()
+    meters = Meters(client, clock=FakeClock())
+    stream = RTAStream(meters, RTAHistory(size=4, bands=3))
+    received = []
+    stream.push_handlers(rta=received.append)
+    stream.start()
+    assert meters.banks == {rta.RTA_BANK}
+
+    meters._received(encode_meters(rta.RTA_BANK, [1, 2, 3]), ADDR)
+    meters._received(encode_meters(1, [7, 8, 9]), ADDR)
+    meters._received(encode_meters(rta.RTA_BANK, [1, 2]), ADDR)
+    assert len(stream.history) == 1
+    assert stream.dropped == 1
+    assert len(received) == 1
+    assert received[0].frame.tolist() == [1, 2, 3]
+    assert received[0].timestamp == 100.0
+
+    stream.set_source(3)
+    assert client.sent == [('/-stat/rta/source', ('i', 3))]
+
+    stream.stop()
+    assert meters.banks == set()
+    # the stream's handler was removed from the shared Meters instance
+    assert meters._handler_stack == []
+    meters._received(encode_meters(rta.RTA_BANK, [4, 5, 6]), ADDR)
+    assert len(stream.history) == 1
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# test_snapshot.py
+#
+"""Tests for snapshot files, state comparison and restoring a snapshot to a fake mixer."""
+
+import asyncio
+
+import pytest
+
+from xair.client import XAirClient
+from xair.fakemixer import FakeMixer
+from xair.osc import OSCError, OSCMessage
+from xair.snapshot import (MAGIC, diff_state, is_state_address, read_snapshot, restore_snapshot,
+                           write_snapshot)
+
+
+TIMEOUT = 0.2
+
+MESSAGES = [
+    OSCMessage('/ch/01/mix/fader', 'f', [0.75]),
+    OSCMessage('/ch/01/mix/on', 'i', [1]),
+    OSCMessage('/ch/01/config/name', 's', ['Vocals']),
+    OSCMessage('/lr/mix/pan', 'f', [0.5]),
+]
+
+
+def state_of(messages):
+    return {msg.path: list(zip(msg.types, msg.args)) for msg in messages}
+
+
+def run_with_mixer(test, **kwargs):
+    """Start a fake mixer on a free loopback port and run ``test(port, mixer)`` against it."""
+
+    async def main():
+        transport, mixer = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: FakeMixer(**kwargs), local_addr=('127.0.0.1', 0))
+
+        try:
+            return await test(transport.get_extra_info('sockname')[1], mixer)
+        finally:
+            transport.close()
+
+    return asyncio.run(main())
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'mixer.snp')
+    write_snapshot(filename, MESSAGES)
+
+    with open(filename, 'rb') as fp:
+        assert fp.read(8) == MAGIC + b'\x01'
+
+    assert read_snapshot(filename) == MESSAGES
+
+
+def test_empty_snapshot(tmp_path):
+    filename = str(tmp_path / 'empty.snp')
+    write_snapshot(filename, [])
+    assert read_snapshot(filename) == []
+
+
+@pytest.mark.parametrize('data', [b'', b'XAIRSNP', b'XAIRSNQ\x01', b'XAIRSNP\x02'])
+def test_read_invalid(tmp_path, data):
+    filename = tmp_path / 'invalid.snp'
+    filename.write_bytes(data)
+
+    with pytest.raises(OSCError):
+        read_snapshot(str(filename))
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('/ch/01/mix/fader', True),
+    ('/lr/mix/on', True),
+    ('/config/chlink/1-2', True),
+    ('/-prefs/lamp', False),
+    ('/-stat/solosw/01', False),
+    ('/-snap/load', False),
+    ('/xinfo', False),
+    ('/info', False),
+])
+def test_is_state_address(address, expected):
+    assert is_state_address(address) is expected
+
+
+def test_diff_state():
+    live = {msg.path: msg for msg in MESSAGES}
+    assert diff_state(MESSAGES, live) == []
+
+    live['/ch/01/mix/fader'] = OSCMessage('/ch/01/mix/fader', 'f', [0.5])
+    live['/ch/01/mix/on'] = OSCMessage('/ch/01/mix/on', 'f', [1.0])
+    live['/lr/mix/pan'] = None
+    del live['/ch/01/config/name']
+    assert diff_state(MESSAGES, live) == MESSAGES
+
+
+def test_restore_unchanged_sends_nothing():
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            result = await restore_snapshot(client, MESSAGES, TIMEOUT, probe_bundles=True)
+            return result, client.bundler.packets_sent, mixer.received
+
+    (changed, packets), packets_sent, received = run_with_mixer(test, state=state_of(MESSAGES))
+    assert (changed, packets, packets_sent) == ([], 0, 0)
+    # only the queries (and no bundle probe) reached the mixer
+    assert received == len(MESSAGES)
+
+
+@pytest.mark.parametrize('accept_bundles, expected_packets', [(True, 1), (False, 2)])
+def test_restore_sends_changed_values(accept_bundles, expected_packets):
+    state = state_of(MESSAGES)
+    state['/ch/01/mix/fader'] = [('f', 0.0)]
+    state['/ch/01/config/name'] = [('s', 'Guitar')]
+
+    async def test(port, mixer):
+        async with XAirClient('127.0.0.1', port, timeout=TIMEOUT) as client:
+            changed, packets = await restore_snapshot(client, MESSAGES, TIMEOUT,
+                                                      probe_bundles=True)
+            # wait for the values to arrive
+            await client.query('/ch/01/mix/fader')
+            return changed, packets, client.bundler.use_bundles
+
+    changed, packets, use_bundles = run_with_mixer(test, state=state,
+                                                   accept_bundles=accept_bundles)
+    assert [msg.path for msg in changed] == ['/ch/01/mix/fader', '/ch/01/config/name']
+    assert (packets, use_bundles) == (expected_packets, accept_bundles)
+    assert state == state_of(MESSAGES)
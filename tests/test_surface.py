@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# test_surface.py
+#
+"""Tests for the control surface configuration and daemon with simulated inputs."""
+
+import argparse
+import asyncio
+import logging
+import re
+import time
+
+import pytest
+
+from xair import surface
+from xair.fakemixer import FakeMixer
+from xair.rotary import quadrature_edges
+from xair.surface import EncoderControl, load_config, run_surface
+
+
+CONFIG = """\
+backend: sim
+encoders:
+  - name: Pan 1
+    pins: [P1, P2]
+    osc: /ch/01/mix/pan
+  - name: Pan 2
+    pins: [P3, P4]
+    osc: /ch/02/mix/pan
+buttons:
+  - name: Mute 1
+    pin: P5
+    osc: /ch/01/mix/on
+"""
+
+
+class RecordingMixer(FakeMixer):
+    """Fake mixer, which records all parameter changes it receives."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.changes = []
+
+    def handle_message(self, msg, addr):
+        if msg.args:
+            self.changes.append((msg.path, msg.args[0]))
+
+        super().handle_message(msg, addr)
+
+
+@pytest.mark.parametrize('spec, message', [
+    (dict(min=0.5, max=0.5), "'max' (0.5) must be greater than 'min' (0.5)"),
+    (dict(min=1.0, max=0.0), "must be greater than 'min'"),
+    (dict(step=0), "'step' must be greater than zero"),
+    (dict(scale='db', step=-0.5), "'step' must be greater than zero"),
+])
+def test_encoder_invalid_scale(spec, message):
+    with pytest.raises(ValueError, match="Encoder 'Pan': .*" + re.escape(message)):
+        EncoderControl(name='Pan', pins=[1, 2], osc='/ch/01/mix/pan', **spec)
+
+
+def test_load_config_invalid_scale(tmp_path):
+    filename = str(tmp_path / 'surface.yaml')
+
+    with open(filename, 'w') as fp:
+        fp.write("encoders:\n  - {pins: [1, 2], osc: /lr/mix/fader, step: 0}\n")
+
+    with pytest.raises(IOError, match="Encoder '/lr/mix/fader'"):
+        load_config(filename)
+
+
+def turn(backend, count):
+    for _, levels in quadrature_edges(count, levels=backend.levels):
+        backend.feed(levels)
+        time.sleep(0.001)
+
+
+def press(backend):
+    backend.feed(0)
+    time.sleep(0.02)
+    backend.feed(1)
+    time.sleep(0.02)
+
+
+def drive(control_surface, duration):
+    """Replacement for `simulate_input` with a fixed sequence of inputs."""
+    encoders = {ctrl.osc: encoder for encoder, ctrl in control_surface.encoders.items()}
+    button = next(iter(control_surface.buttons))
+    button.backend.levels = 1
+    # pan 1 down by 4 steps, pan 2 up, but it is at the maximum already
+    turn(encoders['/ch/01/mix/pan'].backend, 4)
+    turn(encoders['/ch/02/mix/pan'].backend, -8)
+    time.sleep(0.05)
+    press(button.backend)
+    press(button.backend)
+
+
+def test_run_surface_with_simulated_inputs(tmp_path, monkeypatch, caplog):
+    caplog.set_level(logging.INFO, 'xair-surface')
+    filename = str(tmp_path / 'surface.yaml')
+
+    with open(filename, 'w') as fp:
+        fp.write(CONFIG)
+
+    monkeypatch.setattr(surface, 'simulate_input', drive)
+    state = {'/ch/01/mix/pan': [('f', 0.5)], '/ch/02/mix/pan': [('f', 1.0)],
+             '/ch/01/mix/on': [('i', 1)]}
+
+    async def main():
+        transport, mixer = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: RecordingMixer(state=state), local_addr=('127.0.0.1', 0))
+        args = argparse.Namespace(server='127.0.0.1', oscport=transport.get_extra_info(
+            'sockname')[1], fake_mixer=False, no_bundles=False, rate=500.0, address_rate=50.0,
+            backend='sim', report_interval=0, simulate=1.0)
+
+        try:
+            assert await run_surface(load_config(filename), args) is None
+        finally:
+            transport.close()
+
+        return mixer
+
+    mixer = asyncio.run(main())
+    pans = [value for path, value in mixer.changes if path == '/ch/01/mix/pan']
+    # intermediate values may be coalesced by the output queue
+    assert pans and pans[-1] == pytest.approx(0.46)
+    assert pans == sorted(pans, reverse=True)
+    # encoder at its maximum and unchanged value are not sent
+    assert '/ch/02/mix/pan' not in dict(mixer.changes)
+    # toggle button, which was on according to the mixer
+    assert [value for path, value in mixer.changes if path == '/ch/01/mix/on'] == [0, 1]
+    assert mixer.state['/ch/01/mix/pan'][0][1] == pytest.approx(0.46)
+    # a latency is recorded for each message sent
+    sent = re.search(r"OSC messages sent: (\d+)", caplog.text).group(1)
+    assert int(sent) == len(mixer.changes)
+    assert "Input to packet latency: n=%s " % sent in caplog.text
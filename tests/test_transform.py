@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# test_transform.py
+#
+"""Tests for combining 14-bit and NRPN controller values."""
+
+from xair.transform import MSBLSBMerger, NRPNDecoder
+
+
+class FakeTimers:
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, func):
+        timer = FakeTimer(func)
+        self.timers.append(timer)
+        return timer
+
+    def fire(self):
+        for timer in self.timers:
+            if not timer.cancelled:
+                timer.func()
+
+
+class FakeTimer:
+    def __init__(self, func):
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def test_merger_msb_lsb():
+    values = []
+    merger = MSBLSBMerger(values.append, call_later=FakeTimers().call_later)
+    merger.msb_received(1)
+    merger.lsb_received(2)
+    merger.lsb_received(3)
+    assert values == [1 << 7 | 2, 1 << 7 | 3]
+
+
+def test_merger_timeout_sends_msb():
+    values = []
+    timers = FakeTimers()
+    merger = MSBLSBMerger(values.append, call_later=timers.call_later)
+    merger.msb_received(5)
+    timers.fire()
+    assert values == [5 << 7]
+
+
+def test_merger_discard():
+    values = []
+    timers = FakeTimers()
+    merger = MSBLSBMerger(values.append, call_later=timers.call_later)
+    assert not merger.discard()
+    merger.msb_received(5)
+    assert merger.discard()
+    timers.fire()
+    merger.lsb_received(1)
+    assert values == []
+
+
+def test_nrpn_decoder_discard():
+    values = []
+    timers = FakeTimers()
+    decoder = NRPNDecoder(lambda param, value: values.append((param, value)),
+                          call_later=timers.call_later)
+
+    for controller, value in ((99, 2), (98, 44), (6, 10), (38, 1), (6, 20)):
+        decoder.feed(controller, value)
+
+    assert decoder.discard()
+    timers.fire()
+    assert values == [(2 << 7 | 44, 10 << 7 | 1)]